@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Benchmark the time it takes to build (not compute) a master dataset with
+`create_master`, as a function of the number of cases in an ensemble.
+
+    $ python benchmarks/bench_master.py
+
+"""
+import time
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+from experiment import Experiment, Case
+from experiment.convert import create_master
+
+#: Number of values for each of the three case dimensions
+SIZES = [2, 4, 6, 8, 10, 15, 20]
+N_VARS = 3
+
+
+def make_ensemble(n):
+    cases = [Case("c{}".format(i), "Case {}".format(i), list(range(n)))
+             for i in range(3)]
+    exp = Experiment("bench", cases, data_dir="", validate_data=False)
+
+    x = np.arange(12.)
+    data = {}
+    for j, bits in enumerate(exp.all_cases()):
+        ds = xr.Dataset(coords={'x': x})
+        for i in range(N_VARS):
+            # Distinct values give every case its own dask keys, as if each
+            # was read from a different file
+            ds['v{}'.format(i)] = ('x', da.full(12, float(j*N_VARS + i),
+                                                chunks=6))
+        data[exp.case_tuple(*bits)] = ds
+    return exp, data
+
+
+if __name__ == "__main__":
+
+    print("{:>8s} {:>12s} {:>12s}".format("n_cases", "build [s]", "n_tasks"))
+    for n in SIZES:
+        exp, data = make_ensemble(n)
+
+        start = time.perf_counter()
+        master = create_master(exp, "v0", data, new_fields=[])
+        elapsed = time.perf_counter() - start
+
+        n_tasks = len(master['v0'].data.__dask_graph__())
+        print("{:8d} {:12.4f} {:12d}".format(n**3, elapsed, n_tasks))
@@ -0,0 +1,101 @@
+"""
+asyncio interface for loading data from an Experiment.
+
+These are the implementations behind :meth:`Experiment.aload` and
+:meth:`Experiment.awalk_files`, which hand off blocking file system access to
+an executor so they can be used from within a running event loop.
+
+"""
+import asyncio
+from functools import partial
+
+from . import logger
+from . parallel import get_executor
+
+#: Hack for Py2/3 basestring type compatibility
+if 'basestring' not in globals():
+    basestring = str
+
+
+async def aload(exp, var, fix_times=False, master=False, preprocess=None,
+                load_kws={}, max_concurrency=None, timeout=None,
+                executor=None, **case_kws):
+    """ Load a variable from every case of an Experiment without blocking
+    the event loop; see :meth:`Experiment.aload`. """
+    from . experiment import _load_case
+
+    loop = asyncio.get_running_loop()
+    # Loads which time out can't be interrupted, and keep running in the
+    # background after their slot is released; a pool created here is sized
+    # so that they still count towards `max_concurrency`
+    pool, owned = get_executor(executor, max_concurrency)
+
+    try:
+        if case_kws and not exp._is_single_case(case_kws):
+            # Partial or list selections load every case of the subset
+            exp, case_kws = exp.subset(**case_kws), {}
+
+        # Only module-level functions and their (picklable) arguments are
+        # sent to `pool`, which may hold other processes; the Experiment
+        # itself is only used from this process
+        field = var if isinstance(var, basestring) else var.varname
+        if case_kws:
+            # Load/return a single case, raising any errors
+            filename = await loop.run_in_executor(
+                None, partial(exp._case_files, field, **case_kws)
+            )
+            load = partial(_load_case, field, filename, case_kws, fix_times,
+                           preprocess, load_kws)
+            ds = await asyncio.wait_for(loop.run_in_executor(pool, load),
+                                        timeout)
+            if isinstance(ds, Exception):
+                raise ds
+            return ds
+
+        all_files = await loop.run_in_executor(
+            None, exp._walk_case_files, field
+        )
+
+        if max_concurrency is not None:
+            semaphore = asyncio.Semaphore(max_concurrency)
+        else:
+            semaphore = None
+
+        async def _load_one(case_kws, filename):
+            task = partial(_load_case, field, filename, case_kws, fix_times,
+                           preprocess, load_kws)
+            try:
+                if semaphore is None:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(pool, task), timeout
+                    )
+                async with semaphore:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(pool, task), timeout
+                    )
+            except asyncio.TimeoutError as e:
+                logger.warning("Timed out loading case %r" % case_kws)
+                return e
+
+        results = await asyncio.gather(*[
+            _load_one(case_kws, filename) for case_kws, filename in all_files
+        ])
+
+        # Building the master dataset can take a while, too; it's done on a
+        # thread in this process (not `pool`, which may hold other
+        # processes) so that the data is attached to `var` here
+        collect = partial(exp._collect_cases, var, field, all_files, results,
+                          master)
+        return await loop.run_in_executor(None, collect)
+    finally:
+        if owned:
+            pool.shutdown(wait=False)
+
+
+async def awalk_files(exp, field):
+    """ Walk through all the files in an Experiment without blocking the
+    event loop; see :meth:`Experiment.awalk_files`. """
+    loop = asyncio.get_running_loop()
+    all_files = await loop.run_in_executor(None, list, exp.walk_files(field))
+    for case_kws, path_to_file in all_files:
+        yield case_kws, path_to_file
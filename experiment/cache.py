@@ -0,0 +1,144 @@
+"""
+In-memory cache for data loaded from an Experiment.
+
+Interactive analyses often re-load the same variable with the same arguments
+many times. A :class:`LoadCache` attached to an Experiment (see
+:meth:`Experiment.enable_cache`) memoizes the results of
+:meth:`Experiment.load`, keyed on the arguments to the call and the
+modification times of the files it read, so that repeated loads return
+immediately. Entries are evicted in least-recently-used order once the cache
+exceeds its memory budget.
+
+"""
+from collections import OrderedDict
+
+from . import logger
+
+
+def _nbytes(data):
+    """ Estimate the size of a cached entry; for lazy (dask-backed) data,
+    this is the size it will have once loaded. """
+    if isinstance(data, dict):
+        return sum(_nbytes(v) for v in data.values())
+    return getattr(data, 'nbytes', 0)
+
+
+def _shallow_copy(data):
+    """ Copy a cached entry (a Dataset, or nested dictionary of them) without
+    copying the underlying arrays, so that the caller can't modify the
+    entry itself by e.g. adding variables or attributes. """
+    if isinstance(data, dict):
+        return type(data)((k, _shallow_copy(v)) for k, v in data.items())
+    copy = getattr(data, 'copy', None)
+    return data if copy is None else copy(deep=False)
+
+
+class LoadCache(object):
+    """ A least-recently-used cache of loaded datasets with a memory budget.
+
+    Each entry is stored along with the name of the field it holds, so that
+    all the entries for a given field can be invalidated at once.
+
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None):
+        """
+        Parameters
+        ----------
+        max_bytes : int (optional)
+            The memory budget for the cache, in bytes; the least-recently-used
+            entries are evicted until the cache fits within it
+        max_entries : int (optional)
+            The maximum number of entries to keep in the cache
+
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """ Return (a shallow copy of) a cached entry, marking it as
+        recently used. """
+        try:
+            field, data, nbytes = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return _shallow_copy(data)
+
+    def put(self, key, data, field=None):
+        """ Add an entry to the cache, evicting old entries if necessary. """
+        if key in self._entries:
+            self._remove(key)
+
+        nbytes = _nbytes(data)
+        if (self.max_bytes is not None) and (nbytes > self.max_bytes):
+            logger.debug("Not caching {} ({} bytes exceeds budget)".format(
+                field, nbytes
+            ))
+            return
+
+        self._entries[key] = (field, _shallow_copy(data), nbytes)
+        self.nbytes += nbytes
+        self._evict()
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def _evict(self):
+        while self._entries and (
+            ((self.max_bytes is not None) and (self.nbytes > self.max_bytes))
+            or ((self.max_entries is not None)
+                and (len(self._entries) > self.max_entries))
+        ):
+            key = next(iter(self._entries))
+            logger.debug("Evicting {} from cache".format(self._entries[key][0]))
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate(self, field=None):
+        """ Remove all the entries for a given field from the cache, or every
+        entry if no field is given.
+
+        Returns
+        -------
+        The number of entries removed
+
+        """
+        if field is None:
+            keys = list(self._entries)
+        else:
+            keys = [key for key, (entry_field, _, _) in self._entries.items()
+                    if entry_field == field]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        """ Remove every entry from the cache and reset its statistics. """
+        self.invalidate()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Return a dictionary of statistics about the use of this cache. """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, entries=len(self._entries),
+                    nbytes=self.nbytes)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return ("LoadCache({entries} entries, {nbytes} bytes, "
+                "{hits} hits, {misses} misses)".format(**self.stats()))
@@ -0,0 +1,154 @@
+"""
+Policies for chunking the data loaded from an Experiment.
+
+By default, each case's file is read as a single block and the master
+dataset gets one block per case, so the chunking of an ensemble is dictated by
+the sizes of its files and the number of its cases; large files produce
+giant chunks, while large ensembles of small files produce millions of tiny
+ones. A :class:`ChunkPolicy` instead picks the chunk sizes for each file and
+for the case dimensions of a master dataset from a target size in bytes, so
+that downstream computations operate on reasonably-sized blocks.
+
+"""
+import numpy as np
+
+#: Hack for Py2/3 basestring type compatibility
+if 'basestring' not in globals():
+    basestring = str
+
+#: Default target size for each chunk
+DEFAULT_TARGET_BYTES = 128*2**20
+
+
+def _parse_bytes(nbytes):
+    if isinstance(nbytes, basestring):
+        from dask.utils import parse_bytes
+        return parse_bytes(nbytes)
+    return int(nbytes)
+
+
+class ChunkPolicy(object):
+    """ Choose chunk sizes for an Experiment's data from a target number of
+    bytes per chunk.
+
+    Each file is split along its leading (slowest-varying) dimensions first,
+    so that every chunk is read from a contiguous region on disk, and chunk
+    sizes are rounded to a multiple of the file's own chunking when it has
+    one. Whatever room is left in the target is then filled by grouping
+    neighbouring cases together along the case dimensions of a master
+    dataset, starting with the last (fastest-varying) case.
+
+    """
+
+    def __init__(self, target_bytes=DEFAULT_TARGET_BYTES, fixed=None,
+                 group_cases=True):
+        """
+        Parameters
+        ----------
+        target_bytes : int or str
+            The target size of each chunk, either in bytes or as a string
+            such as "64MB"
+        fixed : dict (optional)
+            Mapping of dimension names to chunk sizes which should be used
+            regardless of the target, with -1 meaning the whole dimension
+        group_cases : bool
+            Group multiple cases into each block of a master dataset when
+            their data is smaller than the target
+
+        """
+        self.target_bytes = _parse_bytes(target_bytes)
+        self.fixed = {} if fixed is None else dict(fixed)
+        self.group_cases = group_cases
+
+    def file_chunks(self, dims, shape, dtype, disk_chunks=None):
+        """ Choose the chunks for a variable read from a single file.
+
+        Parameters
+        ----------
+        dims : tuple of str
+            The names of the variable's dimensions
+        shape : tuple of int
+            The shape of the variable
+        dtype : numpy.dtype
+            The data type of the variable
+        disk_chunks : tuple of int (optional)
+            The chunking of the variable in the file, if any
+
+        Returns
+        -------
+        A dictionary mapping each dimension to its chunk size
+
+        """
+        itemsize = np.dtype(dtype).itemsize
+        chunks = {}
+
+        # Budget left for each successive dimension, after accounting for
+        # those fixed by the user
+        free_size = 1
+        for dim, size in zip(dims, shape):
+            if dim in self.fixed:
+                fixed = self.fixed[dim]
+                chunks[dim] = size if fixed in (-1, None) else min(fixed, size)
+            else:
+                free_size *= size
+        budget = max(1, self.target_bytes // itemsize)
+        for dim in dims:
+            if dim in chunks:
+                budget = max(1, budget // chunks[dim])
+
+        for i, (dim, size) in enumerate(zip(dims, shape)):
+            if dim in chunks:
+                continue
+            # Number of elements in one step along this dimension
+            free_size //= max(size, 1)
+            if free_size*size <= budget:
+                chunks[dim] = size
+                budget //= max(size, 1)
+                continue
+
+            chunk = int(max(1, min(size, budget // max(free_size, 1))))
+            if disk_chunks is not None and disk_chunks[i] < size:
+                step = disk_chunks[i]
+                chunk = max(step, (chunk // step)*step)
+            chunks[dim] = chunk
+            budget = max(1, budget // chunk)
+
+        return chunks
+
+    def variable_chunks(self, meta, var_name):
+        """ Choose the chunks for a variable from the :class:`FileMetadata`
+        of a file containing it. """
+        v = meta.variables[var_name]
+        return self.file_chunks(v['dims'], v['shape'], v['dtype'],
+                                v['encoding'].get('chunksizes'))
+
+    def case_chunks(self, case_shape, block_bytes):
+        """ Choose how many cases to group into each block along the case
+        dimensions of a master dataset.
+
+        Parameters
+        ----------
+        case_shape : tuple of int
+            The number of values of each case dimension
+        block_bytes : int
+            The size of the largest block of the data for a single case
+
+        Returns
+        -------
+        A tuple with the chunk size for each case dimension
+
+        """
+        if not self.group_cases:
+            return (1, )*len(case_shape)
+
+        n_group = max(1, self.target_bytes // max(block_bytes, 1))
+        chunks = []
+        for size in reversed(case_shape):
+            chunk = int(min(size, n_group))
+            chunks.append(chunk)
+            n_group = max(1, n_group // chunk)
+        return tuple(reversed(chunks))
+
+    def __repr__(self):
+        return "ChunkPolicy(target_bytes={}, fixed={!r}, group_cases={})" \
+               .format(self.target_bytes, self.fixed, self.group_cases)
@@ -1,8 +1,11 @@
-from itertools import product
+from collections import OrderedDict
+from copy import copy
 import warnings
 
-from numpy import empty, nditer
-from xarray import DataArray, Dataset
+from numpy import (arange, array, cumsum, expand_dims, float32, ix_, nan,
+                   ndindex, result_type, stack)
+from pandas import MultiIndex
+from xarray import Coordinates, DataArray, Dataset
 
 from . import logger
 
@@ -11,7 +14,15 @@ if 'basestring' not in globals():
     basestring = str
 
 
-def create_master(exp, var, data=None, new_fields=[]):
+#: Name of the dimension enumerating the members of a ragged ensemble
+MEMBER_DIM = 'member'
+
+#: Policies for handling cases missing from a master dataset
+MISSING_POLICIES = ['fill', 'drop', 'raise']
+
+
+def create_master(exp, var, data=None, new_fields=[], chunks=None,
+                  missing='fill'):
     """ Save a dictionary which holds variable data for all
     activation and aerosol case combinations to a dataset
     with those cases as auxiliary indices.
@@ -29,6 +40,19 @@ def create_master(exp, var, data=None, new_fields=[]):
     new_fields : list of strs (optional)
         A list of the keys in each DataSet to include in the
         final multi-keyed master
+    chunks : ChunkPolicy (optional)
+        A policy for choosing the chunks of the data for each case and how
+        many cases to group into each block of the master; by default, the
+        chunking of each case's data is used as-is, with one block per case
+    missing : str
+        How to handle cases which are missing a variable (including those
+        replaced by a scalar NaN placeholder because they failed to load):
+
+        - "fill": fill them with NaN, using lazy dask arrays which take up
+          no memory until they're computed
+        - "drop": remove any case values for which every case is missing,
+          and fill the rest
+        - "raise": raise a ValueError
 
     Returns:
     --------
@@ -60,9 +84,13 @@ def create_master(exp, var, data=None, new_fields=[]):
         if isinstance(case_vals, str):
             all_case_vals[i] = list(case_vals)
 
+    if missing not in MISSING_POLICIES:
+        raise ValueError("Unknown missing policy '{}'; expected one of {}"
+                         .format(missing, MISSING_POLICIES))
+
     # 2) Make sure they're all still in the data dictionary. This is
     #    circular but a necessary sanity check
-    for case_bits in product(*all_case_vals):
+    for case_bits in exp.all_cases():
         assert case_bits in data_dict
 
     # Discover the type of the data passed into this method. If
@@ -72,108 +100,326 @@ def create_master(exp, var, data=None, new_fields=[]):
 
     proto = data_dict[first_case]
     if isinstance(proto, Dataset):
-        return _master_dataset(exp, data_dict, new_fields)
+        return _master_dataset(exp, data_dict, new_fields, chunks, missing)
     elif isinstance(proto, DataArray):
-        return _master_dataarray(exp, data_dict)
+        return _master_dataarray(exp, data_dict, chunks=chunks,
+                                 missing=missing)
     # elif isinstance(proto, Cube):
     #     raise NotImplementedError("Cube handling not yet implemented")
     else:
         raise ValueError("Data must be an xarray type")
 
 
-def _master_dataarray(exp, data_dict):
-    case_list = [exp._case_data[case] for case in exp.cases]
-    stacked_data = _stack_dims(data_dict, case_list, {}, exp)
-
-    test_case = next(exp.all_cases())
-    test_da = data_dict[test_case]
-    name = test_da.name
-
-    new_coords = test_da.to_dataset().coords
-    logger.debug("Creating master dataarray")
-    for case in exp.cases:
-        logger.debug("   " + case)
-        new_coords[case] = exp._case_data[case].vals
-
-    new_dims = list(exp.cases) + list(test_da.dims)
-
-    new_da = DataArray(stacked_data, coords=new_coords,
-                       dims=new_dims)
-    new_da = copy_attrs(test_da, new_da)
-    new_da.name = name
+class CaseLayout(object):
+    """ The arrangement of an Experiment's cases onto the extra dimensions of
+    a master dataset.
 
-    return new_da
+    The layout is computed once from the Experiment, and can then be used to
+    stack the data for any number of variables.
 
+    Usually each case gets its own dimension. For a ragged experiment, which
+    doesn't include every combination of its case values, the cases which
+    were run are instead stacked along a single "member" dimension indexed
+    by a MultiIndex of the case values, so the master only holds the data
+    which exists.
 
-def _stack_dims(data, cases, set_cases, exp):
-    """Recursive function to stack multi-dimensional data
     """
-    from dask.array import stack as dstack
-    from numpy import stack as nstack
-    # print(set_cases)
-    idx = len(set_cases)
-    if idx >= len(cases):
-        # print("   leaf")
-        tup = exp.case_tuple(**set_cases)
-        # print(tup)
-        return data[tup].data
-    else:
-        new_set_cases = set_cases.copy()
-        case = cases[idx]
-
-        to_stack = []
-        for val in case.vals:
-            new_set_cases[case.shortname] = val
-            x = _stack_dims(data, cases, new_set_cases, exp)
-            to_stack.append(x)
-
-        return dstack(to_stack)
 
-def _master_dataset(exp, data_dict, new_fields):
+    def __init__(self, exp):
+        #: Case keys, in the same (row-major) order as the stacked data
+        self.keys = [exp.case_tuple(*bits) for bits in exp.all_cases()]
+        self.case_names = list(exp.cases)
+        self.longnames = [longname for _, longname, _ in exp.itercases()]
+        self.ragged = exp.ragged
 
-    all_case_vals = exp.all_case_vals()
-    first_case = next(exp.all_cases())
-    proto = data_dict[first_case]
-
-    n_case_vals = [len(case_vals) for case_vals in all_case_vals]
-    n_cases = len(n_case_vals)
-
-    # Create the new Dataset to populate
-    ds_new = Dataset()
+        if self.ragged:
+            self.dims = [MEMBER_DIM, ]
+            self.coords = [(MEMBER_DIM, list(self.keys), "ensemble member")]
+        else:
+            self.dims = list(exp.cases)
+            self.coords = [(case, vals, longname)
+                           for case, longname, vals in exp.itercases()]
+        self.shape = tuple(len(vals) for _, vals, _ in self.coords)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def subset(self, keep):
+        """ Return a new layout with only some of the values of each case.
+
+        Parameters
+        ----------
+        keep : list of arrays of bool
+            For each case dimension, whether to keep each of its values
+
+        """
+        new = copy(self)
+        new.coords = [
+            (case, [val for val, k in zip(vals, mask) if k], longname)
+            for (case, vals, longname), mask in zip(self.coords, keep)
+        ]
+        new.shape = tuple(len(vals) for _, vals, _ in new.coords)
+        index = arange(len(self)).reshape(self.shape)[ix_(*keep)]
+        new.keys = [self.keys[i] for i in index.ravel()]
+        return new
+
+    def case_coords(self):
+        """ Return the coordinates for the case dimensions of a master
+        dataset, each labelled with the long name of its case. """
+        if self.ragged:
+            midx = MultiIndex.from_tuples(self.keys, names=self.case_names)
+            coords = Coordinates.from_pandas_multiindex(midx, MEMBER_DIM)
+        else:
+            coords = Coordinates({case: (case, vals)
+                                  for case, vals, _ in self.coords})
+        for case, longname in zip(self.case_names, self.longnames):
+            coords[case].attrs['long_name'] = longname
+        return coords
+
+    def missing_mask(self, missing_keys):
+        """ Return a boolean array over the case dimensions marking which
+        of the cases are in `missing_keys`. """
+        missing_keys = set(missing_keys)
+        return array([key in missing_keys for key in self.keys],
+                     dtype=bool).reshape(self.shape)
+
+    def drop_missing(self, missing_keys):
+        """ Return a new layout without any case values for which every case
+        is in `missing_keys`. """
+        mask = self.missing_mask(missing_keys)
+        keep = []
+        for axis in range(mask.ndim):
+            others = tuple(i for i in range(mask.ndim) if i != axis)
+            keep.append(~mask.all(axis=others))
+        return self.subset(keep)
+
+    def stack(self, arrays, case_chunks=None):
+        """ Stack a list of arrays (one per case, in the order of `keys`)
+        onto the case dimensions.
+
+        Rather than nesting a `stack` operation for each case dimension, this
+        builds the dask graph for the master array directly, with each of its
+        blocks simply pointing at the corresponding blocks of the case
+        arrays, so the size of the graph is linear in the number of cases.
+
+        Parameters
+        ----------
+        arrays : list of arrays
+            The data for each case, all with the same shape
+        case_chunks : tuple of int (optional)
+            The number of cases to group into each block along each of the
+            case dimensions; by default, each case is its own block
+
+        """
+        import dask.array as da
+        from dask.array.core import normalize_chunks
+        from dask.base import tokenize
+        from dask.highlevelgraph import HighLevelGraph
+
+        if len(arrays) != len(self):
+            raise ValueError("Expected {} arrays to stack, got {}"
+                             .format(len(self), len(arrays)))
+        if case_chunks is None:
+            case_chunks = (1, )*len(self.shape)
+
+        arrays = [da.asarray(arr) for arr in arrays]
+        proto = arrays[0]
+        for i, arr in enumerate(arrays):
+            if arr.shape != proto.shape:
+                raise ValueError("Couldn't stack case {} with shape {}; "
+                                 "expected {}".format(self.keys[i], arr.shape,
+                                                      proto.shape))
+            if arr.chunks != proto.chunks:
+                arrays[i] = arr.rechunk(proto.chunks)
+
+        name = "master-" + tokenize(*([arr.name for arr in arrays]
+                                      + [case_chunks, self.shape,
+                                         tuple(self.dims)]))
+        case_axes = tuple(range(len(self.shape)))
+        block_ids = list(ndindex(*proto.numblocks))
+        case_blocks = normalize_chunks(case_chunks, self.shape)
+
+        # Positions of the cases (in the order of `keys`) on the case dims
+        case_index = arange(len(self)).reshape(self.shape)
+        bounds = [cumsum((0, ) + blocks) for blocks in case_blocks]
+
+        layer = {}
+        for case_block in ndindex(*[len(b) for b in case_blocks]):
+            slices = tuple(slice(b[i], b[i+1])
+                           for b, i in zip(bounds, case_block))
+            group = case_index[slices]
+            group_names = [arrays[i].name for i in group.ravel()]
+            for block_id in block_ids:
+                if group.size == 1:
+                    task = (expand_dims, (group_names[0], ) + block_id,
+                            case_axes)
+                else:
+                    task = (_stack_cases,
+                            [(n, ) + block_id for n in group_names],
+                            group.shape)
+                layer[(name, ) + case_block + block_id] = task
+
+        graph = HighLevelGraph.from_collections(name, layer,
+                                                dependencies=arrays)
+        chunks = case_blocks + proto.chunks
+        return da.Array(graph, name, chunks, meta=proto._meta)
+
+    def to_dataarray(self, arrays, proto, chunks=None):
+        """ Stack the data from a list of DataArrays (one per case) into a
+        new DataArray with the case dimensions prepended, using `proto` for
+        the coordinates and metadata. If a :class:`ChunkPolicy` is passed as
+        `chunks`, it's used to chunk the data for each case and group cases
+        together. """
+        case_chunks = None
+        if chunks is not None:
+            import dask.array as da
+
+            file_chunks = chunks.file_chunks(
+                proto.dims, proto.shape, proto.dtype,
+                proto.encoding.get('chunksizes')
+            )
+            file_chunks = tuple(file_chunks[dim] for dim in proto.dims)
+            arrays = [da.asarray(arr).rechunk(file_chunks) for arr in arrays]
+
+            block_bytes = proto.dtype.itemsize
+            for dim_chunks in arrays[0].chunks:
+                block_bytes *= max(dim_chunks) if dim_chunks else 0
+            case_chunks = chunks.case_chunks(self.shape, block_bytes)
+
+        stacked_data = self.stack(arrays, case_chunks)
+
+        new_dims = self.dims + list(proto.dims)
+        new_da = DataArray(stacked_data, coords=proto.to_dataset().coords,
+                           dims=new_dims)
+        new_da = new_da.assign_coords(self.case_coords())
+        new_da = copy_attrs(proto, new_da)
+        new_da.name = proto.name
+
+        return new_da
+
+
+def _stack_cases(blocks, case_shape):
+    """ Stack the blocks for a group of cases onto the case dimensions. """
+    stacked = stack(blocks)
+    return stacked.reshape(tuple(case_shape) + stacked.shape[1:])
+
+
+def _find_reference(data_dict, keys):
+    """ Pick the case to use as the reference for the structure of a
+    variable: the first one which has any dimensions, or else the first one
+    that's present at all. Returns None if it's missing from every case. """
+    present = [key for key in keys if data_dict.get(key) is not None]
+    for key in present:
+        if data_dict[key].ndim > 0:
+            return key
+    return present[0] if present else None
+
+
+def _missing_keys(data_dict, keys, ref_da):
+    """ Find the cases where a variable is missing, or has been replaced by
+    a scalar placeholder because the case failed to load. """
+    return [key for key in keys
+            if (data_dict.get(key) is None)
+            or ((data_dict[key].ndim == 0) and (ref_da.ndim > 0))]
+
+
+def _fill_missing(ref_da):
+    """ Create a lazy, all-NaN array in place of a missing case. """
+    import dask.array as da
+
+    dtype = result_type(ref_da.dtype, float32)
+    chunks = ref_da.chunks if ref_da.chunks is not None else ref_da.shape
+    return da.full(ref_da.shape, nan, dtype=dtype, chunks=chunks)
+
+
+def _master_dataarray(exp, data_dict, layout=None, chunks=None,
+                      missing='fill', missing_keys=None):
+    if layout is None:
+        layout = CaseLayout(exp)
 
-    # Add the case coordinates
-    for case, longname, vals in exp.itercases():
-        ds_new[case] = vals
-        ds_new[case].attrs['long_name'] = longname
+    logger.debug("Creating master dataarray")
+    ref_key = _find_reference(data_dict, layout.keys)
+    if ref_key is None:
+        raise ValueError("Variable is missing from every case")
+    ref_da = data_dict[ref_key]
+
+    if missing_keys is None:
+        missing_keys = _missing_keys(data_dict, layout.keys, ref_da)
+        if missing_keys and (missing == 'drop'):
+            layout = layout.drop_missing(missing_keys)
+    if missing_keys and (missing == 'raise'):
+        raise ValueError("{} cases are missing {}, including {}".format(
+            len(missing_keys), ref_da.name, missing_keys[0]
+        ))
+
+    missing_keys = set(missing_keys)
+    arrays = []
+    for key in layout.keys:
+        if key in missing_keys:
+            arrays.append(_fill_missing(ref_da))
+        else:
+            arrays.append(data_dict[key].data)
+    if missing_keys:
+        dtype = result_type(ref_da.dtype, float32)
+        arrays = [arr if arr.dtype == dtype else arr.astype(dtype)
+                  for arr in arrays]
+
+    return layout.to_dataarray(arrays, ref_da, chunks)
+
+
+def _master_dataset(exp, data_dict, new_fields, chunks=None,
+                    missing='fill'):
+
+    layout = CaseLayout(exp)
+    if len(data_dict) <= 1:
+        raise ValueError("Couldn't coerce data for master array "
+                         "concatenation.")
+
+    # Use the first case which actually has data as the prototype
+    proto = None
+    for key in layout.keys:
+        ds = data_dict[key]
+        if (proto is None) or (ds.dims and not proto.dims):
+            proto = ds
+        if proto.dims:
+            break
+
+    # Include the variables from every case, in case some are missing them
+    data_vars = list(proto.data_vars)
+    for key in layout.keys:
+        for var in data_dict[key].data_vars:
+            if (var not in data_vars) and data_dict[key][var].ndim:
+                data_vars.append(var)
+    data_dict_as_da = {}
+    missing_keys = {}
+    for var in data_vars:
+        data_dict_as_da[var] = {key: ds[var] for key, ds in data_dict.items()
+                                if var in ds}
+        ref_key = _find_reference(data_dict_as_da[var], layout.keys)
+        missing_keys[var] = _missing_keys(data_dict_as_da[var], layout.keys,
+                                          data_dict_as_da[var][ref_key])
+
+    # Only drop the cases which are missing every variable, so that all the
+    # variables share the same case coordinates
+    if missing == 'drop':
+        all_missing = set(layout.keys)
+        for keys in missing_keys.values():
+            all_missing.intersection_update(keys)
+        if all_missing:
+            layout = layout.drop_missing(all_missing)
 
     logger.debug("Creating master dataset")
-    for var in proto.data_vars:
+    kept = set(layout.keys)
+    new_das = OrderedDict()
+    for var in data_vars:
         logger.debug("   "+var)
+        new_das[var] = _master_dataarray(
+            exp, data_dict_as_da[var], layout, chunks, missing,
+            [key for key in missing_keys[var] if key in kept]
+        )
 
-        # Ensure that all the data has the same dimensions
-        bad_keys = []
-        data_dict_as_da = {}
-        for key, ds in data_dict.items():
-            try:
-                data_dict_as_da[key] = ds[var]
-            except KeyError:
-                bad_keys.append(key)
-                continue
-        if len(data_dict) <= 1:
-            raise ValueError("Couldn't coerce data for master array "
-                             "concatenation.")
-        else:
-            ref_da = next(iter(data_dict_as_da.values()))
-            for key in bad_keys:
-                faux_da = DataArray(empty(ref_da.shape),
-                                    dims=ref_da.coords)
-                #for case, val in key.items():
-                #    faux_da[case] = val
-                data_dict_as_da[key] = faux_da
-        # data_dict_as_da = exp.apply_to_all(data_dict, lambda x: x[var])
-        new_da = _master_dataarray(exp, data_dict_as_da)
-        ds_new[var] = new_da
-
+    # Create the new Dataset all at once, with the case coordinates
+    ds_new = Dataset(new_das, coords=layout.case_coords())
     ds_new = copy_attrs(proto, ds_new)
     return ds_new
 
@@ -0,0 +1,286 @@
+"""
+Evaluate derived variables from the fields in an Experiment's archive.
+
+A :class:`Var` can define a new variable in terms of other output fields,
+with an NCO-style ``ncap_str`` (such as ``"PRECT=PRECC+PRECL"``) and a
+`scale_factor`. Rather than running `ncap2` over every file, the expression
+is parsed here into a small, safe arithmetic evaluator which operates on the
+lazy master datasets for each of the fields it references, so that the
+derived variable is computed for every case at once in a single dask graph.
+
+Only arithmetic operators, numeric constants, and a handful of element-wise
+functions are supported; anything else in an expression raises a
+ValueError.
+
+"""
+import ast
+import re
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from . import logger
+from . var import Var, VarList
+
+#: Element-wise functions which can be used in expressions
+FUNCTIONS = {
+    'abs': np.abs, 'fabs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp,
+    'log': np.log, 'ln': np.log, 'log10': np.log10,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+    'pow': np.power, 'min': np.minimum, 'max': np.maximum,
+}
+
+_BINOPS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+    ast.Div: np.true_divide, ast.Pow: np.power, ast.Mod: np.mod,
+}
+_UNARYOPS = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+def parse_ncap(ncap_str):
+    """ Parse a (simple) `ncap2` script into a list of assignments.
+
+    Statements are separated by semicolons or newlines, and each must
+    assign an arithmetic expression to a variable name, e.g.
+    ``"TS_C = TS - 273.15; TS_F = TS_C*9/5 + 32"``. Comments starting with
+    "//" or "#" are ignored.
+
+    Returns
+    -------
+    A list of (name, expression) tuples, where each expression is a parsed
+    :mod:`ast` node
+
+    """
+    statements = []
+    for line in ncap_str.splitlines():
+        line = re.split(r'//|#', line, maxsplit=1)[0]
+        for stmt in line.split(';'):
+            stmt = stmt.strip()
+            if stmt:
+                statements.append(_parse_statement(stmt))
+
+    if not statements:
+        raise ValueError("No assignments in ncap_str {!r}".format(ncap_str))
+    return statements
+
+
+def _parse_statement(line):
+    """ Parse a single ncap2 assignment into a (name, expression) tuple. """
+    # ncap2 uses "^" for exponentiation
+    line = line.replace('^', '**')
+    try:
+        tree = ast.parse(line, mode='exec')
+    except SyntaxError as e:
+        raise ValueError("Couldn't parse '{}': {}".format(line, e))
+
+    stmt = tree.body[0] if len(tree.body) == 1 else None
+    if not (isinstance(stmt, ast.Assign) and (len(stmt.targets) == 1)
+            and isinstance(stmt.targets[0], ast.Name)):
+        raise ValueError("Expected an assignment to a single variable, "
+                         "got '{}'".format(line))
+    _check_expression(stmt.value)
+    return stmt.targets[0].id, stmt.value
+
+
+def _check_expression(node):
+    """ Make sure that an expression only uses supported constructs. """
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINOPS:
+            raise ValueError("Unsupported operator " + type(node.op).__name__)
+        _check_expression(node.left)
+        _check_expression(node.right)
+    elif isinstance(node, ast.UnaryOp):
+        if type(node.op) not in _UNARYOPS:
+            raise ValueError("Unsupported operator " + type(node.op).__name__)
+        _check_expression(node.operand)
+    elif isinstance(node, ast.Call):
+        if not (isinstance(node.func, ast.Name)
+                and (node.func.id in FUNCTIONS)) or node.keywords:
+            raise ValueError("Unsupported function call in expression")
+        for arg in node.args:
+            _check_expression(arg)
+    elif isinstance(node, ast.Constant):
+        value = node.value
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError("Unsupported constant {!r}".format(value))
+    elif not isinstance(node, ast.Name):
+        raise ValueError("Unsupported expression " + type(node).__name__)
+
+
+def _names(node):
+    """ Return the variable names referenced in an expression, in order. """
+    if isinstance(node, ast.Name):
+        return [node.id, ]
+    elif isinstance(node, ast.BinOp):
+        return _names(node.left) + _names(node.right)
+    elif isinstance(node, ast.UnaryOp):
+        return _names(node.operand)
+    elif isinstance(node, ast.Call):
+        return [name for arg in node.args for name in _names(arg)]
+    return []
+
+
+def var_statements(var):
+    """ Return the assignments defining a Var. Without an `ncap_str`, the
+    Var is simply a (possibly renamed) copy of its single `oldvar`. """
+    if var.ncap_str:
+        return parse_ncap(var.ncap_str)
+
+    oldvar = var.oldvar
+    if not isinstance(oldvar, str):
+        if len(oldvar) != 1:
+            raise ValueError("Var {} has several fields ({}) but no "
+                             "expression combining them"
+                             .format(var.varname, oldvar))
+        oldvar = oldvar[0]
+    return [(var.varname, ast.Name(id=oldvar, ctx=ast.Load())), ]
+
+
+def required_fields(statements):
+    """ Return the names of the fields which must be loaded to evaluate a
+    list of assignments; that is, those which are referenced before (or
+    without) being assigned. """
+    assigned, fields = set(), []
+    for name, expr in statements:
+        for ref in _names(expr):
+            if (ref not in assigned) and (ref not in fields):
+                fields.append(ref)
+        assigned.add(name)
+    return fields
+
+
+class Evaluator(object):
+    """ Evaluates the expressions defining derived variables on lazy master
+    datasets.
+
+    Every field is loaded at most once, and every distinct sub-expression is
+    evaluated at most once, so intermediate results shared between several
+    Vars are only computed once.
+
+    """
+
+    def __init__(self, load_field):
+        """
+        Parameters
+        ----------
+        load_field : function
+            Function which accepts the name of a field and returns its
+            master DataArray
+
+        """
+        self.load_field = load_field
+        self.fields = OrderedDict()
+        self._memo = {}
+
+    def field(self, name):
+        if name not in self.fields:
+            logger.debug("Loading {} for derived variables".format(name))
+            self.fields[name] = self.load_field(name)
+        return self.fields[name]
+
+    def evaluate(self, statements, target=None):
+        """ Evaluate a list of assignments, returning the value assigned to
+        `target` (or by the last assignment, if it isn't given). """
+        if not statements:
+            raise ValueError("No assignments to evaluate")
+        env = {}
+        for name, expr in statements:
+            env[name] = self._eval(expr, env)
+        if target is None:
+            target = statements[-1][0]
+        elif target not in env:
+            raise ValueError("Nothing is assigned to {} (only {})"
+                             .format(target, sorted(env)))
+        return env[target][1]
+
+    def _eval(self, node, env):
+        """ Evaluate an expression, returning a tuple of a canonical key
+        identifying it and its value. """
+        if isinstance(node, ast.Name):
+            if node.id in env:
+                return env[node.id]
+            return ('field', node.id), self.field(node.id)
+        elif isinstance(node, ast.Constant):
+            # Include the type, so that e.g. 2 and 2.0 aren't confused
+            value = node.value
+            return ('const', type(value), value), value
+
+        if isinstance(node, ast.BinOp):
+            func = _BINOPS[type(node.op)]
+            args = [self._eval(node.left, env), self._eval(node.right, env)]
+        elif isinstance(node, ast.UnaryOp):
+            func = _UNARYOPS[type(node.op)]
+            args = [self._eval(node.operand, env), ]
+        else:
+            func = FUNCTIONS[node.func.id]
+            args = [self._eval(arg, env) for arg in node.args]
+
+        key = (func.__name__, ) + tuple(arg_key for arg_key, _ in args)
+        if key not in self._memo:
+            self._memo[key] = func(*[value for _, value in args])
+        return key, self._memo[key]
+
+
+def derive(exp, var, fix_times=False, load_kws={}, chunks=None,
+           evaluator=None):
+    """ Compute one or more derived variables for every case in an
+    Experiment, lazily.
+
+    Parameters
+    ----------
+    exp : Experiment
+        The Experiment to load fields from
+    var : Var or VarList
+        The variable(s) to derive
+    fix_times, load_kws, chunks :
+        Passed to `Experiment.open_master` when loading each field
+    evaluator : Evaluator (optional)
+        An existing Evaluator to re-use fields and intermediate results from
+
+    Returns
+    -------
+    A master Dataset with the derived variable(s), each of which is also
+    attached to its Var as `Var.master`.
+
+    """
+    if isinstance(var, Var):
+        var_list = [var, ]
+    elif isinstance(var, (VarList, list, tuple)):
+        var_list = list(var)
+    else:
+        raise ValueError("Expected a Var or VarList, got %r" % var)
+
+    if evaluator is None:
+        def load_field(field):
+            ds = exp.open_master(field, chunks=chunks, fix_times=fix_times,
+                                 load_kws=load_kws)
+            return ds[field]
+        evaluator = Evaluator(load_field)
+
+    derived = OrderedDict()
+    for v in var_list:
+        statements = var_statements(v)
+        logger.debug("{} - deriving {} from {}".format(
+            exp.name, v.varname, required_fields(statements)
+        ))
+        da = evaluator.evaluate(statements, v.varname)
+        if not isinstance(da, xr.DataArray):
+            raise ValueError("Var {} doesn't depend on any fields"
+                             .format(v.varname))
+        if v.scale_factor != 1.:
+            da = da*v.scale_factor
+
+        # Arithmetic drops the attributes of the fields, but a plain copy of
+        # a field keeps any which the Var doesn't override
+        attrs = dict(da.attrs)
+        attrs.update({attr: val for attr, val in v.attributes.items()
+                      if attr != 'scale_factor'})
+        if not v.units:
+            attrs['units'] = da.attrs.get('units', "1")
+        da = xr.DataArray(da.data, coords=da.coords, dims=da.dims,
+                          name=v.varname, attrs=attrs)
+        v.master = da.to_dataset()
+        derived[v.varname] = da
+
+    return xr.Dataset(derived)
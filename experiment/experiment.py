@@ -38,6 +38,8 @@ import os
 import warnings
 
 from collections import OrderedDict, namedtuple
+from copy import copy
+from functools import partial
 from itertools import product
 
 import numpy as np
@@ -47,8 +49,17 @@ import yaml
 from tqdm import tqdm
 
 from . import logger
-from . io import load_variable
-from . convert import create_master
+from . io import load_variable, load_timeslice, open_lazy
+from . chunking import ChunkPolicy
+from . convert import MEMBER_DIM, CaseLayout, copy_attrs, create_master
+from . derive import derive
+from . metadata import default_cache, get_metadata
+from . cache import LoadCache
+from . index import FileIndex, index_path
+from . parallel import map_ordered
+from . reduce import (MOMENT_STATS, Histogram, Moments, groups_to_dataset,
+                      merge_groups)
+from . templates import CaseBatch, PathTemplate
 
 # logger = logging.getLogger(__name__)
 
@@ -58,6 +69,9 @@ Case = namedtuple('case', ['shortname', 'longname', 'vals'])
 if 'basestring' not in globals():
     basestring = str
 
+#: Types of case keywords interpreted as a selection of several values
+_SELECTION_TYPES = (list, tuple, set)
+
 class Experiment(object):
     """ Experiment ...
 
@@ -92,7 +106,10 @@ class Experiment(object):
                  case_path=None,
                  output_prefix="",
                  output_suffix=".nc",
-                 validate_data=True):
+                 validate_data=True,
+                 file_index=None,
+                 members=None,
+                 exclude=None):
 
         """
         Parameters
@@ -124,6 +141,21 @@ class Experiment(object):
         validate_data : bool, optional (default True)
             Validate that the specified case structure is reflected in the
             directory structure passed via `data_dir`
+        file_index : FileIndex or str (optional)
+            An index of the files in the archive (or the path to one saved on
+            disk), which will be used instead of the file system to look up
+            files and validate the data
+        members : list of tuples or dicts (optional)
+            For ensembles which don't cover every combination of the case
+            values, the combinations which were actually run; either tuples
+            of case values (in the order of `cases`) or dictionaries of
+            case keywords
+        exclude : function or list of dicts (optional)
+            Alternatively, a rule for excluding the combinations of case
+            values which weren't run: either a function which accepts the
+            case values as keyword arguments and returns True for excluded
+            combinations, or a list of (possibly partial) dictionaries of
+            case keywords matching them
         """
 
         self.name = name
@@ -149,20 +181,85 @@ class Experiment(object):
 
         # Add cases to this instance for "Experiment.[case]" access
         for case, vals in self._case_vals.items():
-            setattr(self.__class__, case, vals)
+            setattr(self, case, vals)
         self.case_tuple = namedtuple('case', field_names=self._cases)
+        self._members = self._resolve_members(members, exclude)
 
         self.timeseries = timeseries
         self.output_prefix = output_prefix
         self.output_suffix = output_suffix
 
+        # Compiled path templates and memoized mappings of case tuples to
+        # files for each field; see `Experiment._templates` and
+        # `Experiment._file_lookup`
+        self._path_cache = {}
+        self._path_cache_signature = None
+        self._compiled_templates = None
+
+        # Optional cache for loaded data; see `Experiment.enable_cache`
+        self.cache = None
+
         # Walk tree of directory containing existing data to ensure
         # that all the cases are represented
         self.data_dir = data_dir
+        if isinstance(file_index, basestring):
+            file_index = FileIndex.load(file_index)
+        if file_index is not None:
+            # The index only records paths relative to the archive
+            file_index.root = data_dir
+        self.file_index = file_index
         if validate_data:
             # Location of existing data
             assert os.path.exists(data_dir)
             self._validate_data()
+        self._templates()
+
+    def _resolve_members(self, members=None, exclude=None):
+        """ Determine the combinations of case values in a ragged ensemble,
+        in the same order they would appear in the full product of the case
+        values, or None if every combination is present. """
+        if (members is None) and (exclude is None):
+            return None
+
+        all_cases = product(*self.all_case_vals())
+        if members is not None:
+            members = set(
+                tuple(self.get_case_bits(**m)) if isinstance(m, dict)
+                else tuple(m) for m in members
+            )
+            resolved = [bits for bits in all_cases if bits in members]
+            if len(resolved) < len(members):
+                unknown = members.difference(resolved)
+                raise ValueError("Members {} aren't combinations of the "
+                                 "case values".format(sorted(unknown)))
+        else:
+            resolved = list(all_cases)
+
+        if exclude is not None:
+            if callable(exclude):
+                rule = exclude
+            else:
+                def rule(**case_kws):
+                    return any(
+                        all(case_kws[case] == val for case, val in d.items())
+                        for d in exclude
+                    )
+            resolved = [bits for bits in resolved
+                        if not rule(**self.get_case_kws(*bits))]
+
+        return resolved
+
+    @property
+    def members(self):
+        """ The combinations of case values which were run, for a ragged
+        ensemble, or None if every combination was run. """
+        return self._members
+
+    @property
+    def ragged(self):
+        """ True if this experiment doesn't cover every combination of its
+        case values. """
+        return self._members is not None
 
     # Validation methods
     def _validate_data(self):
@@ -177,8 +274,12 @@ class Experiment(object):
             print(path)
             full_path = os.path.join(root, path)
             logger.debug("   " + full_path)
+            if self.file_index is not None:
+                exists = self.file_index.has_dir(path)
+            else:
+                exists = os.path.exists(full_path)
             try:
-                assert os.path.exists(full_path)
+                assert exists
             except AssertionError:
                 raise AssertionError(
                     "Couldn't find data on path {}".format(full_path)
@@ -188,22 +289,15 @@ class Experiment(object):
         """ Walk the Experiment case structure and generate paths to
         every single case. """
 
-        root = self.data_dir
-
-        path_bits = self.all_cases()
-        path_kws = self.cases
-
-        for bits in path_bits:
-            assert len(bits) == len(path_kws)
-
-            case_kws = OrderedDict()
-            for kw, bit in zip(path_kws, bits):
-                case_kws[kw] = bit
+        batch = self._case_batch()
+        path_template = self._templates()[0]
+        paths = path_template.render_many(batch).tolist()
 
+        for path, bits in zip(paths, batch.itercases()):
             if with_kws:
-                yield self.case_path(**case_kws), case_kws
+                yield path, OrderedDict(zip(self.cases, bits))
             else:
-                yield self.case_path(**case_kws)
+                yield path
 
 
     def walk_files(self, field):
@@ -214,19 +308,182 @@ class Experiment(object):
         -------
         kwargs dictionary and filename, as a generator
 
+        """
+        batch = self._case_batch()
+        paths = self.render_paths(field, batch)
+
+        for case_kws, path_to_file in zip(batch.iterkws(), paths):
+            yield case_kws, path_to_file
+
+    def walk_timeslices(self):
+        """ Walk through all the cases in this experiment and find their
+        timeslice output files.
+
+        Returns
+        -------
+        kwargs dictionary and sorted list of filenames, as a generator
+
         """
         for case_bits in self.all_cases():
             case_kws = self.get_case_kws(*case_bits)
+            yield case_kws, self.get_timeslice_files(**case_kws)
 
-            prefix = self.case_prefix(**case_kws)
-            suffix = self.case_suffix(**case_kws)
-            path_to_file = os.path.join(
-                self.data_dir,
-                self.case_path(**case_kws),
-                prefix + field + suffix,
-            )
+    # File index methods
+    def build_index(self):
+        """ Scan all of the case directories in this experiment and record
+        their files in a :class:`FileIndex`, which will subsequently be used
+        to look up files instead of the file system.
 
-            yield case_kws, path_to_file
+        Returns
+        -------
+        The new FileIndex
+
+        """
+        self.file_index = FileIndex.build(self)
+        return self.file_index
+
+    def refresh_index(self, full=False):
+        """ Update this experiment's file index, re-scanning only the case
+        directories which have changed since it was built (or all of them,
+        if `full`). """
+        if self.file_index is None:
+            self.build_index()
+            return list(self.file_index._dirs)
+        return self.file_index.refresh(full=full)
+
+    def stat_file(self, path_to_file):
+        """ Return the size (in bytes) and modification time of a file in
+        this experiment's archive, or None if it doesn't exist. If this
+        experiment has a file index, the lookup is answered from it.
+
+        """
+        if self.file_index is not None:
+            rel_path = os.path.relpath(path_to_file, self.data_dir)
+            return self.file_index.stat(rel_path)
+        try:
+            st = os.stat(path_to_file)
+        except (IOError, OSError):
+            return None
+        return st.st_size, st.st_mtime
+
+    def _source_mtimes(self, field, keys):
+        """ Return the modification times of the files containing a given
+        field for each of the given cases (the most recent, for timeslice
+        output); missing files are recorded as NaN.
+
+        These are used to detect modified files, so the files are always
+        checked on disk rather than in the (possibly stale) file index.
+
+        """
+        mtimes = []
+        for key in keys:
+            if self.timeseries:
+                paths = [self._file_lookup(field)[key], ]
+            else:
+                try:
+                    paths = self.get_timeslice_files(**key._asdict())
+                except (IOError, OSError):
+                    paths = []
+            try:
+                mtimes.append(max(os.stat(path).st_mtime for path in paths)
+                              if paths else np.nan)
+            except (IOError, OSError):
+                mtimes.append(np.nan)
+        return np.array(mtimes)
+
+    def inventory(self, fields=None, time_dim='time', executor='threads',
+                  max_workers=None):
+        """ Take an inventory of the output in this experiment's archive,
+        reading only the headers of its files.
+
+        Headers are scanned concurrently and through the package's metadata
+        cache, so repeated inventories only re-read files which have been
+        modified. The cache is enlarged, if necessary, to hold every file in
+        the archive. With ``executor="processes"``, each worker scans into
+        its own copy of the cache, so nothing is kept for later inventories.
+
+        Parameters
+        ----------
+        fields : str or list of str (optional)
+            The fields to look for; by default, every field found in the
+            output of the first case
+        time_dim : str
+            The name of the time dimension
+        executor, max_workers :
+            See `Experiment.load`
+
+        Returns
+        -------
+        A pandas DataFrame indexed by the case values and field name, with
+        columns indicating whether each field is `present`, its `shape`, the
+        `time_start` and `time_end` of its output, the number of files
+        (`n_files`) and bytes on disk (`nbytes`) it occupies, and the
+        `error` raised when reading them, if any.
+
+        """
+        import pandas as pd
+
+        if fields is None:
+            fields = self._discover_fields(time_dim)
+        elif isinstance(fields, basestring):
+            fields = [fields, ]
+
+        if self.timeseries:
+            all_files = {field: self._file_lookup(field) for field in fields}
+        else:
+            all_files = {}
+            for bits in self.all_cases():
+                key = self.case_tuple(*bits)
+                try:
+                    all_files[key] = self.get_timeslice_files(**key._asdict())
+                except (IOError, OSError):
+                    all_files[key] = []
+
+        tasks, index = [], []
+        unique_paths = set()
+        for bits in self.all_cases():
+            key = self.case_tuple(*bits)
+            for field in fields:
+                if self.timeseries:
+                    paths = [all_files[field][key], ]
+                else:
+                    paths = all_files[key]
+                stats = [self.stat_file(path) for path in paths]
+                paths = [path for path, st in zip(paths, stats)
+                         if st is not None]
+                nbytes = sum(st[0] for st in stats if st is not None)
+                tasks.append((field, paths, nbytes, time_dim))
+                index.append(tuple(bits) + (field, ))
+                unique_paths.update(paths)
+
+        # Keep the whole archive in the cache, rather than cycling through it
+        default_cache.reserve(len(unique_paths))
+        rows = list(map_ordered(_scan_case, tasks, executor, max_workers))
+        index = pd.MultiIndex.from_tuples(index,
+                                          names=list(self.cases) + ['field'])
+        columns = ['present', 'shape', 'time_start', 'time_end', 'n_files',
+                   'nbytes', 'error']
+        return pd.DataFrame(rows, index=index, columns=columns)
+
+    def _discover_fields(self, time_dim='time'):
+        """ Determine the fields in this experiment's output from the first
+        case; for timeseries output these are the names of its files, and
+        for timeslice output the variables in its first file. """
+        case_kws = self.get_case_kws(*next(self.all_cases()))
+        try:
+            paths = self.get_timeslice_files(**case_kws)
+        except (IOError, OSError):
+            return []
+        if self.timeseries:
+            n_prefix = len(self.case_prefix(**case_kws))
+            n_suffix = len(self.case_suffix(**case_kws))
+            return [os.path.basename(path)[n_prefix:-n_suffix or None]
+                    for path in paths]
+        if not paths:
+            return []
+        meta = get_metadata(paths[0], coords=False)
+        return [name for name, v in meta.variables.items()
+                if (v['dims'] != (name, )) and (name != time_dim)]
 
     # Properties and accessors
     @property
@@ -260,7 +517,12 @@ class Experiment(object):
         ('F2000', 'arg_min_smax')
         ('F1850', 'arg_min_smax')
 
+        For a ragged experiment, only the combinations which were run (see
+        `Experiment.members`) are returned.
+
         """
+        if self._members is not None:
+            return iter(self._members)
         return product(*self.all_case_vals())
 
     def all_case_vals(self):
@@ -299,7 +561,165 @@ class Experiment(object):
             experiment.
 
         """
-        return [fn for case, fn in self.walk_files(field) if case_kws == case] 
+        if set(case_kws) != set(self.cases):
+            return []
+        lookup = self._file_lookup(field)
+        key = self.case_tuple(**case_kws)
+        return [lookup[key], ] if key in lookup else []
+
+    def get_files(self, pairs):
+        """ Return the filepaths for many (case, field) pairs at once.
+
+        Parameters
+        ----------
+        pairs : iterable of (case, field) tuples
+            Each case can either be a tuple of case values (in the order
+            they're defined for this experiment) or a dictionary of case
+            keywords.
+
+        Returns
+        -------
+        A list of filepaths, in the same order as `pairs`, with None for any
+        case not in this experiment.
+
+        """
+        lookups = {}
+        paths = []
+        for case, field in pairs:
+            if field not in lookups:
+                lookups[field] = self._file_lookup(field)
+            if isinstance(case, dict):
+                if set(case) != set(self.cases):
+                    paths.append(None)
+                    continue
+                case = self.get_case_bits(**case)
+            paths.append(lookups[field].get(tuple(case)))
+        return paths
+
+    def render_paths(self, field, cases=None):
+        """ Render the paths to the files containing a given field for a
+        batch of cases at once.
+
+        Parameters
+        ----------
+        field : str
+            The name of the field to generate paths for.
+        cases : CaseBatch or iterable of tuples (optional)
+            The combinations of case values to generate paths for, in the
+            order they're defined in for this experiment; by default, every
+            case in the experiment (in the order of `all_cases`).
+
+        Returns
+        -------
+        A list of paths to the files
+
+        """
+        if not isinstance(cases, CaseBatch):
+            cases = self._case_batch(cases)
+        path_tmpl, prefix_tmpl, suffix_tmpl = self._templates()
+
+        case_paths = path_tmpl.render_many(cases)
+        filenames = np.char.add(
+            np.char.add(prefix_tmpl.render_many(cases), field),
+            suffix_tmpl.render_many(cases)
+        )
+
+        # If every case path is a plain relative path we can join them all at
+        # once; otherwise, defer to os.path.join to handle the corner cases
+        simple = (
+            (len(case_paths) > 0) and
+            np.all(np.char.str_len(case_paths) > 0) and
+            not np.any(np.char.startswith(case_paths, os.sep)) and
+            not np.any(np.char.endswith(case_paths, os.sep))
+        )
+        if simple:
+            base = os.path.join(self.data_dir, "")
+            paths = np.char.add(np.char.add(base, case_paths), os.sep)
+            return np.char.add(paths, filenames).tolist()
+        else:
+            return [os.path.join(self.data_dir, case_path, filename)
+                    for case_path, filename
+                    in zip(case_paths.tolist(), filenames.tolist())]
+
+    def _case_batch(self, cases=None):
+        """ Return a CaseBatch for the given cases, or all the cases in
+        this experiment. """
+        if cases is None:
+            cases = self._members
+        return CaseBatch(self.cases, self.all_case_vals(), cases)
+
+    def _templates(self):
+        """ Return the compiled templates for the case path, output prefix
+        and output suffix, re-compiling them if they've been changed. """
+        self._check_path_cache()
+        if self._compiled_templates is None:
+            self._compiled_templates = (
+                self._compile_path_template(),
+                PathTemplate(self.output_prefix),
+                PathTemplate(self.output_suffix),
+            )
+        return self._compiled_templates
+
+    def _compile_path_template(self):
+        if self._case_path is None:
+            # Combine in the order that the cases were provided
+            return PathTemplate(
+                os.sep.join("{" + case + "}" for case in self._cases)
+            )
+        return PathTemplate(self._case_path)
+
+    def _check_path_cache(self):
+        """ Discard any compiled templates and memoized paths if the path
+        configuration of this experiment has changed. """
+        signature = self._path_signature()
+        if signature != self._path_cache_signature:
+            self._path_cache = {}
+            self._compiled_templates = None
+            self._path_cache_signature = signature
+
+    def _path_signature(self):
+        """ The configuration which determines the paths to this
+        experiment's files; if any of it changes, cached paths are stale. """
+        return (self.data_dir, self._case_path,
+                self.output_prefix, self.output_suffix)
+
+    def _file_lookup(self, field):
+        """ Return a mapping of case tuples to the file containing a given
+        field for every case in this experiment. The mapping is memoized, and
+        discarded whenever the path configuration of the experiment changes.
+
+        """
+        self._check_path_cache()
+        if field not in self._path_cache:
+            batch = self._case_batch()
+            keys = map(self.case_tuple._make, batch.itercases())
+            self._path_cache[field] = OrderedDict(
+                zip(keys, self.render_paths(field, batch))
+            )
+        return self._path_cache[field]
+
+    def get_timeslice_files(self, **case_kws):
+        """ Return a sorted list of the timeslice output files for a
+        particular case, i.e. all the files in its case path which share its
+        output prefix and suffix.
+
+        Parameters
+        ----------
+        case_kws: dict
+            The dictionary of a particular set of key values for cases from this
+            experiment.
+
+        """
+        prefix = self.case_prefix(**case_kws)
+        suffix = self.case_suffix(**case_kws)
+        case_dir = os.path.join(self.data_dir, self.case_path(**case_kws))
+
+        min_len = len(prefix) + len(suffix)
+        return sorted(
+            os.path.join(case_dir, fn) for fn in os.listdir(case_dir)
+            if fn.startswith(prefix) and fn.endswith(suffix)
+            and (len(fn) > min_len)
+        )
 
     def get_case_bits(self, **case_kws):
         """ Return the given case keywords in the order they're defined in
@@ -315,33 +735,20 @@ class Experiment(object):
         experiment, relative to this Experiment's data_dir.
 
         """
-        if self._case_path is None:
-            # Combine in the order that the cases were provided
-            bits = [case_kws[case] for case in self._cases]
-            return os.path.join(*bits)
-        elif callable(self._case_path):
-            return self._case_path(**case_kws)
-        else:
-            # Must be a string
-            return self._case_path.format(**case_kws)
+        return self._templates()[0].render(**case_kws)
 
     def case_prefix(self, **case_kws):
         """ Return the output prefix for a given case. """
-        if callable(self.output_prefix):
-            return self.output_prefix(**case_kws)
-        else:
-            return self.output_prefix.format(**case_kws)
+        return self._templates()[1].render(**case_kws)
 
     def case_suffix(self, **case_kws):
         """ Return the output suffix for a given case. """
-        if callable(self.output_suffix):
-            return self.output_suffix(**case_kws)
-        else:
-            return self.output_suffix.format(**case_kws)
+        return self._templates()[2].render(**case_kws)
 
     # Loading methods
     def load(self, var, fix_times=False, master=False, preprocess=None,
-             load_kws={}, **case_kws):
+             load_kws={}, executor=None, max_workers=None, chunks=None,
+             where=None, **case_kws):
         """ Load a given variable from this experiment's output archive.
 
         Parameters
@@ -350,7 +757,9 @@ class Experiment(object):
             Either the name of a variable to load, or a Var instanced
             defining a specific output variable
         fix_times : logical
-            Fix times if they fall outside an acceptable calendar
+            Fix times if they fall outside an acceptable calendar, re-set
+            them to the middle of their bounds, and decode the CF conventions
+            (lazily); see :func:`experiment.io.fix_cf_times`
         master : logical
             Return a master dataset, with each case defined as a unique
             identifying dimension
@@ -359,25 +768,264 @@ class Experiment(object):
             before it is returned or used to concatenate into a master dataset.
         load_kws : dict (optional)
             Additional keywords which will be passed to the timeslice/timeseries
-            loading function.
+            loading function; for instance, ``dict(mmap=True)`` memory-maps
+            netCDF3 files rather than copying their contents.
+        executor : str or concurrent.futures.Executor (optional)
+            Open and pre-process the cases concurrently, either using a new
+            pool of "threads" (suitable when the time is spent on I/O) or
+            "processes" (suitable for CPU-heavy `preprocess` functions, which
+            must then be picklable), or an existing Executor.
+        max_workers : int (optional)
+            Number of workers to use when creating a new pool; if this is
+            passed without an `executor`, a thread pool is used.
+        chunks : ChunkPolicy (optional)
+            Read each case's file lazily, in chunks chosen by this policy
+            from the size and type of the variable, which is also used to
+            group cases into the blocks of a master dataset.
+        where : function (optional)
+            A predicate accepting the case values as keyword arguments, which
+            returns True for the cases to load
         case_kws : dict (optional)
             Additional keywords, which will be interpreted as a specific
-            case to load from the experiment.
+            case to load from the experiment. If only some of the cases are
+            given, or any are given a list of values, then only the matching
+            cases are loaded, as with ``exp.subset(**case_kws).load(...)``.
+
+        If a cache has been enabled with `Experiment.enable_cache`, the
+        result is cached, and returned directly by subsequent calls with the
+        same arguments as long as the underlying files haven't changed.
 
         """
+        if (where is not None) or not self._is_single_case(case_kws):
+            sub = self.subset(where, **case_kws)
+            return sub.load(var, fix_times, master, preprocess, load_kws,
+                            executor, max_workers, chunks)
+
+        field = var if isinstance(var, basestring) else var.varname
+        if chunks is not None:
+            load_kws = self._chunk_load_kws(field, chunks, load_kws, case_kws)
+
+        if self.cache is not None:
+            key = self._cache_key(field, fix_times, master, preprocess,
+                                  load_kws, case_kws, chunks)
+            data = self.cache.get(key)
+            if data is not None:
+                logger.debug("{} - using cached {}".format(self.name, field))
+                if not isinstance(var, basestring):
+                    if master:
+                        var.master = data
+                    elif not case_kws:
+                        var._data = data
+                        var._loaded = True
+                return data
+
         if self.timeseries:
-            return self._load_timeseries(var, fix_times, master, preprocess,
-                                         load_kws, **case_kws)
+            data = self._load_timeseries(var, fix_times, master, preprocess,
+                                         load_kws, executor, max_workers,
+                                         chunks, **case_kws)
         else:
-            return self._load_timeslice(var, fix_times, master, preprocess,
-                                        load_kws, **case_kws)
+            data = self._load_timeslice(var, fix_times, master, preprocess,
+                                        load_kws, executor, max_workers,
+                                        chunks, **case_kws)
+
+        if self.cache is not None:
+            self.cache.put(key, data, field)
+
+        return data
+
+    def _is_single_case(self, case_kws):
+        """ Check if some case keywords are either empty or specify exactly
+        one case in this experiment. """
+        if not case_kws:
+            return True
+        return (set(case_kws) == set(self.cases)) and \
+            not any(isinstance(val, _SELECTION_TYPES)
+                    for val in case_kws.values())
+
+    def subset(self, where=None, **case_kws):
+        """ Create a new Experiment with only some of the cases in this one,
+        sharing its archive and configuration.
+
+        Parameters
+        ----------
+        where : function (optional)
+            A predicate accepting the case values as keyword arguments, which
+            returns True for the cases to include
+        case_kws : dict (optional)
+            Values to select for any of the cases, either as a single value or
+            a list of values. Cases with a single value are kept as
+            dimensions of length one.
+
+        Returns
+        -------
+        A new Experiment. If `where` is given (or this experiment is ragged)
+        it is a ragged Experiment with just the matching members.
+
+        >>> exp.subset(emis='policy', model_config=['no_sun', 'no_clouds'])
+        my_experiment -
+           * emis (Emissions Scenario):  [policy]
+           * model_config (Model configuration):  [no_clouds, no_sun]
+
+        """
+        unknown = set(case_kws).difference(self.cases)
+        if unknown:
+            raise ValueError("Unknown cases {}".format(sorted(unknown)))
+
+        cases = []
+        for case, longname, vals in self.itercases():
+            if case in case_kws:
+                sel = case_kws[case]
+                if not isinstance(sel, _SELECTION_TYPES):
+                    sel = [sel, ]
+                missing = [val for val in sel if val not in vals]
+                if missing:
+                    raise ValueError("Values {} aren't in case '{}'"
+                                     .format(missing, case))
+                vals = [val for val in vals if val in sel]
+            cases.append(Case(case, longname, vals))
+
+        members = None
+        if self.ragged or (where is not None):
+            batch = CaseBatch(self.cases, [c.vals for c in cases])
+            allowed = set(batch.itercases())
+            members = [bits for bits in self.all_cases() if bits in allowed]
+            if where is not None:
+                members = [bits for bits in members
+                           if where(**self.get_case_kws(*bits))]
+
+        # Start from a copy so that subclasses (and any attributes they
+        # add) are preserved, and re-initialize just the case structure
+        sub = copy(self)
+        Experiment.__init__(
+            sub, self.name, cases, timeseries=self.timeseries,
+            data_dir=self.data_dir, case_path=self._case_path,
+            output_prefix=self.output_prefix,
+            output_suffix=self.output_suffix, validate_data=False,
+            file_index=self.file_index, members=members
+        )
+        sub.cache = self.cache
+        return sub
+
+    def enable_cache(self, max_bytes=None, max_entries=None):
+        """ Cache the results of `Experiment.load` in memory.
+
+        Parameters
+        ----------
+        max_bytes : int (optional)
+            The memory budget for the cache, in bytes, estimated from the
+            size the cached data will have once loaded into memory; the
+            least-recently-used entries are evicted to stay within it
+        max_entries : int (optional)
+            The maximum number of results to cache
+
+        Returns
+        -------
+        The LoadCache attached to this Experiment, which can be used to
+        inspect hit/miss statistics or invalidate entries.
+
+        """
+        self.cache = LoadCache(max_bytes=max_bytes, max_entries=max_entries)
+        return self.cache
+
+    def disable_cache(self):
+        """ Stop caching the results of `Experiment.load`, and discard any
+        cached data. """
+        self.cache = None
+
+    def _chunk_load_kws(self, field, chunks, load_kws, case_kws):
+        """ Add the chunks chosen by a ChunkPolicy for a field to the
+        keywords used to load each case, based on the metadata of the first
+        case's file (or the requested case's, if any). """
+        if self.timeseries:
+            if case_kws:
+                key = self.case_tuple(**case_kws)
+            else:
+                key = self.case_tuple(*next(self.all_cases()))
+            path = self._file_lookup(field)[key]
+        else:
+            case_kws = case_kws or next(self.walk_timeslices())[0]
+            paths = self.get_timeslice_files(**case_kws)
+            path = paths[0] if paths else None
+
+        try:
+            meta = get_metadata(path, coords=False)
+            file_chunks = chunks.variable_chunks(meta, field)
+        except (IOError, OSError, KeyError, TypeError):
+            logger.warning("Couldn't read metadata for {} from {}; not "
+                        "chunking".format(field, path))
+            return load_kws
+
+        logger.debug("{} - reading {} in chunks {}".format(
+            self.name, field, file_chunks
+        ))
+        load_kws = dict(load_kws)
+        load_kws['chunks'] = file_chunks
+        return load_kws
+
+    def _cache_key(self, field, fix_times, master, preprocess, load_kws,
+                   case_kws, chunks=None):
+        """ Build the key identifying a call to `Experiment.load` in the
+        cache, including the modification times of the files it reads. """
+        if case_kws:
+            keys = [self.case_tuple(**case_kws), ]
+        else:
+            keys = [self.case_tuple(*bits) for bits in self.all_cases()]
+        # NaN never compares equal to itself, so missing files are recorded
+        # as None to keep the key hashable and comparable
+        mtimes = tuple(None if np.isnan(mtime) else mtime
+                       for mtime in self._source_mtimes(field, keys).tolist())
+
+        case_signature = (
+            tuple(tuple(vals) for vals in self.all_case_vals()),
+            None if self._members is None else tuple(self._members)
+        )
+        return (
+            field, tuple(sorted(case_kws.items())), fix_times, master,
+            preprocess, repr(sorted(load_kws.items())), repr(chunks),
+            self._path_signature(), case_signature, mtimes
+        )
 
     def _load_timeslice(self, var, fix_times=False, master=False, preprocess=None,
-                        load_kws={}, **case_kws):
-        raise NotImplementedError
+                        load_kws={}, executor=None, max_workers=None,
+                        chunks=None, **case_kws):
+        """ Load a timeslice dataset directly from the experiment output
+        archive, lazily concatenating each case's output files along their
+        time dimension.
+
+        See Also
+        --------
+        Experiment.load : sentinel for loading data
+        io.load_timeslice : lazy loading of a field from timeslice files
+
+        """
+
+        is_var = not isinstance(var, basestring)
+        if is_var:
+            field = var.varname
+        else:
+            field = var
+
+        if case_kws:
+            # Load/return a single case
+            paths = self._case_files(field, **case_kws)
+            logger.debug("{} - loading {} from {} timeslice files".format(
+                self.name, field, len(paths)
+            ))
+            ds = load_timeslice(field, paths, fix_times=fix_times, **load_kws)
+
+            if preprocess is not None:
+                ds = preprocess(ds, **case_kws)
+
+            return ds
+        else:
+            all_files = self._walk_case_files(field)
+            return self._load_cases(var, field, all_files, fix_times, master,
+                                    preprocess, load_kws, executor,
+                                    max_workers, chunks)
 
     def _load_timeseries(self, var, fix_times=False, master=False, preprocess=None,
-                         load_kws={}, **case_kws):
+                         load_kws={}, executor=None, max_workers=None,
+                         chunks=None, **case_kws):
         """ Load a timeseries dataset directly from the experiment output
         archive.
 
@@ -390,20 +1038,12 @@ class Experiment(object):
         is_var = not isinstance(var, basestring)
         if is_var:
             field = var.varname
-            is_var = True
         else:
             field = var
 
         if case_kws:
             # Load/return a single case
-            prefix = self.case_prefix(**case_kws)
-            suffix = self.case_suffix(**case_kws)
-
-            path_to_file = os.path.join(
-                self.data_dir,
-                self.case_path(**case_kws),
-                prefix + field + suffix,
-            )
+            path_to_file = self._case_files(field, **case_kws)
             logger.debug("{} - loading {} timeseries from {}".format(
                 self.name, field, path_to_file
             ))
@@ -414,36 +1054,772 @@ class Experiment(object):
 
             return ds
         else:
+            all_files = self._walk_case_files(field)
+            return self._load_cases(var, field, all_files, fix_times, master,
+                                    preprocess, load_kws, executor,
+                                    max_workers, chunks)
 
-            data = dict()
+    def iter_load(self, var, prefetch=1, fix_times=False, preprocess=None,
+                  load_kws={}, eager=True, executor='threads'):
+        """ Iterate over the cases in this experiment, loading each one in
+        turn, while the next `prefetch` cases are loaded in the background.
+        This lets the analysis of one case overlap with reading the next.
 
-            for case_kws, filename in self.walk_files(field):
+        Parameters
+        ----------
+        var : str or Var
+            Either the name of a variable to load, or a Var instanced
+            defining a specific output variable
+        prefetch : int
+            The number of cases to load ahead of the one being analyzed; at
+            most this many (plus the current case) are held in memory at
+            once. If 0, the cases are loaded one at a time.
+        fix_times, preprocess, load_kws :
+            See `Experiment.load`
+        eager : logical
+            Read each case's data into memory in the background, rather
+            than just opening its file
+        executor : str or concurrent.futures.Executor
+            The pool to use to load cases in the background
 
-                try:
-                    ds = load_variable(field, filename, fix_times=fix_times, **load_kws)
+        Returns
+        -------
+        Tuples of each case's `case_tuple` and Dataset, as a generator.
+        If the generator is closed early, any pending loads are cancelled.
 
-                    if preprocess is not None:
-                        ds = preprocess(ds, **case_kws)
+        """
+        field = var if isinstance(var, basestring) else var.varname
+
+        all_files = self._walk_case_files(field)
+        tasks = [
+            (field, filename, case_kws, fix_times, preprocess, load_kws, eager)
+            for case_kws, filename in all_files
+        ]
+        if prefetch:
+            results = map_ordered(_load_case, tasks, executor,
+                                  max_workers=prefetch, max_pending=prefetch)
+        else:
+            results = map_ordered(_load_case, tasks)
 
-                    data[self.case_tuple(**case_kws)] = ds
-                except:
-                    logger.warn("Could not load case %r" % case_kws)
-                    data[self.case_tuple(**case_kws)] = xr.Dataset({field: np.nan})
+        try:
+            for (case_kws, filename), ds in zip(all_files, results):
+                if isinstance(ds, Exception):
+                    logger.warning("Could not load case %r" % case_kws)
+                    ds = xr.Dataset({field: np.nan})
+                yield self.case_tuple(**case_kws), ds
+        finally:
+            results.close()
+
+    def _walk_case_files(self, field):
+        """ Return a list of the (case kwargs, file) pairs for every case in
+        this experiment, where the file is a list of files for timeslice
+        output. """
+        if self.timeseries:
+            return list(self.walk_files(field))
+        else:
+            return list(self.walk_timeslices())
+
+    def _case_files(self, field, **case_kws):
+        """ Return the file holding a field for a single case, or the list of
+        the case's files for timeslice output. """
+        if self.timeseries:
+            prefix = self.case_prefix(**case_kws)
+            suffix = self.case_suffix(**case_kws)
+            return os.path.join(self.data_dir, self.case_path(**case_kws),
+                                prefix + field + suffix)
+        else:
+            return self.get_timeslice_files(**case_kws)
+
+    def _load_cases(self, var, field, all_files, fix_times=False,
+                    master=False, preprocess=None, load_kws={},
+                    executor=None, max_workers=None, chunks=None):
+        """ Load a field from every case in this experiment, given the
+        (case kwargs, file or list of timeslice files) pairs for each case.
+
+        """
+        tasks = [
+            (field, filename, case_kws, fix_times, preprocess, load_kws)
+            for case_kws, filename in all_files
+        ]
+        results = map_ordered(_load_case, tasks, executor, max_workers)
+
+        return self._collect_cases(var, field, all_files, results, master,
+                                   chunks)
+
+    def _collect_cases(self, var, field, all_files, results, master=False,
+                       chunks=None):
+        """ Assemble the results of loading every case into a dictionary
+        (or master dataset), replacing any which failed with a placeholder
+        and attaching them to `var` if it's a Var.
+
+        """
+        is_var = not isinstance(var, basestring)
+
+        data = dict()
+        for (case_kws, filename), ds in zip(all_files, results):
+            if isinstance(ds, Exception):
+                logger.warning("Could not load case %r" % case_kws)
+                ds = xr.Dataset({field: np.nan})
+            data[self.case_tuple(**case_kws)] = ds
+
+        if is_var:
+            var._data = data
+            var._loaded = True
+
+        if master:
+            ds_master = create_master(self, field, data, chunks=chunks)
 
             if is_var:
-                var._data = data
-                var._loaded = True
+                var.master = ds_master
+
+            data = ds_master
+
+        return data
+
+
+    def load_many(self, vars, fix_times=False, master=False, preprocess=None,
+                  load_kws={}, executor=None, max_workers=None, chunks=None):
+        """ Load several variables from every case in this experiment in a
+        single pass over the output archive.
+
+        Each case is visited once, and all of the requested fields are read
+        while its files are open, so the coordinates (and for timeslice
+        output, the timestamps of every file) are only read and decoded once
+        per case rather than once per field.
+
+        Parameters
+        ----------
+        vars : list of str or Var, or VarList
+            The variables to load
+        fix_times, preprocess, load_kws, executor, max_workers, chunks :
+            See `Experiment.load`; `preprocess` is applied to the Dataset
+            holding all the fields of each case, except for timeseries
+            output without `master`, where each field's Dataset is
+            pre-processed on its own
+        master : logical
+            Return a single master dataset holding every variable, rather
+            than a dictionary of the data for each one. For timeseries
+            output, the fields of each case are merged with an outer join,
+            so fields with different coordinates (such as monthly and daily
+            output) are padded with NaN.
+
+        Returns
+        -------
+        Either a master Dataset with every field, or a dictionary mapping
+        each field's name to a dictionary of its datasets for each case. Any
+        Vars in `vars` also have their data (and master dataset) attached.
+
+        """
+        if isinstance(vars, basestring):
+            vars = [vars, ]
+        vars = list(vars)
+        fields = [v if isinstance(v, basestring) else v.varname for v in vars]
+
+        # One task per case, with the file(s) for every field
+        case_files = [self._walk_case_files(field) for field in
+                      (fields if self.timeseries else fields[:1])]
+        all_files = case_files[0]
+
+        # Each field is chunked according to its own layout, which is read
+        # only once (from the first case) rather than for every case
+        if chunks is not None:
+            field_load_kws = [self._chunk_load_kws(field, chunks, load_kws,
+                                                   {})
+                              for field in fields]
+        else:
+            field_load_kws = [load_kws for field in fields]
+
+        tasks = []
+        for i, (case_kws, _) in enumerate(all_files):
+            if self.timeseries:
+                paths = [files[i][1] for files in case_files]
+            else:
+                paths = all_files[i][1]
+            tasks.append((fields, paths, case_kws, self.timeseries, fix_times,
+                          preprocess, field_load_kws, master))
+        logger.debug("{} - loading {} from {} cases".format(
+            self.name, fields, len(tasks)
+        ))
+        results = map_ordered(_load_case_fields, tasks, executor, max_workers)
+
+        data = dict()
+        for (case_kws, _), ds in zip(all_files, results):
+            if isinstance(ds, Exception):
+                logger.warning("Could not load case %r" % case_kws)
+                ds = xr.Dataset({field: np.nan for field in fields})
+            data[self.case_tuple(**case_kws)] = ds
+
+        if master:
+            ds_master = create_master(self, fields[0], data, new_fields=[],
+                                      chunks=chunks)
+            for v in vars:
+                if not isinstance(v, basestring):
+                    v.master = ds_master[[v.varname, ]]
+            return ds_master
+
+        all_data = OrderedDict()
+        for v, field in zip(vars, fields):
+            all_data[field] = {}
+            for key, ds in data.items():
+                if isinstance(ds, dict):
+                    ds = ds[field]
+                all_data[field][key] = ds[[field, ]] if field in ds else ds
+            if not isinstance(v, basestring):
+                v._data = all_data[field]
+                v._loaded = True
+        return all_data
+
+    def open_master(self, var, chunks=None, fix_times=False, load_kws={}):
+        """ Open a master dataset for a given variable directly from this
+        experiment's output archive, without first loading every case.
+
+        Only the first case's file is opened, as a prototype for the shape,
+        dtype and coordinates of the variable; the data for every case is
+        wrapped in a lazy reader and isn't read from disk until it's
+        computed. Note that this means that every case's data must have the
+        same structure, and any missing or malformed cases will only raise
+        errors when their data is read. For timeslice output, the timestamps
+        from each case's files must still be read to construct it.
+
+        Parameters
+        ----------
+        var : str or Var
+            Either the name of a variable to load, or a Var instanced
+            defining a specific output variable
+        chunks : dict, tuple or ChunkPolicy (optional)
+            The chunk sizes to use when reading each case, either as a mapping
+            of dimension names to chunk sizes or a tuple with a size for
+            every dimension, or a ChunkPolicy to choose them (and group cases
+            into blocks). By default, each case is read as one block.
+        fix_times : logical
+            Fix times if they fall outside an acceptable calendar, re-set
+            them to the middle of their bounds, and decode the CF conventions
+            (lazily); see :func:`experiment.io.fix_cf_times`
+        load_kws : dict (optional)
+            Additional keywords which will be passed to the function
+            loading the prototype file.
+
+        Returns
+        -------
+        A Dataset with the variable for all the cases, collapsed onto
+        additional dimensions for each case in the Experiment.
+
+        """
+        is_var = not isinstance(var, basestring)
+        if is_var:
+            field = var.varname
+        else:
+            field = var
+
+        layout = CaseLayout(self)
+        policy = chunks if isinstance(chunks, ChunkPolicy) else None
+
+        if not self.timeseries:
+            arrays = []
+            for case_kws, paths in self.walk_timeslices():
+                ds = load_timeslice(field, paths, fix_times=fix_times,
+                                    **load_kws)
+                if not arrays:
+                    proto = ds
+                # A ChunkPolicy is applied when the cases are stacked
+                if (chunks is not None) and (policy is None):
+                    ds = ds.chunk(chunks)
+                arrays.append(ds[field].data)
+        else:
+            case_files = self._file_lookup(field)
+            proto_file = case_files[layout.keys[0]]
+            logger.debug("{} - opening master {} using prototype {}".format(
+                self.name, field, proto_file
+            ))
+            proto = load_variable(field, proto_file, fix_times=fix_times,
+                                  **load_kws)
+            proto_da = proto[field]
+            if policy is not None:
+                chunks = policy.file_chunks(
+                    proto_da.dims, proto_da.shape, proto_da.dtype,
+                    proto_da.encoding.get('chunksizes')
+                )
+            if isinstance(chunks, dict):
+                chunks = tuple(chunks.get(dim, size) for dim, size
+                               in zip(proto_da.dims, proto_da.shape))
+
+            arrays = [
+                open_lazy(case_files[key], field, proto_da.shape,
+                          proto_da.dtype, chunks=chunks, decode_cf=fix_times,
+                          **load_kws)
+                for key in layout.keys
+            ]
+
+        ds_master = xr.Dataset(
+            {field: layout.to_dataarray(arrays, proto[field], policy)},
+            coords=layout.case_coords()
+        )
+        ds_master = copy_attrs(proto[[field, ]], ds_master)
+
+        if is_var:
+            var.master = ds_master
+
+        return ds_master
+
+    def derive(self, var, fix_times=False, load_kws={}, chunks=None):
+        """ Lazily compute one or more derived variables, as defined by the
+        `ncap_str` expression, `oldvar` fields and `scale_factor` of each Var,
+        for every case in this experiment.
+
+        Only the fields referenced by the expressions are opened (each once,
+        with `Experiment.open_master`), and any intermediate results shared
+        between the Vars in a VarList are only computed once.
+
+        Parameters
+        ----------
+        var : Var or VarList
+            The variable(s) to derive
+        fix_times, load_kws, chunks :
+            See `Experiment.open_master`
 
-            if master:
-                ds_master = create_master(self, field, data)
+        Returns
+        -------
+        A master Dataset with the derived variable(s), each of which is also
+        attached to its Var as `Var.master`.
+
+        See Also
+        --------
+        experiment.derive : the expression evaluator
+
+        """
+        return derive(self, var, fix_times, load_kws, chunks)
 
-                if is_var:
-                    var.master = ds_master
+    # Streaming reductions
+    def reduce(self, var, over=None, stats=('mean', 'var', 'min', 'max'),
+               ddof=0, fix_times=False, preprocess=None, load_kws={},
+               executor=None, max_workers=None, where=None, **case_kws):
+        """ Compute statistics of a variable across some (or all) of the case
+        dimensions of this experiment, without building a master dataset.
 
-                data = ds_master
+        The cases are read one at a time and folded into an online
+        accumulator for their group (the cases which share the same values
+        of the dimensions *not* reduced over), so only a single case plus
+        the accumulators are ever held in memory.
 
-            return data
+        Parameters
+        ----------
+        var : str or Var
+            The variable to reduce
+        over : str or list of str (optional)
+            The case dimensions to reduce over; by default, all of them
+        stats : list of str
+            The statistics to compute, from "count", "mean", "var", "std",
+            "min" and "max"
+        ddof : int
+            Delta degrees of freedom for the variance and standard deviation
+        fix_times, preprocess, load_kws, where, case_kws :
+            See `Experiment.load`
+        executor, max_workers :
+            Split the cases into batches which are accumulated concurrently
+            (one per worker) and then merged; see `Experiment.load`
 
+        Returns
+        -------
+        A Dataset with a variable for each statistic, with dimensions for
+        any case dimensions which weren't reduced over, followed by those of
+        the variable itself.
+
+        See Also
+        --------
+        experiment.reduce.Moments : the accumulator
+
+        """
+        if (where is not None) or case_kws:
+            sub = self.subset(where, **case_kws)
+            return sub.reduce(var, over, stats, ddof, fix_times, preprocess,
+                              load_kws, executor, max_workers)
+
+        stats = [stats, ] if isinstance(stats, basestring) else list(stats)
+        for stat in stats:
+            if stat not in MOMENT_STATS:
+                raise ValueError("Unknown statistic '{}'; expected one of {}"
+                                 .format(stat, MOMENT_STATS))
+
+        field = var if isinstance(var, basestring) else var.varname
+        groups, proto, group_coords = self._accumulate(
+            field, Moments, over, fix_times, preprocess, load_kws, executor,
+            max_workers
+        )
+        results = OrderedDict(
+            (stat, (partial(Moments.result, stat=stat, ddof=ddof), ()))
+            for stat in stats
+        )
+        return groups_to_dataset(groups, proto, group_coords, results)
+
+    def histogram(self, var, over=None, bins=100, range=None,
+                  fix_times=False, preprocess=None, load_kws={},
+                  executor=None, max_workers=None, where=None, **case_kws):
+        """ Compute histograms of a variable across some (or all) of the case
+        dimensions of this experiment, for every element of the variable,
+        without building a master dataset.
+
+        As with `Experiment.reduce`, the cases are read one at a time and
+        added to a fixed-bin :class:`~experiment.reduce.Histogram` for their
+        group, so the memory needed is bounded by the number of bins.
+
+        Parameters
+        ----------
+        var : str or Var
+            The variable to summarize
+        over : str or list of str (optional)
+            The case dimensions to reduce over; by default, all of them
+        bins : int
+            The number of equal-width bins
+        range : tuple of float (optional)
+            The lower and upper edges of the bins; if not given, the minimum
+            and maximum of the variable over every case are used, at the
+            cost of an extra pass over the files
+        fix_times, preprocess, load_kws, executor, max_workers, where,
+        case_kws :
+            See `Experiment.reduce`
+
+        Returns
+        -------
+        A Dataset with the "counts" and "density" in each bin (along a new
+        "bin" dimension, labelled with the bin centers and with their edges
+        as "bin_lower" and "bin_upper"), the total "count", and the number
+        of values below and above the range as "underflow" and "overflow".
+
+        """
+        if (where is not None) or case_kws:
+            sub = self.subset(where, **case_kws)
+            return sub.histogram(var, over, bins, range, fix_times,
+                                 preprocess, load_kws, executor, max_workers)
+
+        field = var if isinstance(var, basestring) else var.varname
+        groups, proto, group_coords, edges = self._histograms(
+            field, over, bins, range, fix_times, preprocess, load_kws,
+            executor, max_workers
+        )
+        results = OrderedDict(
+            (stat, (partial(Histogram.result, stat=stat), extra_dims))
+            for stat, extra_dims in [('counts', ('bin', )),
+                                     ('density', ('bin', )),
+                                     ('count', ()), ('underflow', ()),
+                                     ('overflow', ())]
+        )
+        ds = groups_to_dataset(groups, proto, group_coords, results)
+        ds.coords['bin'] = ('bin', 0.5*(edges[:-1] + edges[1:]))
+        ds.coords['bin_lower'] = ('bin', edges[:-1])
+        ds.coords['bin_upper'] = ('bin', edges[1:])
+        return ds
+
+    def quantiles(self, var, q=(0.05, 0.5, 0.95), over=None, bins=200,
+                  range=None, fix_times=False, preprocess=None, load_kws={},
+                  executor=None, max_workers=None, where=None, **case_kws):
+        """ Estimate quantiles of a variable across some (or all) of the case
+        dimensions of this experiment, for every element of the variable,
+        without building a master dataset.
+
+        The quantiles are interpolated from the fixed-bin histograms
+        computed by `Experiment.histogram`, so they're accurate to within
+        the width of a bin, and memory is bounded by the number of bins
+        rather than the number of cases. The histograms' counts are stored
+        compactly (in two bytes per bin for up to 65535 cases in a group),
+        but stacking the cases is still cheaper for groups with fewer than
+        about ``bins/4`` cases.
+
+        If no `range` is given, it's found from the minimum and maximum of
+        the variable, which costs an extra full pass over every case's
+        files; pass it explicitly whenever it's known in advance.
+
+        Parameters
+        ----------
+        var : str or Var
+            The variable to summarize
+        q : float or list of floats
+            The quantiles to estimate, between 0 and 1
+        over, bins, range, fix_times, preprocess, load_kws, executor,
+        max_workers, where, case_kws :
+            See `Experiment.histogram`
+
+        Returns
+        -------
+        A Dataset with the estimated quantiles of the variable (under its
+        own name, along a new "quantile" dimension) and the "count" of
+        values they were estimated from.
+
+        """
+        if (where is not None) or case_kws:
+            sub = self.subset(where, **case_kws)
+            return sub.quantiles(var, q, over, bins, range, fix_times,
+                                 preprocess, load_kws, executor, max_workers)
+
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if ((q < 0) | (q > 1)).any():
+            raise ValueError("Quantiles must be between 0 and 1")
+
+        field = var if isinstance(var, basestring) else var.varname
+        groups, proto, group_coords, _ = self._histograms(
+            field, over, bins, range, fix_times, preprocess, load_kws,
+            executor, max_workers
+        )
+        results = OrderedDict([
+            (field, (partial(Histogram.quantile, q=q), ('quantile', ))),
+            ('count', (partial(Histogram.result, stat='count'), ())),
+        ])
+        ds = groups_to_dataset(groups, proto, group_coords, results)
+        ds.coords['quantile'] = ('quantile', q)
+        return ds
+
+    def _histograms(self, field, over=None, bins=100, range=None,
+                    fix_times=False, preprocess=None, load_kws={},
+                    executor=None, max_workers=None):
+        """ Accumulate the histograms of a field for each group of cases,
+        first finding the range of the field if it isn't given. Returns the
+        same as `Experiment._accumulate`, plus the edges of the bins. """
+        if range is None:
+            groups, _, _ = self._accumulate(
+                field, Moments, over, fix_times, preprocess, load_kws,
+                executor, max_workers
+            )
+            lo = min(np.nanmin(acc.result('min')) for acc in groups.values())
+            hi = max(np.nanmax(acc.result('max')) for acc in groups.values())
+            if not np.isfinite([lo, hi]).all():
+                raise ValueError("Couldn't find the range of " + field)
+            if hi == lo:
+                hi = lo + 1.
+            range = (lo, hi)
+            logger.debug("{} - using range {} for {} histograms".format(
+                self.name, range, field
+            ))
+
+        factory = partial(Histogram, bins=bins, range=range)
+        groups, proto, group_coords = self._accumulate(
+            field, factory, over, fix_times, preprocess, load_kws, executor,
+            max_workers
+        )
+        return groups, proto, group_coords, factory().edges
+
+    def _accumulate(self, field, factory, over=None, fix_times=False,
+                    preprocess=None, load_kws={}, executor=None,
+                    max_workers=None):
+        """ Fold every case's data for a field into an accumulator for its
+        group of cases, returning the accumulators, a prototype DataArray
+        from one of the cases, and the (name, values, long name) of each of
+        the case dimensions which weren't reduced over. """
+        if over is None:
+            over = list(self.cases)
+        elif isinstance(over, basestring):
+            over = [over, ]
+        for case in over:
+            if case not in self.cases:
+                raise ValueError("Unknown case '{}'; expected one of {}"
+                                 .format(case, self.cases))
+        group_coords = [(case, vals, longname)
+                        for case, longname, vals in self.itercases()
+                        if case not in over]
+        kept = [case for case, _, _ in group_coords]
+
+        tasks = [(tuple(case_kws[case] for case in kept), case_kws, path)
+                 for case_kws, path in self._walk_case_files(field)]
+        if (executor is None) and (max_workers is None):
+            n_batches = 1
+        else:
+            n_batches = max_workers or os.cpu_count() or 1
+        n_batches = max(1, min(n_batches, len(tasks)))
+        bounds = np.linspace(0, len(tasks), n_batches + 1).astype(int)
+        batches = [
+            (field, tasks[start:end], factory, fix_times, preprocess,
+             load_kws)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        logger.debug("{} - accumulating {} over {} in {} batches".format(
+            self.name, field, over, n_batches
+        ))
+
+        partials, proto = [], None
+        for batch_groups, batch_proto in map_ordered(
+                _accumulate_cases, batches, executor, max_workers):
+            partials.append(batch_groups)
+            if proto is None:
+                proto = batch_proto
+        if proto is None:
+            raise ValueError("Couldn't load {} from any case".format(field))
+
+        return merge_groups(partials), proto, group_coords
+
+    # Asynchronous loading methods
+    def aload(self, var, fix_times=False, master=False, preprocess=None,
+              load_kws={}, max_concurrency=None, timeout=None, executor=None,
+              **case_kws):
+        """ Asynchronous counterpart to `Experiment.load`, for use within an
+        asyncio event loop.
+
+        The cases are opened and pre-processed on an executor, so that the
+        event loop isn't blocked while they're being loaded.
+
+        Parameters
+        ----------
+        var, fix_times, master, preprocess, load_kws, case_kws :
+            See `Experiment.load`
+        max_concurrency : int (optional)
+            The maximum number of cases to load at once; if no `executor`
+            is given (or only its name), a new pool with this many workers
+            is used
+        timeout : float (optional)
+            The number of seconds to wait for each case before giving up on
+            it; timed-out cases are treated the same as those which fail to
+            load. The underlying read can't be interrupted, so it keeps
+            occupying a worker until it finishes; with an existing
+            `executor`, it no longer counts towards `max_concurrency`.
+        executor : str or concurrent.futures.Executor (optional)
+            The pool to load cases on; by default, the event loop's default
+            executor is used.
+
+        Returns
+        -------
+        A coroutine which returns the same dictionary or master dataset as
+        `Experiment.load`
+
+        """
+        from . aio import aload
+        return aload(self, var, fix_times, master, preprocess, load_kws,
+                     max_concurrency, timeout, executor, **case_kws)
+
+    def awalk_files(self, field):
+        """ Asynchronous counterpart to `Experiment.walk_files`; the paths
+        are generated on the event loop's default executor.
+
+        Returns
+        -------
+        kwargs dictionary and filename, as an asynchronous generator
+
+        """
+        from . aio import awalk_files
+        return awalk_files(self, field)
+
+    # Zarr export methods
+    def zarr_store(self, field):
+        """ Return the default location of the Zarr store holding the master
+        dataset for a given field. """
+        return os.path.join(self.data_dir,
+                            "{}.{}.zarr".format(self.name, field))
+
+    def to_zarr(self, var, store=None, chunks=None, load_kws={}):
+        """ Write the master dataset for a given variable to a Zarr store.
+
+        The master dataset is built lazily with `Experiment.open_master`, and
+        written with one chunk along each case dimension alongside
+        consolidated metadata. The modification time of every case's source
+        file is recorded in a "source_mtime" variable, so that
+        `Experiment.open_zarr` can later detect which cases have changed
+        and need to be re-written.
+
+        Parameters
+        ----------
+        var : str or Var
+            Either the name of a variable to write, or a Var instanced
+            defining a specific output variable
+        store : str or MutableMapping (optional)
+            The Zarr store to write to; by default, a store named after this
+            experiment and the field in `data_dir`
+        chunks, load_kws :
+            Passed to `Experiment.open_master`
+
+        Returns
+        -------
+        The path or mapping of the store which was written to.
+
+        """
+        field = var if isinstance(var, basestring) else var.varname
+        if store is None:
+            store = self.zarr_store(field)
+
+        layout = CaseLayout(self)
+        ds_master = self.open_master(field, chunks=chunks, load_kws=load_kws)
+        ds_master['source_mtime'] = (
+            layout.dims, self._source_mtimes(field, layout.keys).reshape(layout.shape),
+            {'long_name': "modification time of source file "
+                          "(seconds since the epoch)"}
+        )
+        ds_master['source_mtime'].encoding['chunks'] = (1, )*len(layout.dims)
+        if layout.ragged:
+            # MultiIndexes can't be serialized, so store the case values
+            # as plain coordinates along the member dimension
+            ds_master = ds_master.reset_index(MEMBER_DIM)
+
+        logger.info("{} - writing master {} to {}".format(
+            self.name, field, store
+        ))
+        ds_master.to_zarr(store, mode='w', consolidated=True)
+
+        return store
+
+    def open_zarr(self, var, store=None, refresh=True, load_kws={}):
+        """ Open the master dataset for a given variable from a Zarr store
+        previously written with `Experiment.to_zarr`.
+
+        Parameters
+        ----------
+        var : str or Var
+            Either the name of a variable to open, or a Var instanced
+            defining a specific output variable
+        store : str or MutableMapping (optional)
+            The Zarr store to read from; by default, a store named after this
+            experiment and the field in `data_dir`
+        refresh : logical
+            Check the modification times of the source files, and re-write
+            the data in the store for any cases which have changed since
+            it was written
+        load_kws : dict (optional)
+            Passed to `Experiment.open_master` when re-writing cases
+
+        """
+        field = var if isinstance(var, basestring) else var.varname
+        if store is None:
+            store = self.zarr_store(field)
+
+        if refresh:
+            self._refresh_zarr(field, store, load_kws)
+
+        ds_master = xr.open_zarr(store, consolidated=True)
+        if self.ragged:
+            ds_master = ds_master.set_index({MEMBER_DIM: self.cases})
+        if not isinstance(var, basestring):
+            var.master = ds_master
+
+        return ds_master
+
+    def _refresh_zarr(self, field, store, load_kws={}):
+        """ Re-write the cases in a Zarr store whose source files have been
+        modified since they were written. """
+        layout = CaseLayout(self)
+
+        with xr.open_zarr(store, consolidated=True) as ds_store:
+            old_mtimes = ds_store['source_mtime'].values
+            chunks = ds_store[field].data.chunksize[len(layout.dims):]
+        new_mtimes = self._source_mtimes(field, layout.keys).reshape(layout.shape)
+
+        stale = (old_mtimes != new_mtimes) & ~np.isnan(new_mtimes)
+        if not stale.any():
+            return []
+
+        logger.info("{} - refreshing {} stale cases of {} in {}".format(
+            self.name, stale.sum(), field, store
+        ))
+        ds_master = self.open_master(field, chunks=chunks, load_kws=load_kws)
+        ds_master['source_mtime'] = (layout.dims, new_mtimes)
+        # Only the variables along the case dimensions can be written
+        ds_master = ds_master[[field, 'source_mtime']]
+        ds_master = ds_master.drop_vars(list(ds_master.coords))
+
+        refreshed = []
+        for idx in zip(*np.nonzero(stale)):
+            region = {dim: slice(i, i + 1) for dim, i in zip(layout.dims, idx)}
+            ds_master.isel(**region).to_zarr(store, region=region)
+            refreshed.append(layout.keys[np.ravel_multi_index(idx,
+                                                              layout.shape)])
+
+        import zarr
+        zarr.consolidate_metadata(store)
+
+        return refreshed
 
     def create_master(self, var, data=None, **kwargs):
         """ Convenience function to create a master dataset for a
@@ -484,26 +1860,85 @@ class Experiment(object):
 
 
     @staticmethod
-    def apply_to_all(data, func, func_kws={}, verbose=False):
+    def apply_to_all(data, func, func_kws={}, verbose=False, executor=None,
+                     max_workers=None, scheduler=None, max_pending=None):
         """ Helper function to quickly apply a function all the datasets
-        in a given collection. """
-        keys = list(data.keys())
-        n_tot = len(keys)
+        in a given collection.
+
+        Parameters
+        ----------
+        data : dict
+            The collection of datasets, such as that returned by
+            `Experiment.load`; nested dictionaries are processed recursively
+        func : function
+            The function to apply to each dataset
+        func_kws : dict (optional)
+            Additional keyword arguments to pass to `func`
+        verbose : logical
+            Display a progress bar
+        executor : str or concurrent.futures.Executor (optional)
+            Apply the function concurrently, either using a new pool of
+            "threads" or "processes" (in which case `func` must be picklable),
+            an existing Executor, or "dask" to wrap each call in
+            `dask.delayed`.
+        max_workers : int (optional)
+            Number of workers to use when creating a new pool.
+        scheduler : str or dask Client (optional)
+            The dask scheduler to use when `executor` is "dask".
+        max_pending : int (optional)
+            The maximum number of results to compute ahead of those which
+            have been collected.
+
+        Returns
+        -------
+        A dictionary with the same keys (and nesting) as `data`
+
+        """
         new_data = {}
+        for key_path, result in Experiment.iter_apply(
+                data, func, func_kws, verbose, executor, max_workers,
+                scheduler, max_pending):
+            parent = new_data
+            for key in key_path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[key_path[-1]] = result
+        return new_data
+
+    @staticmethod
+    def iter_apply(data, func, func_kws={}, verbose=False, executor=None,
+                   max_workers=None, scheduler=None, max_pending=None):
+        """ Apply a function to all the datasets in a given collection, and
+        yield the results one at a time in the order of the collection's
+        keys. Combined with `max_pending`, this bounds the number of results
+        held in memory at any one time.
+
+        See `Experiment.apply_to_all` for a description of the parameters.
+
+        Returns
+        -------
+        Tuples of the path of keys to each dataset (with more than one key
+        for nested dictionaries) and the result of applying `func` to it,
+        as a generator
+
+        """
+        leaves = list(_iter_leaves(data))
+        # Empty nested dictionaries are passed through as-is
+        tasks = [(func, leaf, func_kws) for _, leaf in leaves
+                 if not _is_empty_dict(leaf)]
+        results = map_ordered(_apply, tasks, executor, max_workers,
+                              max_pending, scheduler)
 
         if verbose:
             fn_name = func.__name__
             desc_str = "apply_to_all:{}".format(fn_name)
-            iterator = tqdm(keys, desc=desc_str, total=n_tot)
-        else:
-            iterator = keys
+            results = tqdm(results, desc=desc_str, total=len(tasks))
 
-        for key in iterator:
-            if isinstance(data[key], dict):
-                new_data[key] = apply_to_all(data[key], func, **func_kws)
+        results = iter(results)
+        for key_path, leaf in leaves:
+            if _is_empty_dict(leaf):
+                yield key_path, {}
             else:
-                new_data[key] = func(data[key], **func_kws)
-        return new_data
+                yield key_path, next(results)
 
 
     def to_dict(self):
@@ -514,21 +1949,28 @@ class Experiment(object):
         for case, data in self._case_data.items():
             case_dict[case] = dict(longname=data.longname, vals=data.vals)
 
-        return dict(
+        d = dict(
             name=self.name, cases=case_dict, timeseries=self.timeseries,
             case_path=self._case_path, output_prefix=self.output_prefix,
             output_suffix=self.output_suffix,
             data_dir=self.data_dir, validate_data=False
         )
+        if self.ragged:
+            d['members'] = [list(bits) for bits in self._members]
+        return d
 
 
-    def to_yaml(self, path):
+    def to_yaml(self, path, index=False):
         """ Write Experiment configuration to a YAML file.
 
         Parameters
         ----------
         path : str
             Path where to save the Experiment.
+        index : bool, optional (default False)
+            Also save an index of the files in this Experiment's archive
+            as a sidecar next to the YAML file, building it if necessary.
+            It will be automatically read by `Experiment.from_yaml`.
         """
         logger.info("Serializing Experiment to " + path)
 
@@ -541,6 +1983,11 @@ class Experiment(object):
         with open(path, 'w') as yaml_file:
             yaml.dump(d, yaml_file, default_flow_style=False)
 
+        if index:
+            if self.file_index is None:
+                self.build_index()
+            self.file_index.save(index_path(path))
+
 
     @classmethod
     def from_yaml(cls, yaml_filename):
@@ -573,7 +2020,8 @@ class Experiment(object):
             ...
 
         The arguments for constructing an Experiment are read directly from the
-        YAML file, and used for instantiation.
+        YAML file, and used for instantiation. If a file index was saved
+        alongside the YAML file, it is loaded as well.
 
         Parameters
         ----------
@@ -606,6 +2054,11 @@ class Experiment(object):
             cases.append(Case(case_short, **case_kws))
         exp_kwargs['cases'] = cases
 
+        # Read the file index sidecar, if there is one
+        sidecar = index_path(yaml_filename)
+        if os.path.exists(sidecar) and ('file_index' not in exp_kwargs):
+            exp_kwargs['file_index'] = FileIndex.load(sidecar)
+
         # Create and return the Experiment
         exp = cls(**exp_kwargs)
         logger.debug(exp)
@@ -620,9 +2073,164 @@ class Experiment(object):
             base_str += " [" + \
                         ", ".join(str(val) for val in self._case_vals[case]) + \
                         "]"
+        if self.ragged:
+            base_str += "\n   ({} members)".format(len(self._members))
         return base_str
 
 
+def _iter_leaves(data, key_path=()):
+    """ Iterate over the (path of keys, value) pairs for all the values in a
+    possibly-nested dictionary. Empty nested dictionaries are yielded as
+    leaves themselves, so that the structure can be rebuilt. """
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            for leaf in _iter_leaves(value, key_path + (key, )):
+                yield leaf
+        else:
+            yield key_path + (key, ), value
+
+
+def _is_empty_dict(value):
+    return isinstance(value, dict) and not value
+
+
+def _apply(func, data, func_kws):
+    """ Module-level wrapper so that functions applied by
+    `Experiment.apply_to_all` can be shipped to a process pool. """
+    return func(data, **func_kws)
+
+
+def _scan_case(field, paths, nbytes, time_dim='time'):
+    """ Summarize a field in a case's output files from their headers, for
+    `Experiment.inventory`; like `_load_case`, this lives at the module
+    level so that it can be shipped to a process pool, and records errors
+    rather than raising them. """
+    row = dict(present=False, shape=None, time_start=None, time_end=None,
+               n_files=len(paths), nbytes=nbytes, error=None)
+    if not paths:
+        return row
+
+    try:
+        shape = None
+        for path in paths:
+            meta = get_metadata(path)
+            if field not in meta.variables:
+                return row
+            v = meta.variables[field]
+            if shape is None:
+                shape, dims = list(v['shape']), v['dims']
+            elif time_dim in dims:
+                shape[dims.index(time_dim)] += v['shape'][dims.index(time_dim)]
+
+            time_range = meta.time_range(time_dim)
+            if time_range is not None:
+                if row['time_start'] is None:
+                    row['time_start'] = time_range[0]
+                row['time_end'] = time_range[1]
+        row['present'] = True
+        row['shape'] = tuple(shape)
+    except Exception as e:
+        row['error'] = "{}: {}".format(type(e).__name__, e)
+
+    return row
+
+
+def _load_case(field, path_to_file, case_kws, fix_times=False,
+               preprocess=None, load_kws={}, eager=False):
+    """ Load and pre-process a single case's dataset. This lives at the
+    module level so that it can be shipped to a process pool; any errors are
+    returned rather than raised so that the caller can decide how to handle a
+    failed case. A list of files is interpreted as the timeslice output for
+    that case. If `eager`, the data is also read into memory. """
+    try:
+        if isinstance(path_to_file, basestring):
+            ds = load_variable(field, path_to_file, fix_times=fix_times,
+                               **load_kws)
+        else:
+            ds = load_timeslice(field, path_to_file, fix_times=fix_times,
+                                **load_kws)
+
+        if preprocess is not None:
+            ds = preprocess(ds, **case_kws)
+
+        if eager:
+            ds = ds.load()
+    except Exception as e:
+        return e
+
+    return ds
+
+
+def _accumulate_cases(field, cases, factory, fix_times=False,
+                      preprocess=None, load_kws={}):
+    """ Load each of a batch of cases in turn and fold its data into the
+    accumulator for its group, built with `factory`; each case is released
+    before the next is loaded. Returns the accumulators for each group along
+    with the first case's DataArray, as a prototype for the result. Cases
+    which can't be loaded are skipped. """
+    groups = OrderedDict()
+    proto = None
+    for key, case_kws, path in cases:
+        ds = _load_case(field, path, case_kws, fix_times, preprocess,
+                        load_kws, eager=True)
+        if isinstance(ds, Exception):
+            logger.warning("Could not load case %r" % case_kws)
+            continue
+        da = ds[field]
+        if proto is None:
+            proto = da
+        if key not in groups:
+            groups[key] = factory()
+        groups[key].update(da.values)
+    return groups, proto
+
+
+def _load_case_fields(fields, paths, case_kws, timeseries=True,
+                      fix_times=False, preprocess=None, field_load_kws=None,
+                      merge=True):
+    """ Load and pre-process several fields from a single case. For
+    timeseries output, `paths` holds the file for each field, and the
+    coordinates shared with the first file are taken from its cached
+    metadata rather than decoded again; the fields are merged into one
+    Dataset (with an outer join, in case their coordinates differ) only if
+    `merge`, and otherwise returned as a dictionary of each field's Dataset.
+    For timeslice output, `paths` holds the case's timeslice files, which are
+    all scanned just once into one Dataset. `field_load_kws` holds the
+    loading keywords for each field. As with :func:`_load_case`, any errors
+    are returned rather than raised. """
+    if field_load_kws is None:
+        field_load_kws = [{} for field in fields]
+    try:
+        if timeseries:
+            datasets = OrderedDict()
+            for i, (field, path) in enumerate(zip(fields, paths)):
+                kws = dict(field_load_kws[i])
+                if i > 0:
+                    kws.setdefault('coords_from', paths[0])
+                datasets[field] = load_variable(field, path,
+                                                fix_times=fix_times, **kws)
+            if not merge:
+                if preprocess is not None:
+                    datasets = OrderedDict(
+                        (field, preprocess(ds, **case_kws))
+                        for field, ds in datasets.items()
+                    )
+                return datasets
+            ds = xr.merge(datasets.values(), join='outer',
+                          compat='no_conflicts', combine_attrs='override')
+        else:
+            ds = load_timeslice(fields, paths, fix_times=fix_times,
+                                **field_load_kws[0])
+        ds = ds[fields]
+
+        if preprocess is not None:
+            ds = preprocess(ds, **case_kws)
+    except Exception as e:
+        return e
+
+    return ds
+
+
 class SingleCaseExperiment(Experiment):
     """ Special case of Experiment where only a single model run
     is to be analyzed.
@@ -647,3 +2255,6 @@ class SingleCaseExperiment(Experiment):
         """
 
         return self.data_dir
+
+    def _compile_path_template(self):
+        return PathTemplate(self.case_path)
@@ -0,0 +1,170 @@
+"""
+Persistent index of the files comprising an Experiment's archive.
+
+On large parallel file systems, simply checking whether a file exists can be
+expensive, and an Experiment may need to do so for every one of its cases
+each time it's validated or walked. A :class:`FileIndex` records the size and
+modification time of every file in each case directory, so that these lookups
+can be answered from memory. It can be saved as a small JSON sidecar next to
+an Experiment's YAML configuration, and refreshed incrementally by re-scanning
+only the directories which have changed since it was built.
+
+"""
+import json
+import os
+
+from . import logger
+
+#: Version of the on-disk index format
+INDEX_VERSION = 1
+
+
+def index_path(yaml_path):
+    """ Return the path of the index sidecar for a given YAML file. """
+    return os.path.splitext(yaml_path)[0] + ".index.json"
+
+
+def _scan_dir(path):
+    """ Record the modification time of a directory and the size and
+    modification time of every file it contains. Returns None if the
+    directory doesn't exist. """
+    try:
+        dir_mtime = os.stat(path).st_mtime
+        files = {}
+        for entry in os.scandir(path):
+            if entry.is_file():
+                st = entry.stat()
+                files[entry.name] = [st.st_size, st.st_mtime]
+    except (IOError, OSError):
+        return None
+    return dict(mtime=dir_mtime, files=files)
+
+
+class FileIndex(object):
+    """ Index of the files in the case directories of an Experiment.
+
+    Directories are recorded relative to the Experiment's `data_dir`, and
+    only these relative paths are saved; the root of the archive is taken
+    from the Experiment which the index is attached to, so the index remains
+    valid if the entire archive is moved.
+
+    Note that replacing a file in-place doesn't update the modification time
+    of its directory, so :meth:`refresh` won't notice it; use
+    ``refresh(full=True)`` if files may have been modified in this way.
+
+    """
+
+    def __init__(self, root=None, dirs=None):
+        """
+        Parameters
+        ----------
+        root : str (optional)
+            Path to the root directory of the archive being indexed; this is
+            set to the `data_dir` of an Experiment when the index is attached
+            to it
+        dirs : dict (optional)
+            Mapping of relative directory paths to their recorded contents
+
+        """
+        self.root = root
+        self._dirs = {} if dirs is None else dirs
+
+    @classmethod
+    def build(cls, exp):
+        """ Create an index by scanning all of the case directories in an
+        Experiment. """
+        logger.debug("Building file index for {}".format(exp.name))
+        index = cls(exp.data_dir)
+        for path in exp._walk_cases():
+            index.add_dir(path)
+        return index
+
+    def _key(self, path):
+        return os.path.normpath(
+            os.path.relpath(os.path.join(self.root, path), self.root)
+        )
+
+    def add_dir(self, path):
+        """ Scan a directory (relative to the index root) and add it to the
+        index. """
+        key = self._key(path)
+        self._dirs[key] = _scan_dir(os.path.join(self.root, key))
+
+    def refresh(self, full=False):
+        """ Update the index, re-scanning only those directories whose
+        modification time has changed (or all of them, if `full`).
+
+        Returns
+        -------
+        List of the directories which were re-scanned
+
+        """
+        refreshed = []
+        for key, entry in self._dirs.items():
+            if not full:
+                try:
+                    mtime = os.stat(os.path.join(self.root, key)).st_mtime
+                except (IOError, OSError):
+                    mtime = None
+                old_mtime = None if entry is None else entry['mtime']
+                if mtime == old_mtime:
+                    continue
+            refreshed.append(key)
+
+        for key in refreshed:
+            logger.debug("   re-scanning " + key)
+            self._dirs[key] = _scan_dir(os.path.join(self.root, key))
+
+        return refreshed
+
+    def has_dir(self, path):
+        """ Check if a directory was present when it was indexed. """
+        return self._dirs.get(self._key(path)) is not None
+
+    def stat(self, path):
+        """ Return the (size, mtime) of a file in the index, or None if it
+        doesn't exist. Files in directories which were never indexed are
+        looked up on disk directly. """
+        dirname, fn = os.path.split(path)
+        key = self._key(dirname)
+        if key not in self._dirs:
+            try:
+                st = os.stat(os.path.join(self.root, path))
+            except (IOError, OSError):
+                return None
+            return st.st_size, st.st_mtime
+
+        entry = self._dirs[key]
+        if (entry is None) or (fn not in entry['files']):
+            return None
+        return tuple(entry['files'][fn])
+
+    def exists(self, path):
+        """ Check if a file is present in the index. """
+        return self.stat(path) is not None
+
+    def to_dict(self):
+        return dict(version=INDEX_VERSION, dirs=self._dirs)
+
+    def save(self, path):
+        """ Write this index to a JSON file. """
+        logger.info("Writing file index to " + path)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path, root=None):
+        """ Read an index from a JSON file, for the archive at `root`. """
+        logger.info("Reading file index from " + path)
+        with open(path, 'r') as f:
+            d = json.load(f)
+        if d.get('version') != INDEX_VERSION:
+            raise ValueError("Unsupported file index version {}"
+                             .format(d.get('version')))
+        return cls(root, d['dirs'])
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def __repr__(self):
+        return "FileIndex({!r}, {} directories)".format(self.root, len(self))
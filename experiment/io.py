@@ -1,28 +1,112 @@
+import re
+import warnings
 
+import numpy as np
 import xarray as xr
 
+from . metadata import get_metadata
+
 import logging
 logger = logging.getLogger()
 
+#: Hack for Py2/3 basestring type compatibility
+if 'basestring' not in globals():
+    basestring = str
+
+#: Attributes which reference other variables associated with a variable
+_REFERENCE_ATTRS = ['coordinates', 'bounds']
+
+#: Magic numbers of the netCDF3 formats which can be memory-mapped
+_NETCDF3_MAGIC = (b'CDF\x01', b'CDF\x02')
+
+#: Keywords handled by the loaders here, rather than passed to xarray when
+#: opening a file
+_LOADER_KWS = ('squeeze', 'fix_times', 'coords_from', 'mmap', 'chunks',
+               'drop_variables')
+
+#: Pattern for CF time units, e.g. "days since 0001-01-01 00:00:00"
+_TIME_UNITS = re.compile(r"^\s*(\w+)\s+since\s+(-?\d+)(.*)$")
+
+
+def scan_header(path_to_file):
+    """ Read the names, dimensions and references to other variables (via
+    "coordinates" or "bounds" attributes) of every variable in a netCDF
+    file, without decoding any of them.
+
+    The results come from the package's metadata cache, so the file is only
+    scanned again if it's modified.
+
+    Returns
+    -------
+    A dictionary mapping variable names to a tuple of their dimensions and
+    a dictionary of any referencing attributes.
+
+    """
+    meta = get_metadata(path_to_file, coords=False)
+    header = {}
+    for name, v in meta.variables.items():
+        attrs = {attr: v['attrs'][attr] for attr in _REFERENCE_ATTRS
+                 if attr in v['attrs']}
+        header[name] = (v['dims'], attrs)
+    return header
+
+
+def squeeze_drop_variables(header, var_name):
+    """ Determine which variables in a file can be dropped when loading only
+    the given variable (or list of variables); that is, everything except the
+    variables themselves, their coordinates, and their bounds. """
+    keep = set()
+    if isinstance(var_name, basestring):
+        to_visit = [var_name, ]
+    else:
+        to_visit = list(var_name)
+    while to_visit:
+        name = to_visit.pop()
+        if (name in keep) or (name not in header):
+            continue
+        keep.add(name)
+        dims, attrs = header[name]
+        to_visit.extend(dims)
+        for attr in _REFERENCE_ATTRS:
+            to_visit.extend(str(attrs.get(attr, "")).split())
+
+    return [name for name in header if name not in keep]
+
 def load_variable(var_name, path_to_file, squeeze=False,
-                  fix_times=True, **extr_kwargs):
+                  fix_times=False, coords_from=None, mmap=False,
+                  **extr_kwargs):
     """ Interface for loading an extracted variable into memory, using
     either iris or xarray. If `path_to_file` is instead a raw dataset,
     then the entire contents of the file will be loaded!
 
     Parameters
     ----------
-    var_name : string
-        The name of the variable to load
+    var_name : string or list of strings
+        The name of the variable to load, or several variables
     path_to_file : string
         Location of file containing variable
     squeeze : bool
         Load only the requested field (ignore all others) and
-        associated dims
+        associated dims, coordinates and bounds
     fix_times : bool
         Correct the timestamps to the middle of the bounds
         in the variable metadata (CESM puts them at the right
-        boundary which sucks!)
+        boundary which sucks!) and lazily decode the dataset
+        according to the CF conventions; see :func:`fix_cf_times`.
+        Otherwise (the default), the raw values in the file are returned.
+    coords_from : string (optional)
+        Location of a prototype file (such as another case in the same
+        ensemble) with identical dimension coordinates. Rather than
+        decoding the coordinates in this file, the prototype's values are
+        re-used (from the metadata cache) for those which are identical in
+        both files. Coordinates along unlimited or time dimensions are
+        always read from this file.
+    mmap : bool
+        If the file is in the classic netCDF3 format, memory-map it and
+        expose its variables as read-only views of the mapping rather than
+        copying them into new buffers; see :func:`open_mmap`. Other formats
+        are read as usual. Other than `chunks`, no additional `extr_kwargs`
+        can be used with this option.
     extr_kwargs : dict
         Additional keyword arguments to pass to the extractor
 
@@ -30,38 +114,403 @@ def load_variable(var_name, path_to_file, squeeze=False,
 
     logger.info("Loading %s from %s" % (var_name, path_to_file))
 
-    ds = xr.open_dataset(path_to_file, decode_cf=False, **extr_kwargs)
-
-    # TODO: Revise this logic as part of generalizing time post-processing.
-    # Fix time unit, if necessary
-    # interval, timestamp = ds.time.units.split(" since ")
-    # timestamp = timestamp.split(" ")
-    # yr, mm, dy = timestamp[0].split("-")
-    #
-    # if int(yr) < 1650:
-    #     yr = 2001
-    # yr = str(yr)
-    #
-    # # Re-construct at Jan 01, 2001 and re-set
-    # timestamp[0] = "-".join([yr, mm, dy])
-    # new_units = " ".join([interval, "since"] + timestamp)
-    # ds.time.attrs['units'] = new_units
-
-    # TODO: Generalize time post-processing.
-    # if fix_times:
-    #     assert hasattr(ds, 'time_bnds')
-    #     bnds = ds.time_bnds.values
-    #     mean_times = np.mean(bnds, axis=1)
-    #
-    #     ds.time.values = mean_times
+    drop_vars = list(extr_kwargs.pop('drop_variables', []))
+    if squeeze:
+        header = scan_header(path_to_file)
+        drop_vars.extend(squeeze_drop_variables(header, var_name))
+
+    shared_coords = {}
+    if coords_from is not None:
+        proto = get_metadata(coords_from)
+        meta = get_metadata(path_to_file)
+        for name, values in proto.coords.items():
+            if (name in drop_vars) or (name not in meta.coords) or \
+               _is_record_coord(name, proto) or _is_record_coord(name, meta):
+                continue
+            attrs = proto.variables[name]['attrs']
+            # Only re-use coordinates which are actually identical
+            if np.array_equal(values, meta.coords[name]) and \
+               _attrs_equal(attrs, meta.variables[name]['attrs']):
+                shared_coords[name] = (name, values, attrs)
+        drop_vars.extend(shared_coords)
+
+    if mmap:
+        # The mapped variables are never decoded, so the only xarray
+        # option which still applies is their chunking
+        unsupported = sorted(set(extr_kwargs) - {'chunks', })
+        if unsupported:
+            raise ValueError("Can't use {} when memory-mapping files"
+                             .format(unsupported))
+
+    mmap_chunks = None
+    if mmap and is_netcdf3(path_to_file):
+        ds = open_mmap(path_to_file, drop_variables=drop_vars)
+        # Chunk only once the variables are decoded, since decoding wraps
+        # the (big-endian) mapped data in a lazy array of its own
+        mmap_chunks = extr_kwargs.get('chunks')
+    else:
+        if mmap:
+            logger.debug("{} isn't a netCDF3 file; can't memory-map it"
+                         .format(path_to_file))
+        if drop_vars:
+            extr_kwargs['drop_variables'] = drop_vars
+        ds = xr.open_dataset(path_to_file, decode_cf=False, **extr_kwargs)
+    if shared_coords:
+        ds = ds.assign_coords(shared_coords)
 
     # Be pedantic and check that we don't have a "missing_value" attr
     for field in ds:
         if hasattr(ds[field], 'missing_value'):
             del ds[field].attrs['missing_value']
 
-    # Lazy decode CF
-    # TODO: There's potentially a bug where decode_cf eagerly loads dask arrays
-    # ds = xr.decode_cf(ds)
+    if fix_times:
+        ds = fix_cf_times(ds)
+    if mmap_chunks is not None:
+        ds = ds.chunk(mmap_chunks)
 
     return ds
+
+
+def _attrs_equal(a, b):
+    """ Compare two dictionaries of variable attributes, treating NaN values
+    (such as xarray's default `_FillValue` for floats) as equal to each other
+    and comparing array-valued attributes element-wise. """
+    if set(a) != set(b):
+        return False
+    for key, value in a.items():
+        try:
+            same = np.array_equal(value, b[key], equal_nan=True)
+        except TypeError:
+            # Non-numeric values (such as strings) can't be checked for NaNs
+            same = np.array_equal(value, b[key])
+        if not same:
+            return False
+    return True
+
+
+def _is_record_coord(name, meta):
+    """ Check if a coordinate runs along a record dimension (an unlimited
+    dimension, or time), whose values differ from file to file. """
+    units = meta.variables[name]['attrs'].get('units', '')
+    return (name in meta.unlimited) or \
+        bool(_TIME_UNITS.match(str(units)))
+
+
+def is_netcdf3(path_to_file):
+    """ Check if a file is in one of the classic netCDF3 formats (CDF-1 or
+    CDF-2) which can be memory-mapped, based on its magic number. """
+    try:
+        with open(path_to_file, 'rb') as f:
+            magic = f.read(4)
+    except (IOError, OSError):
+        return False
+    return magic in _NETCDF3_MAGIC
+
+
+def _decode_attr(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _nc_attrs(obj):
+    """ Return the decoded attributes of a scipy netcdf_file or variable.
+    scipy doesn't expose these as a mapping, other than through the private
+    `_attributes` (the same approach taken by xarray's scipy backend), so
+    fall back to no attributes if that ever disappears. """
+    return {k: _decode_attr(val)
+            for k, val in getattr(obj, '_attributes', {}).items()}
+
+
+def open_mmap(path_to_file, drop_variables=None):
+    """ Open a classic netCDF3 file by memory-mapping it, without decoding
+    any of its variables.
+
+    Every variable in the returned dataset is a read-only NumPy view into
+    the mapped file, so nothing is actually read until it's accessed and
+    no copies are made. Since the pages of the file are shared through the
+    operating system's page cache, many processes reading the same files
+    share a single physical copy of their data. The mapping remains open
+    for as long as any of the variables are referenced.
+
+    Parameters
+    ----------
+    path_to_file : string
+        Location of a netCDF3 file
+    drop_variables : list of strings (optional)
+        Variables in the file to skip
+
+    """
+    from scipy.io import netcdf_file
+
+    drop_variables = set([] if drop_variables is None else drop_variables)
+
+    nc = netcdf_file(path_to_file, 'r', mmap=True)
+    variables = {}
+    for name, v in nc.variables.items():
+        if name in drop_variables:
+            continue
+        variables[name] = xr.Variable(v.dimensions, v.data, _nc_attrs(v))
+    attrs = _nc_attrs(nc)
+
+    # Closing the file only releases its descriptor; the mapping itself is
+    # kept alive by the views into it, which scipy warns about.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        nc.close()
+
+    coords = {name: v for name, v in variables.items()
+              if v.dims == (name, )}
+    data_vars = {name: v for name, v in variables.items()
+                 if name not in coords}
+    ds = xr.Dataset(data_vars, coords, attrs)
+    ds.encoding['source'] = path_to_file
+    return ds
+
+
+def _fix_reference_year(units, min_year=1650, new_year=2001):
+    """ Replace the reference year in a CF time units string (e.g. "days
+    since 0001-01-01") if it's earlier than `min_year`. """
+    match = _TIME_UNITS.match(units)
+    if match is None:
+        return units
+    interval, yr, rest = match.groups()
+    if int(yr) < min_year:
+        yr = str(new_year)
+    return "{} since {}{}".format(interval, yr, rest)
+
+
+def fix_cf_times(ds, time_dim='time', midpoints=True, decode=True):
+    """ Post-process the timestamps in a raw (undecoded) dataset.
+
+    CESM labels each averaged time interval with the timestamp at its right
+    boundary, and often uses reference years (such as year 0 or 1) which
+    can't be represented by standard datetimes. This
+
+    1. re-sets the timestamps to the middle of their bounds, if a bounds
+       variable is available,
+    2. moves any reference year before 1650 to 2001, and
+    3. decodes the dataset according to the CF conventions.
+
+    Only the time coordinate and its bounds are read to do so, and the
+    decoding is applied lazily, so no data variables are read into memory.
+
+    Parameters
+    ----------
+    ds : Dataset
+        A dataset opened with ``decode_cf=False``
+    time_dim : str
+        The name of the time coordinate
+    midpoints : bool
+        Re-set the timestamps to the middle of their bounds
+    decode : bool
+        Decode the dataset according to the CF conventions
+
+    """
+    if time_dim in ds.variables:
+        time = ds[time_dim]
+        attrs = dict(time.attrs)
+        values = time.values
+
+        bnds_name = attrs.get('bounds', time_dim + '_bnds')
+        if midpoints and (bnds_name in ds.variables):
+            bnds = ds[bnds_name]
+            if bnds.dims[0] == time_dim and bnds.ndim == 2:
+                values = np.asarray(bnds.values).mean(axis=1)
+            else:
+                logger.debug("Can't interpret time bounds with dims {}"
+                             .format(bnds.dims))
+        elif midpoints:
+            logger.debug("No time bounds found; timestamps unchanged")
+
+        if 'units' in attrs:
+            attrs['units'] = _fix_reference_year(attrs['units'])
+        ds = ds.assign_coords({time_dim: (time.dims, values, attrs)})
+        ds[time_dim].encoding = time.encoding
+
+        if (bnds_name in ds.variables) and ('units' in ds[bnds_name].attrs):
+            ds[bnds_name].attrs['units'] = attrs['units']
+
+    if decode:
+        ds = xr.decode_cf(ds)
+
+    return ds
+
+
+def load_timeslice(var_name, paths, concat_dim='time', fix_times=False,
+                   **extr_kwargs):
+    """ Lazily load a variable from a sequence of "timeslice" files, each of
+    which holds one or more snapshots of every output field, and concatenate
+    them along `concat_dim`.
+
+    Only the first file is fully opened, as a prototype for the structure of
+    the requested field. From the rest only the variables along `concat_dim`
+    (e.g. the timestamps) are read, and the field itself is wrapped in a lazy
+    dask array. No file is held open after its data is read, so this can
+    scale to a very large number of files.
+
+    Parameters
+    ----------
+    var_name : string or list of strings
+        The name of the variable to load, or of several variables to load
+        at once (sharing the work of reading the prototype and timestamps)
+    paths : list of strings
+        The timeslice files containing the variable, in order
+    concat_dim : string
+        The name of the dimension to concatenate along
+    fix_times, extr_kwargs :
+        See :func:`load_variable`
+
+    """
+    import dask.array as da
+
+    var_names = [var_name, ] if isinstance(var_name, basestring) \
+        else list(var_name)
+
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files to load %s from" % var_name)
+
+    logger.info("Loading %s from %d timeslice files" % (var_name, len(paths)))
+
+    extr_kwargs['squeeze'] = True
+    proto = load_variable(var_names, paths[0], fix_times=False,
+                          **extr_kwargs)
+    proto = proto[var_names]
+    concat_names = [v for v in var_names if concat_dim in proto[v].dims]
+    if (len(paths) == 1) or not concat_names:
+        return fix_cf_times(proto, concat_dim) if fix_times else proto
+
+    # Read just the coordinates defined along the concatenation dimension
+    # from every file; everything else is dropped before it's decoded.
+    slice_vars = [v for v in proto.variables
+                  if (concat_dim in proto[v].dims) and (v not in var_names)]
+    open_kws = open_dataset_kws(extr_kwargs)
+    open_kws['decode_cf'] = False
+
+    slices = []
+    for path in paths:
+        # The headers may differ between files, so drop per file
+        drop_vars = [v for v in scan_header(path) if v not in slice_vars]
+        with xr.open_dataset(path, drop_variables=drop_vars,
+                             **open_kws) as ds:
+            slices.append(ds[slice_vars].load())
+
+    ds_slices = xr.concat(slices, dim=concat_dim)
+    ds_new = proto.drop_vars(slice_vars + concat_names)
+    ds_new = ds_new.assign_coords({v: ds_slices[v] for v in slice_vars})
+
+    # Build each lazy field, one block per file
+    chunks = extr_kwargs.get('chunks')
+    for name in concat_names:
+        proto_da = proto[name]
+        axis = proto_da.get_axis_num(concat_dim)
+        arrays = []
+        for path, ds_slice in zip(paths, slices):
+            shape = list(proto_da.shape)
+            shape[axis] = ds_slice.sizes[concat_dim]
+            if isinstance(chunks, dict):
+                file_chunks = tuple(min(chunks.get(dim, size), size)
+                                    for dim, size in zip(proto_da.dims, shape))
+            else:
+                file_chunks = chunks
+            arrays.append(open_lazy(path, name, shape, proto_da.dtype,
+                                    chunks=file_chunks, **extr_kwargs))
+        data = da.concatenate(arrays, axis=axis)
+
+        ds_new[name] = (proto_da.dims, data, proto_da.attrs)
+        ds_new[name].encoding = proto_da.encoding
+
+    # Post-process the times only after every slice has been combined, so
+    # that the same decoding is applied to all of them
+    if fix_times:
+        ds_new = fix_cf_times(ds_new, concat_dim)
+
+    return ds_new[var_names]
+
+
+def open_dataset_kws(load_kws):
+    """ Return the keywords from a set of loader keywords (see
+    :func:`load_variable`) which should be passed on to
+    :func:`xarray.open_dataset`. """
+    return {key: val for key, val in load_kws.items()
+            if key not in _LOADER_KWS}
+
+
+def open_lazy(path_to_file, var_name, shape, dtype, chunks=None,
+              decode_cf=False, **load_kws):
+    """ Create a dask array which lazily reads a variable from a file,
+    given its (already known) shape and dtype. The file isn't touched until
+    the array is computed.
+
+    Parameters
+    ----------
+    path_to_file : string
+        Location of file containing variable
+    var_name : string
+        The name of the variable to read
+    shape : tuple of ints
+        The shape of the variable
+    dtype : numpy.dtype
+        The data type of the variable
+    chunks : tuple or int (optional)
+        The chunking to use for the dask array; by default the entire
+        variable is read as a single block
+    decode_cf : bool
+        Apply the CF conventions when reading the variable
+    load_kws : dict
+        Additional keywords used to load the variable eagerly (such as
+        `engine`), which are also used to open the file when it's read
+
+    """
+    import dask.array as da
+    from dask.base import tokenize
+
+    open_kws = open_dataset_kws(load_kws)
+    lazy = LazyFileArray(path_to_file, var_name, shape, dtype,
+                         decode_cf=decode_cf, open_kws=open_kws)
+    if chunks is None:
+        chunks = lazy.shape
+    name = "open-{}-{}".format(
+        var_name, tokenize(path_to_file, var_name, lazy.shape, decode_cf,
+                           sorted(open_kws.items()))
+    )
+    return da.from_array(lazy, chunks=chunks, meta=np.ndarray, name=name)
+
+
+class LazyFileArray(object):
+    """ Array-like wrapper which reads a variable from a file only when it is
+    indexed, for use as the source of a lazy dask array. The file is opened
+    and closed again on each access, so that no file handles are kept open
+    between computations.
+
+    """
+
+    def __init__(self, path, var_name, shape, dtype, decode_cf=False,
+                 open_kws=None):
+        self.path = path
+        self.var_name = var_name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.decode_cf = decode_cf
+        self.open_kws = {} if open_kws is None else dict(open_kws)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __getitem__(self, key):
+        open_kws = dict(decode_cf=self.decode_cf)
+        open_kws.update(self.open_kws)
+        # Skip decoding everything else in this particular file
+        drop_vars = squeeze_drop_variables(scan_header(self.path),
+                                           self.var_name)
+        with xr.open_dataset(self.path, drop_variables=drop_vars,
+                             **open_kws) as ds:
+            return np.asarray(ds.variables[self.var_name][key].values,
+                              dtype=self.dtype)
+
+    def __repr__(self):
+        return "LazyFileArray({!r}, {!r}, shape={})".format(
+            self.path, self.var_name, self.shape
+        )
@@ -0,0 +1,324 @@
+"""
+Cache of the metadata in the headers of netCDF files.
+
+The cases in an ensemble usually share identical dimensions, coordinates and
+attributes, but every time a file is opened its header has to be parsed and
+decoded all over again. A :class:`MetadataCache` records the dimensions,
+coordinate values, and variable attributes and encodings of each file it
+scans, keyed on the file's path, modification time and size so that stale
+entries are never used. The cache can be saved to disk (as JSON) and
+re-loaded in a later session.
+
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from . import logger
+
+#: Version of the on-disk cache format
+CACHE_VERSION = 2
+
+#: Maximum number of files held in the package-wide cache
+DEFAULT_MAX_ENTRIES = 10000
+
+# The netCDF-C and HDF5 libraries aren't thread-safe, so all access through
+# netCDF4 must share the lock which xarray uses for the same purpose.
+try:
+    from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK as _NETCDF4_LOCK
+except ImportError:
+    _NETCDF4_LOCK = threading.Lock()
+
+
+class FileMetadata(object):
+    """ The metadata from the header of a single netCDF file.
+
+    Attributes
+    ----------
+    dims : dict
+        Mapping of dimension names to their sizes
+    variables : dict
+        Mapping of variable names to dictionaries with their "dims", "shape",
+        "dtype", "attrs" and "encoding"
+    coords : dict or None
+        Mapping of the names of dimension coordinates to their (raw,
+        undecoded) values, or None if they weren't read
+    attrs : dict
+        The global attributes of the file
+    unlimited : tuple
+        The names of the file's unlimited (record) dimensions
+
+    """
+
+    def __init__(self, dims, variables, coords=None, attrs=None,
+                 unlimited=()):
+        self.dims = dims
+        self.variables = variables
+        self.coords = coords
+        self.attrs = {} if attrs is None else attrs
+        self.unlimited = tuple(unlimited)
+
+    def to_dict(self):
+        return dict(dims=self.dims, variables=self.variables,
+                    coords=self.coords, attrs=self.attrs,
+                    unlimited=self.unlimited)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def to_dataset(self):
+        """ Build a Dataset with the coordinates recorded in this metadata,
+        but none of the data variables. """
+        if self.coords is None:
+            raise ValueError("Coordinates weren't read for this file")
+        ds = xr.Dataset(attrs=self.attrs)
+        for name, values in self.coords.items():
+            ds.coords[name] = (name, values, self.variables[name]['attrs'])
+        return ds
+
+    def time_range(self, time_dim='time'):
+        """ Return the first and last values of the time coordinate,
+        decoded according to its units and calendar if possible, or None if
+        there isn't one. """
+        if (self.coords is None) or (time_dim not in self.coords):
+            return None
+        values = self.coords[time_dim]
+        if not len(values):
+            return None
+        attrs = self.variables[time_dim]['attrs']
+        ends = xr.Dataset({time_dim: (time_dim, values[[0, -1]], attrs)})
+        try:
+            ends = xr.decode_cf(ends)
+        except Exception:
+            logger.debug("Couldn't decode {} values".format(time_dim))
+        start, end = ends[time_dim].values
+        return start, end
+
+    def __repr__(self):
+        return "FileMetadata(dims={}, {} variables)".format(
+            self.dims, len(self.variables)
+        )
+
+
+def _scan_netcdf4(path_to_file, coords=True):
+    import netCDF4
+
+    with _NETCDF4_LOCK, netCDF4.Dataset(path_to_file) as nc:
+        nc.set_auto_maskandscale(False)
+        dims = {name: len(dim) for name, dim in nc.dimensions.items()}
+        variables = {}
+        coord_vals = {} if coords else None
+        for name, v in nc.variables.items():
+            encoding = dict(v.filters() or {})
+            # netCDF3 files have no chunking information at all
+            chunking = v.chunking()
+            encoding['contiguous'] = chunking in ('contiguous', None)
+            if not encoding['contiguous']:
+                encoding['chunksizes'] = tuple(chunking)
+            variables[name] = dict(
+                dims=tuple(v.dimensions), shape=tuple(v.shape),
+                dtype=np.dtype(v.dtype).str,
+                attrs={attr: v.getncattr(attr) for attr in v.ncattrs()},
+                encoding=encoding,
+            )
+            if coords and (v.dimensions == (name, )):
+                coord_vals[name] = np.asarray(v[:])
+        attrs = {attr: nc.getncattr(attr) for attr in nc.ncattrs()}
+        unlimited = [name for name, dim in nc.dimensions.items()
+                     if dim.isunlimited()]
+        return FileMetadata(dims, variables, coord_vals, attrs, unlimited)
+
+
+def _scan_xarray(path_to_file, coords=True):
+    with xr.open_dataset(path_to_file, decode_cf=False) as ds:
+        variables = {}
+        coord_vals = {} if coords else None
+        for name, v in ds.variables.items():
+            variables[name] = dict(
+                dims=tuple(v.dims), shape=tuple(v.shape), dtype=v.dtype.str,
+                attrs=dict(v.attrs), encoding=dict(v.encoding),
+            )
+            if coords and (v.dims == (name, )):
+                coord_vals[name] = v.values
+        return FileMetadata(dict(ds.sizes), variables, coord_vals,
+                            dict(ds.attrs),
+                            ds.encoding.get('unlimited_dims', ()))
+
+
+def scan_file(path_to_file, coords=True):
+    """ Read the metadata from the header of a netCDF file, using netCDF4
+    directly if it's available, otherwise xarray.
+
+    Parameters
+    ----------
+    path_to_file : str
+        The file to scan
+    coords : bool
+        Also read the values of the file's dimension coordinates
+
+    """
+    try:
+        return _scan_netcdf4(path_to_file, coords)
+    except (ImportError, OSError):
+        return _scan_xarray(path_to_file, coords)
+
+
+def _encode(obj):
+    """ Convert the contents of a metadata record into JSON-serializable
+    types, tagging arrays and tuples so they can be restored. """
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': obj.tolist(), 'dtype': obj.dtype.str}
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, bytes):
+        return obj.decode('utf-8', 'replace')
+    elif isinstance(obj, tuple):
+        return {'__tuple__': [_encode(v) for v in obj]}
+    elif isinstance(obj, list):
+        return [_encode(v) for v in obj]
+    elif isinstance(obj, dict):
+        return {k: _encode(v) for k, v in obj.items()}
+    return obj
+
+
+def _decode(obj):
+    """ Inverse of :func:`_encode`. """
+    if isinstance(obj, dict):
+        if '__ndarray__' in obj:
+            return np.array(obj['__ndarray__'], dtype=obj['dtype'])
+        elif '__tuple__' in obj:
+            return tuple(_decode(v) for v in obj['__tuple__'])
+        return {k: _decode(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_decode(v) for v in obj]
+    return obj
+
+
+class MetadataCache(object):
+    """ Cache of the metadata of netCDF files, keyed on their path,
+    modification time and size.
+
+    Once the cache holds `max_entries` files, the least-recently-used
+    entries are evicted. The cache can be shared between threads; files
+    are scanned outside of its lock, so several can be read at once.
+
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(path_to_file):
+        st = os.stat(path_to_file)
+        return os.path.abspath(path_to_file), st.st_mtime, st.st_size
+
+    def get(self, path_to_file, coords=True):
+        """ Return the metadata for a file, scanning it if it isn't already
+        in the cache (or has changed since it was cached).
+
+        Parameters
+        ----------
+        path_to_file : str
+            The file to look up
+        coords : bool
+            Require the values of the file's dimension coordinates
+
+        """
+        key = self._key(path_to_file)
+        with self._lock:
+            meta = self._entries.get(key)
+            if (meta is not None) and not (coords and meta.coords is None):
+                self._entries.move_to_end(key)
+                return meta
+
+        meta = scan_file(path_to_file, coords)
+        with self._lock:
+            self._entries[key] = meta
+            self._evict()
+        return meta
+
+    def reserve(self, n_entries):
+        """ Raise `max_entries` (if it's set) so that the cache can hold at
+        least `n_entries` files. """
+        with self._lock:
+            if (self.max_entries is not None) and \
+               (self.max_entries < n_entries):
+                logger.debug("Growing metadata cache to {} files"
+                             .format(n_entries))
+                self.max_entries = n_entries
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        with self._lock:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+
+    def prune(self):
+        """ Remove any entries for files which have since been modified or
+        deleted. """
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            try:
+                current = self._key(key[0])
+            except (IOError, OSError):
+                current = None
+            if current != key:
+                with self._lock:
+                    self._entries.pop(key, None)
+
+    def save(self, path):
+        """ Write this cache to disk, as JSON. """
+        logger.info("Writing metadata cache to " + path)
+        with self._lock:
+            items = list(self._entries.items())
+        entries = [dict(key=list(key), meta=_encode(meta.to_dict()))
+                   for key, meta in items]
+        with open(path, 'w') as f:
+            json.dump(dict(version=CACHE_VERSION, entries=entries), f)
+
+    def load(self, path):
+        """ Read previously cached metadata from disk, merging it into this
+        cache. """
+        logger.info("Reading metadata cache from " + path)
+        with open(path, 'r') as f:
+            d = json.load(f)
+        if d.get('version') != CACHE_VERSION:
+            raise ValueError("Unsupported metadata cache version {}"
+                             .format(d.get('version')))
+        with self._lock:
+            for entry in d['entries']:
+                meta = FileMetadata.from_dict(_decode(entry['meta']))
+                self._entries[tuple(entry['key'])] = meta
+            self._evict()
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "MetadataCache({} files)".format(len(self))
+
+
+#: The cache used by default throughout the package
+default_cache = MetadataCache(max_entries=DEFAULT_MAX_ENTRIES)
+
+
+def get_metadata(path_to_file, coords=True, cache=None):
+    """ Return the metadata for a netCDF file from a MetadataCache (by
+    default, the package-wide `default_cache`). """
+    if cache is None:
+        cache = default_cache
+    return cache.get(path_to_file, coords)
@@ -0,0 +1,147 @@
+"""
+Helpers for distributing work over the cases comprising an Experiment.
+
+Most of the work done by an Experiment (opening files, pre-processing
+datasets, applying diagnostics) is embarrassingly parallel across its cases.
+The functions here provide a single place for translating the `executor` and
+`max_workers` arguments accepted throughout the package into a
+:class:`concurrent.futures.Executor`.
+
+Work can also be handed off to dask, by passing ``executor="dask"`` along
+with an optional dask `scheduler`.
+
+"""
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+#: Hack for Py2/3 basestring type compatibility
+if 'basestring' not in globals():
+    basestring = str
+
+#: Aliases which can be passed as `executor` to request a new worker pool
+EXECUTORS = {
+    'threads': ThreadPoolExecutor,
+    'thread': ThreadPoolExecutor,
+    'processes': ProcessPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+def get_executor(executor=None, max_workers=None):
+    """ Resolve an `executor` argument to an Executor instance.
+
+    Parameters
+    ----------
+    executor : str or Executor (optional)
+        Either the name of a type of worker pool ("threads" or "processes")
+        or an existing Executor instance. If nothing is passed but
+        `max_workers` is, a thread pool is used.
+    max_workers : int (optional)
+        The number of workers to use when creating a new pool.
+
+    Returns
+    -------
+    A tuple of the Executor (or None, if work should be performed serially)
+    and a flag indicating whether the caller is responsible for shutting
+    it down.
+
+    """
+    if executor is None:
+        if max_workers is None:
+            return None, False
+        executor = 'threads'
+
+    if isinstance(executor, Executor):
+        return executor, False
+    elif isinstance(executor, basestring):
+        try:
+            pool_cls = EXECUTORS[executor.lower()]
+        except KeyError:
+            raise ValueError("Unknown executor '{}'; expected one of {}"
+                             .format(executor, sorted(EXECUTORS) + ['dask']))
+        return pool_cls(max_workers=max_workers), True
+    else:
+        raise ValueError("Couldn't interpret executor %r" % executor)
+
+
+def map_ordered(func, iterable, executor=None, max_workers=None,
+                max_pending=None, scheduler=None):
+    """ Apply `func` to every item in `iterable`, possibly concurrently,
+    and yield the results in the same order as the inputs.
+
+    Parameters
+    ----------
+    func : function
+        Function to apply; when using a process pool it must be picklable
+    iterable : iterable of tuples
+        The positional arguments to pass to each invocation of `func`
+    executor, max_workers :
+        See :func:`get_executor`; `executor` can also be "dask", in which
+        case each invocation is wrapped with :func:`dask.delayed`
+    max_pending : int (optional)
+        The maximum number of results to compute ahead of the one which will
+        be yielded next. By default, all of the work is submitted at once;
+        limiting it bounds the number of results held in memory.
+    scheduler : str or dask Client (optional)
+        The dask scheduler to use when `executor` is "dask"
+
+    """
+    if isinstance(executor, basestring) and (executor.lower() == 'dask'):
+        for result in _map_dask(func, iterable, max_pending, scheduler,
+                                max_workers):
+            yield result
+        return
+
+    pool, owned = get_executor(executor, max_workers)
+
+    if pool is None:
+        for args in iterable:
+            yield func(*args)
+        return
+
+    iterable = iter(iterable)
+    futures = deque()
+    try:
+        n_ahead = max_pending if max_pending else None
+        for args in islice(iterable, n_ahead):
+            futures.append(pool.submit(func, *args))
+        while futures:
+            result = futures.popleft().result()
+            for args in islice(iterable, 1):
+                futures.append(pool.submit(func, *args))
+            yield result
+    finally:
+        # If the consumer stopped early, don't bother finishing the rest
+        for future in futures:
+            future.cancel()
+        if owned:
+            pool.shutdown(wait=True)
+
+
+def _map_dask(func, iterable, max_pending=None, scheduler=None,
+              max_workers=None):
+    """ Implementation of :func:`map_ordered` using dask.delayed, computing
+    the results in batches of `max_pending`. """
+    import dask
+
+    compute_kws = {}
+    if scheduler is not None:
+        compute_kws['scheduler'] = scheduler
+    # Only the local schedulers accept a number of workers; a distributed
+    # Client manages its own
+    local = (scheduler is None) or isinstance(scheduler, basestring)
+    if local and (max_workers is not None):
+        compute_kws['num_workers'] = max_workers
+
+    delayed_func = dask.delayed(func, pure=False)
+    iterable = iter(iterable)
+    while True:
+        batch = [delayed_func(*args)
+                 for args in islice(iterable, max_pending)]
+        if not batch:
+            return
+        for result in dask.compute(*batch, **compute_kws):
+            yield result
+        if max_pending is None:
+            return
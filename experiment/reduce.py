@@ -0,0 +1,363 @@
+"""
+Streaming reductions over the cases in an Experiment.
+
+Summarizing an ensemble (say, the mean and spread of a field across one of
+its parameters) doesn't require the whole ensemble at once. Rather than
+stacking every case into a master dataset, the reducers here fold the cases
+into small accumulators one at a time, so that only a single case (plus one
+accumulator for each group of cases being reduced together) is ever held in
+memory. :class:`Moments` accumulates the mean, variance and extremes of
+each element, and :class:`Histogram` a fixed-bin histogram, from which
+approximate quantiles and PDFs are estimated.
+
+Each accumulator can also be merged with another built from a different set
+of cases, so the cases can be split into batches, accumulated separately
+(for instance, in different processes), and then combined.
+
+"""
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+#: Statistics which can be computed by :class:`Moments`
+MOMENT_STATS = ('count', 'mean', 'var', 'std', 'min', 'max')
+
+
+class Moments(object):
+    """ Accumulate the count, mean, variance, minimum and maximum of a
+    sequence of arrays, element-wise.
+
+    The mean and variance are updated with Welford's online algorithm, which
+    is numerically stable even when the variance is small relative to the
+    mean, and two accumulators are merged with the parallel form of the same
+    algorithm (Chan et al., 1979). Missing (NaN) values are ignored.
+
+    """
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def _init(self, shape):
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def update(self, values):
+        """ Add an array of values (all with the same shape) to the
+        accumulated statistics. """
+        values = np.asarray(values, dtype=np.float64)
+        if self.count is None:
+            self._init(values.shape)
+        elif values.shape != self.count.shape:
+            raise ValueError("Expected values with shape {}, got {}"
+                             .format(self.count.shape, values.shape))
+
+        valid = ~np.isnan(values)
+        x = np.where(valid, values, 0.)
+        self.count += valid
+        delta = x - self.mean
+        self.mean += np.where(valid, delta/np.maximum(self.count, 1), 0.)
+        self.m2 += np.where(valid, delta*(x - self.mean), 0.)
+        self.min = np.fmin(self.min, values)
+        self.max = np.fmax(self.max, values)
+        return self
+
+    def merge(self, other):
+        """ Combine the statistics from another accumulator into this
+        one. """
+        if other.count is None:
+            return self
+        if self.count is None:
+            self._init(other.count.shape)
+
+        count = self.count + other.count
+        n = np.maximum(count, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta*(other.count/n)
+        self.m2 = self.m2 + other.m2 + delta**2*(self.count*other.count/n)
+        self.count = count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        return self
+
+    def result(self, stat, ddof=0):
+        """ Return one of the accumulated statistics, with NaN wherever there
+        weren't any (or enough, for the variance) values.
+
+        Parameters
+        ----------
+        stat : str
+            One of "count", "mean", "var", "std", "min" or "max"
+        ddof : int
+            Delta degrees of freedom for the variance and standard deviation
+
+        """
+        if stat == 'count':
+            return self.count.copy()
+        empty = self.count == 0
+        if stat == 'mean':
+            out = self.mean.copy()
+        elif stat in ('var', 'std'):
+            n = self.count - ddof
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out = np.where(n > 0, self.m2/np.maximum(n, 1), np.nan)
+            if stat == 'std':
+                out = np.sqrt(out)
+        elif stat == 'min':
+            out = self.min.copy()
+        elif stat == 'max':
+            out = self.max.copy()
+        else:
+            raise ValueError("Unknown statistic '{}'; expected one of {}"
+                             .format(stat, MOMENT_STATS))
+        out[empty] = np.nan
+        return out
+
+    def __repr__(self):
+        shape = None if self.count is None else self.count.shape
+        return "Moments(shape={})".format(shape)
+
+
+class Histogram(object):
+    """ Accumulate a histogram of a sequence of arrays, element-wise, with
+    fixed bins shared by every element.
+
+    This is a mergeable sketch of the distribution of each element: its
+    memory is bounded by the number of bins regardless of how many arrays
+    are added, two histograms with the same bins are merged by adding their
+    counts, and approximate quantiles are interpolated from the cumulative
+    counts. Values outside the range of the bins are counted separately
+    (and are clamped to the range when computing quantiles), and missing
+    (NaN) values are ignored.
+
+    The counts are stored in the smallest unsigned integer type which can
+    hold the number of arrays added so far, and are promoted as more are
+    added; for an ensemble of a few hundred members, that's two bytes per
+    bin for each element.
+
+    """
+
+    def __init__(self, bins=100, range=None):
+        """
+        Parameters
+        ----------
+        bins : int
+            The number of equal-width bins
+        range : tuple of float
+            The lower and upper edges of the bins
+
+        """
+        if range is None:
+            raise ValueError("A range is required for the histogram bins")
+        lo, hi = range
+        if not hi > lo:
+            raise ValueError("Invalid histogram range {!r}".format(range))
+        self.edges = np.linspace(lo, hi, int(bins) + 1)
+        # The first and last bins hold the values below and above the range
+        self.counts = None
+        # The number of arrays added, which bounds every count
+        self.n = 0
+
+    @property
+    def bins(self):
+        return len(self.edges) - 1
+
+    def update(self, values):
+        """ Add an array of values (all with the same shape) to the
+        histograms. """
+        values = np.asarray(values, dtype=np.float64)
+        n_total = self.bins + 2
+        if self.counts is None:
+            self.counts = np.zeros(values.shape + (n_total, ),
+                                   dtype=_count_dtype(1))
+        elif values.shape != self.counts.shape[:-1]:
+            raise ValueError("Expected values with shape {}, got {}"
+                             .format(self.counts.shape[:-1], values.shape))
+        self.n += 1
+        self._promote()
+
+        index = np.searchsorted(self.edges, values, side='right')
+        # Close the last bin on its right edge
+        index[values == self.edges[-1]] = self.bins
+        valid = ~np.isnan(values)
+        flat = np.arange(values.size).reshape(values.shape)*n_total + index
+        # Each element contributes one count, so the indices are unique
+        self.counts.reshape(-1)[flat[valid]] += 1
+        return self
+
+    def merge(self, other):
+        """ Add the counts from another histogram with the same bins into
+        this one. """
+        if not np.allclose(self.edges, other.edges):
+            raise ValueError("Can't merge histograms with different bins")
+        if other.counts is None:
+            return self
+        self.n += other.n
+        if self.counts is None:
+            self.counts = other.counts.copy()
+        else:
+            self._promote()
+            self.counts += other.counts
+        return self
+
+    def _promote(self):
+        """ Widen the counts, if necessary, to hold `n` values. """
+        dtype = _count_dtype(self.n)
+        if dtype.itemsize > self.counts.dtype.itemsize:
+            self.counts = self.counts.astype(dtype)
+
+    def result(self, stat):
+        """ Return "counts" (for each bin), "underflow", "overflow", "count"
+        (the total number of values) or "density" (the normalized counts
+        in each bin). """
+        # Counts are returned with a common type, whatever the number of
+        # values added to this particular histogram
+        if stat == 'counts':
+            return self.counts[..., 1:-1].astype(np.int64)
+        elif stat == 'underflow':
+            return self.counts[..., 0].astype(np.int64)
+        elif stat == 'overflow':
+            return self.counts[..., -1].astype(np.int64)
+        elif stat == 'count':
+            return self.counts.sum(axis=-1, dtype=np.int64)
+        elif stat == 'density':
+            total = self.counts.sum(axis=-1)[..., None]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return self.counts[..., 1:-1]/(total*np.diff(self.edges))
+        raise ValueError("Unknown histogram result '{}'".format(stat))
+
+    def quantile(self, q):
+        """ Estimate quantiles of the values added to each element, by linear
+        interpolation within the bins of the histogram.
+
+        Parameters
+        ----------
+        q : float or list of floats
+            The quantiles to estimate, between 0 and 1
+
+        Returns
+        -------
+        An array with the shape of the values, plus a trailing dimension for
+        the quantiles; elements without any values are NaN.
+
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if ((q < 0) | (q > 1)).any():
+            raise ValueError("Quantiles must be between 0 and 1")
+
+        counts = self.counts
+        total = counts.sum(axis=-1, dtype=np.int64)
+        cum = np.cumsum(counts, axis=-1, dtype=np.int64)
+        edges = self.edges
+
+        out = np.empty(total.shape + q.shape)
+        for i, qi in enumerate(q):
+            target = qi*total
+            # The (extended) bin holding the target rank; for the 0th
+            # quantile, that's the first non-empty bin
+            k = np.where(target > 0, (cum < target[..., None]).sum(axis=-1),
+                         (cum == 0).sum(axis=-1))
+            k = np.minimum(k, self.bins + 1)
+            prev = np.where(
+                k > 0,
+                np.take_along_axis(cum, np.maximum(k - 1, 0)[..., None],
+                                   axis=-1)[..., 0],
+                0
+            )
+            count_k = np.take_along_axis(counts, k[..., None], axis=-1)[..., 0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frac = np.where(count_k > 0, (target - prev)/count_k, 0.)
+            j = np.clip(k, 1, self.bins)
+            value = edges[j - 1] + frac*(edges[j] - edges[j - 1])
+            value = np.where(k == 0, edges[0], value)
+            value = np.where(k == self.bins + 1, edges[-1], value)
+            value[total == 0] = np.nan
+            out[..., i] = value
+        return out
+
+    def __repr__(self):
+        shape = None if self.counts is None else self.counts.shape[:-1]
+        return "Histogram(bins={}, range=({}, {}), shape={})".format(
+            self.bins, self.edges[0], self.edges[-1], shape
+        )
+
+
+def _count_dtype(n):
+    """ Return the smallest unsigned integer type which can hold `n`. """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def merge_groups(partials):
+    """ Merge a sequence of dictionaries mapping group keys to accumulators,
+    such as those computed from separate batches of cases. """
+    merged = OrderedDict()
+    for groups in partials:
+        for key, acc in groups.items():
+            if key in merged:
+                merged[key].merge(acc)
+            else:
+                merged[key] = acc
+    return merged
+
+
+def groups_to_dataset(groups, proto, group_coords, results):
+    """ Assemble the results computed from a set of accumulators into a
+    Dataset, with a dimension for each of the case dimensions which weren't
+    reduced over.
+
+    Parameters
+    ----------
+    groups : dict
+        Mapping of group keys (tuples of the values of each kept case) to
+        accumulators
+    proto : DataArray
+        A DataArray from one of the cases, for the dimensions, coordinates
+        and attributes of the result
+    group_coords : list of tuples
+        The (name, values, long name) of each kept case dimension
+    results : dict
+        Mapping of the names of the output variables to tuples of a function
+        which computes the variable from an accumulator, and the names of
+        any dimensions it adds after those of `proto`
+
+    Returns
+    -------
+    A Dataset with a variable for each of the `results`; groups without any
+    cases are filled with NaN.
+
+    """
+    group_shape = tuple(len(vals) for _, vals, _ in group_coords)
+    group_dims = [name for name, _, _ in group_coords]
+    positions = [{val: i for i, val in enumerate(vals)}
+                 for _, vals, _ in group_coords]
+
+    data_vars = OrderedDict()
+    for name, (func, extra_dims) in results.items():
+        out = None
+        for key, acc in groups.items():
+            value = func(acc)
+            if out is None:
+                # Integer results (counts) are zero for empty groups
+                if np.issubdtype(value.dtype, np.integer):
+                    out = np.zeros(group_shape + value.shape, value.dtype)
+                else:
+                    out = np.full(group_shape + value.shape, np.nan)
+            index = tuple(pos[val] for pos, val in zip(positions, key))
+            out[index] = value
+        dims = group_dims + list(proto.dims) + list(extra_dims)
+        data_vars[name] = (dims, out)
+
+    ds = xr.Dataset(data_vars, coords=proto.coords, attrs=proto.attrs)
+    for name, vals, longname in group_coords:
+        ds.coords[name] = (name, vals, {'long_name': longname})
+    return ds
@@ -0,0 +1,162 @@
+"""
+Compiled templates for the paths and filenames in an Experiment's archive.
+
+An Experiment describes the layout of its archive with Python format strings
+(or functions) which are filled in using the values of each case. Rather than
+re-formatting those strings one case at a time, a :class:`PathTemplate` parses
+its format string once and can then render it for an entire batch of cases
+using vectorized NumPy string operations.
+
+"""
+from string import Formatter
+
+import numpy as np
+
+
+class PathTemplate(object):
+    """ A pre-parsed path template, built from either a format string with
+    named fields corresponding to case names, or a function accepting the
+    case values as keyword arguments.
+
+    Format strings which only use plain named fields (e.g. "{emis}/{param}")
+    are rendered in batches with NumPy; anything more complex (format specs,
+    conversions, indexing, or a function) falls back to rendering each case
+    individually.
+
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self._parts = None
+
+        if callable(template):
+            self._func = template
+            return
+
+        self._func = template.format
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None and \
+               (spec or conversion or not field.isidentifier()):
+                # Too complex to vectorize; just use str.format
+                return
+            parts.append((literal, field))
+        self._parts = parts
+
+    @property
+    def fields(self):
+        """ The names of the case fields used by this template, or None if
+        they can't be determined. """
+        if self._parts is None:
+            return None
+        return [field for _, field in self._parts if field is not None]
+
+    @property
+    def vectorized(self):
+        return self._parts is not None
+
+    def render(self, **case_kws):
+        """ Render the template for a single case. """
+        if self._parts is None:
+            return self._func(**case_kws)
+        bits = []
+        for literal, field in self._parts:
+            bits.append(literal)
+            if field is not None:
+                bits.append(str(case_kws[field]))
+        return "".join(bits)
+
+    def render_many(self, batch):
+        """ Render the template for a batch of cases.
+
+        Parameters
+        ----------
+        batch : CaseBatch
+            The cases to render the template for
+
+        Returns
+        -------
+        A NumPy array of strings with the rendered template for each case
+
+        """
+        n = len(batch)
+        if self._parts is None:
+            rendered = [self._func(**case_kws) for case_kws in batch.iterkws()]
+            return np.array(rendered, dtype=str).reshape(n)
+
+        out = np.full(n, "", dtype=str)
+        for literal, field in self._parts:
+            if literal:
+                out = np.char.add(out, literal)
+            if field is not None:
+                out = np.char.add(out, batch.column(field))
+        return out
+
+    def __repr__(self):
+        return "PathTemplate({!r})".format(self.template)
+
+
+class CaseBatch(object):
+    """ A batch of cases from an Experiment, stored as an array of indices
+    into the values of each case so that it can be cheaply converted into
+    columns of strings for rendering templates.
+
+    """
+
+    def __init__(self, case_names, case_vals, cases=None):
+        """
+        Parameters
+        ----------
+        case_names : list of str
+            The names of the cases, in order
+        case_vals : list of lists
+            The values of each case, in the same order as `case_names`
+        cases : iterable of tuples (optional)
+            The particular combinations of case values in the batch; if not
+            passed, the full product of all the case values is used, in the
+            same order as :func:`itertools.product`.
+
+        """
+        self.names = list(case_names)
+        self.vals = [list(vals) for vals in case_vals]
+
+        if cases is None:
+            shape = tuple(len(vals) for vals in self.vals)
+            n = int(np.prod(shape))
+            self.idx = np.indices(shape).reshape(len(shape), n)
+        else:
+            lookups = [{val: i for i, val in enumerate(vals)}
+                       for vals in self.vals]
+            cases = list(cases)
+            self.idx = np.array(
+                [[lookup[bits[i]] for bits in cases]
+                 for i, lookup in enumerate(lookups)], dtype=int
+            ).reshape(len(self.names), len(cases))
+
+        self._columns = {}
+
+    def __len__(self):
+        return self.idx.shape[1]
+
+    def column(self, name):
+        """ Return the values of a given case for every member of the batch,
+        as an array of strings. """
+        if name not in self._columns:
+            i = self.names.index(name)
+            str_vals = np.array([str(val) for val in self.vals[i]], dtype=str)
+            self._columns[name] = str_vals[self.idx[i]]
+        return self._columns[name]
+
+    def itercases(self):
+        """ Iterate over the tuples of case values in the batch. """
+        columns = []
+        for vals, idx in zip(self.vals, self.idx):
+            obj_vals = np.empty(len(vals), dtype=object)
+            obj_vals[:] = vals
+            columns.append(obj_vals[idx].tolist())
+        return zip(*columns)
+
+    def iterkws(self):
+        """ Iterate over the case keywords for each member of the batch. """
+        for bits in self.itercases():
+            yield dict(zip(self.names, bits))
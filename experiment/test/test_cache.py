@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from experiment.cache import LoadCache
+
+
+def _make_ds(n):
+    return xr.Dataset({'x': ('i', np.zeros(n))})
+
+
+class TestLoadCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LoadCache(max_bytes=3*80)
+        for i in range(3):
+            cache.put(i, _make_ds(10), field='x')
+        self.assertEqual(cache.nbytes, 240)
+
+        # Touch the oldest entry, so the next one is evicted instead
+        self.assertIsNotNone(cache.get(0))
+        cache.put(3, _make_ds(10), field='y')
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(1, cache)
+        self.assertIn(0, cache)
+        self.assertEqual(cache.stats(), dict(hits=1, misses=0, evictions=1,
+                                             entries=3, nbytes=240))
+
+        # Entries larger than the budget are never cached
+        cache.put(4, _make_ds(100))
+        self.assertNotIn(4, cache)
+        self.assertIsNone(cache.get(4))
+        self.assertEqual(cache.misses, 1)
+
+    def test_invalidate(self):
+        cache = LoadCache(max_entries=10)
+        for i in range(4):
+            cache.put(i, {'a': _make_ds(1)}, field='x' if i % 2 else 'y')
+        self.assertEqual(cache.invalidate('x'), 2)
+        self.assertEqual(sorted(cache._entries), [0, 2])
+        self.assertEqual(cache.nbytes, 16)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
@@ -0,0 +1,46 @@
+import unittest
+
+from experiment.chunking import ChunkPolicy
+
+
+class TestChunkPolicy(unittest.TestCase):
+
+    def test_file_chunks(self):
+        dims, shape = ('time', 'lat', 'lon'), (365, 96, 144)
+
+        # Everything fits in a single chunk
+        policy = ChunkPolicy(target_bytes='64MB')
+        self.assertEqual(policy.file_chunks(dims, shape, 'f8'),
+                         dict(time=365, lat=96, lon=144))
+
+        # Split along the leading dimension first
+        policy = ChunkPolicy(target_bytes=96*144*8*10)
+        self.assertEqual(policy.file_chunks(dims, shape, 'f8'),
+                         dict(time=10, lat=96, lon=144))
+        self.assertEqual(policy.file_chunks(dims, shape, 'f4'),
+                         dict(time=20, lat=96, lon=144))
+
+        # ... and then the next, if a single step is too big
+        policy = ChunkPolicy(target_bytes=144*8*48)
+        self.assertEqual(policy.file_chunks(dims, shape, 'f8'),
+                         dict(time=1, lat=48, lon=144))
+
+        # Round to the chunking on disk
+        policy = ChunkPolicy(target_bytes=96*144*8*10)
+        self.assertEqual(
+            policy.file_chunks(dims, shape, 'f8', disk_chunks=(4, 96, 144)),
+            dict(time=8, lat=96, lon=144)
+        )
+
+        # Fixed chunks are taken out of the budget
+        policy = ChunkPolicy(target_bytes=96*144*8*10, fixed=dict(lon=72))
+        self.assertEqual(policy.file_chunks(dims, shape, 'f8'),
+                         dict(time=20, lat=96, lon=72))
+
+    def test_case_chunks(self):
+        policy = ChunkPolicy(target_bytes=1000)
+        self.assertEqual(policy.case_chunks((3, 2, 4), 100), (1, 2, 4))
+        self.assertEqual(policy.case_chunks((3, 2, 4), 250), (1, 1, 4))
+        self.assertEqual(policy.case_chunks((3, 2, 4), 2000), (1, 1, 1))
+        policy = ChunkPolicy(target_bytes=1000, group_cases=False)
+        self.assertEqual(policy.case_chunks((3, 2, 4), 100), (1, 1, 1))
@@ -0,0 +1,145 @@
+import unittest
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+from experiment import Experiment, Case
+from experiment.chunking import ChunkPolicy
+from experiment.convert import CaseLayout, create_master
+
+cases = [
+    Case("param1", "Parameter 1", ["a", "b", "c"]),
+    Case("param2", "Parameter 2", [1, 2]),
+    Case("param3", "Parameter 3", ["alpha", "beta", "gamma", "delta"]),
+]
+exp = Experiment("test", cases, data_dir="", validate_data=False)
+
+
+def _make_data(field="temp", shape=(4, 3), chunks=None):
+    """ Create a dictionary of Datasets, with each case filled with its
+    position in the product of the case values. """
+    data = {}
+    for i, bits in enumerate(exp.all_cases()):
+        arr = np.full(shape, float(i))
+        if chunks is not None:
+            arr = da.from_array(arr, chunks=chunks)
+        data[exp.case_tuple(*bits)] = xr.Dataset(
+            {field: (('x', 'y'), arr, {'units': 'K'})},
+            coords={'x': np.arange(shape[0]), 'y': np.arange(shape[1])}
+        )
+    return data
+
+
+class TestCreateMaster(unittest.TestCase):
+
+    def test_layout(self):
+        layout = CaseLayout(exp)
+        self.assertEqual(layout.dims, ['param1', 'param2', 'param3'])
+        self.assertEqual(layout.shape, (3, 2, 4))
+        self.assertEqual(layout.keys,
+                         [exp.case_tuple(*bits) for bits in exp.all_cases()])
+
+    def test_master_dataset(self):
+        data = _make_data(chunks=(2, 3))
+        ds = create_master(exp, "temp", data)
+
+        self.assertEqual(ds['temp'].dims,
+                         ('param1', 'param2', 'param3', 'x', 'y'))
+        self.assertEqual(ds['temp'].attrs['units'], 'K')
+        self.assertEqual(ds['param1'].attrs['long_name'], 'Parameter 1')
+        np.testing.assert_array_equal(ds['param2'], [1, 2])
+        for key, ds_case in data.items():
+            xr.testing.assert_equal(
+                ds['temp'].sel(**key._asdict(), drop=True), ds_case['temp']
+            )
+
+        # One task per block of each case
+        graph = ds['temp'].data.__dask_graph__()
+        n_blocks = len(data) * 2
+        self.assertEqual(len(graph.layers[ds['temp'].data.name]), n_blocks)
+
+    def test_master_dataarray(self):
+        data = {key: ds['temp'] for key, ds in _make_data().items()}
+        master = create_master(exp, "temp", data)
+        self.assertIsInstance(master, xr.DataArray)
+        self.assertEqual(master.shape, (3, 2, 4, 4, 3))
+        np.testing.assert_array_equal(master.values[:, :, :, 0, 0].ravel(),
+                                      np.arange(24.))
+
+    def test_chunk_policy(self):
+        data = _make_data()
+        expected = create_master(exp, "temp", data)
+
+        # Each case is 96 bytes, so groups of four cases fit in a block
+        ds = create_master(exp, "temp", data, new_fields=[],
+                           chunks=ChunkPolicy(target_bytes=400))
+        self.assertEqual(ds['temp'].data.chunks,
+                         ((1, 1, 1), (1, 1), (4, ), (4, ), (3, )))
+        self.assertEqual(len(ds['temp'].data.__dask_graph__()
+                             .layers[ds['temp'].data.name]), 6)
+        xr.testing.assert_identical(ds, expected)
+
+        # Each case is split in two
+        ds = create_master(exp, "temp", data, new_fields=[],
+                           chunks=ChunkPolicy(target_bytes=50))
+        self.assertEqual(ds['temp'].data.chunks,
+                         ((1, 1, 1), (1, 1), (1, 1, 1, 1), (2, 2), (3, )))
+        xr.testing.assert_identical(ds, expected)
+
+    def test_stack_names(self):
+        layout = CaseLayout(exp)
+        arrays = [da.from_array(np.full(3, float(i)), chunks=3)
+                  for i in range(len(layout))]
+        stacked = layout.stack(arrays)
+
+        # The same cases arranged differently get a distinct graph
+        flat = CaseLayout(exp)
+        flat.dims, flat.shape = ['member', ], (len(flat), )
+        flat_stacked = flat.stack(arrays)
+        self.assertNotEqual(stacked.name, flat_stacked.name)
+        self.assertEqual(flat_stacked.shape, (len(flat), 3))
+        np.testing.assert_array_equal(flat_stacked.compute(),
+                                      stacked.compute().reshape(-1, 3))
+
+    def test_missing_cases(self):
+        data = _make_data()
+        missing = [exp.case_tuple('a', 2, 'beta'),
+                   exp.case_tuple('c', 1, 'alpha')]
+        for key in missing:
+            data[key] = xr.Dataset({'temp': np.nan})
+        # Cases in which only one variable is missing
+        for key in data:
+            if key.param1 == 'b':
+                data[key]['pres'] = -data[key]['temp']
+        data[exp.case_tuple('b', 1, 'alpha')] = \
+            data[exp.case_tuple('b', 1, 'alpha')].drop_vars('pres')
+
+        ds = create_master(exp, "temp", data, new_fields=[])
+        self.assertIsNotNone(ds['temp'].chunks)
+        self.assertEqual(ds['temp'].shape, (3, 2, 4, 4, 3))
+        self.assertTrue(ds['temp'].sel(param1='a', param2=2,
+                                       param3='beta').isnull().all())
+        self.assertEqual(int(ds['temp'].isnull().sum()), 2*12)
+        self.assertEqual(int(ds['pres'].notnull().sum()), 7*12)
+        xr.testing.assert_equal(
+            ds['temp'].sel(param1='b', param2=1, param3='alpha', drop=True),
+            data[exp.case_tuple('b', 1, 'alpha')]['temp']
+        )
+
+        with self.assertRaises(ValueError):
+            create_master(exp, "temp", data, new_fields=[], missing='raise')
+
+    def test_missing_drop(self):
+        data = {key: ds['temp'] for key, ds in _make_data().items()}
+        for key in data:
+            if key.param3 == 'gamma' or (key.param1, key.param2) == ('a', 1):
+                data[key] = xr.DataArray(np.nan, name='temp')
+
+        master = create_master(exp, "temp", data, missing='drop')
+        np.testing.assert_array_equal(master['param3'],
+                                      ['alpha', 'beta', 'delta'])
+        self.assertEqual(master.shape, (3, 2, 3, 4, 3))
+        self.assertTrue(master.sel(param1='a', param2=1).isnull().all())
+        self.assertEqual(int(master.isnull().sum()), 3*12)
+
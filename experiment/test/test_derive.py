@@ -0,0 +1,112 @@
+import os
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from experiment import Case, Experiment, Var, VarList
+from experiment.derive import Evaluator, derive, parse_ncap, required_fields
+
+PATH_TO_SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'sample')
+exp = Experiment(
+    "sample", [Case("param1", "Parameter 1", ["a", "b", "c"]),
+               Case("param2", "Parameter 2", [1, 2, 3]),
+               Case("param3", "Parameter 3", ["alpha", "beta"])],
+    timeseries=True, data_dir=PATH_TO_SAMPLE, case_path="{param1}_{param2}",
+    output_prefix="{param1}.{param2}.{param3}.", output_suffix=".tape.nc",
+    validate_data=False
+)
+
+
+class TestParse(unittest.TestCase):
+
+    def test_parse(self):
+        statements = parse_ncap("tot = temp + 2*pres; out = sqrt(tot^2)\n")
+        self.assertEqual([name for name, _ in statements], ['tot', 'out'])
+        self.assertEqual(required_fields(statements), ['temp', 'pres'])
+
+        # Fields can be re-defined in terms of themselves
+        self.assertEqual(required_fields(parse_ncap("temp = temp - 273.15")),
+                         ['temp'])
+
+    def test_comments(self):
+        statements = parse_ncap("// convert to Celsius\n"
+                                "temp_c = temp - 273.15;  # in place\n")
+        self.assertEqual([name for name, _ in statements], ['temp_c'])
+        for empty in ["", "  \n ; ", "// nothing here\n# or here"]:
+            with self.assertRaises(ValueError):
+                parse_ncap(empty)
+
+    def test_evaluate(self):
+        evaluator = Evaluator(lambda name: np.arange(3.))
+        statements = parse_ncap("a = x + 1; b = a*2")
+        np.testing.assert_array_equal(evaluator.evaluate(statements),
+                                      [2., 4., 6.])
+        np.testing.assert_array_equal(evaluator.evaluate(statements, 'a'),
+                                      [1., 2., 3.])
+        with self.assertRaises(ValueError):
+            evaluator.evaluate(statements, 'c')
+        with self.assertRaises(ValueError):
+            evaluator.evaluate([])
+
+        # Equal constants of different types aren't shared
+        evaluator = Evaluator(lambda name: np.arange(3))
+        self.assertEqual(evaluator.evaluate(parse_ncap("a = x*2")).dtype,
+                         np.arange(3).dtype)
+        self.assertEqual(evaluator.evaluate(parse_ncap("b = x*2.0")).dtype,
+                         np.float64)
+
+    def test_unsafe(self):
+        for bad in ["x = __import__('os')", "x = temp.values",
+                    "x = temp[0]", "x = 'text'", "temp + 1",
+                    "x = y = temp", "x = lambda: 1", "x = sqrt(temp, out=1)"]:
+            with self.assertRaises(ValueError):
+                parse_ncap(bad)
+
+
+class TestDerive(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = exp.open_master('temp')['temp']
+        self.pres = exp.open_master('pres')['pres']
+
+    def test_derive(self):
+        var = Var('temp_C', oldvar='temp', ncap_str='temp_C=temp-273.15',
+                  units='degC', long_name='Temperature')
+        ds = exp.derive(var)
+        self.assertIsNotNone(ds['temp_C'].chunks)
+        self.assertEqual(ds['temp_C'].attrs['units'], 'degC')
+        self.assertEqual(ds['temp_C'].dims, self.temp.dims)
+        np.testing.assert_allclose(ds['temp_C'], self.temp - 273.15)
+        self.assertIs(var.master['temp_C'].data, ds['temp_C'].data)
+
+        # Plain copies of a field keep its attributes
+        var = Var('T', oldvar='temp', scale_factor=2.)
+        ds = exp.derive(var)
+        np.testing.assert_allclose(ds['T'], 2*self.temp)
+        self.assertNotIn('scale_factor', ds['T'].attrs)
+
+    def test_shared_intermediates(self):
+        loaded = []
+
+        def load_field(field):
+            loaded.append(field)
+            return exp.open_master(field)[field]
+        evaluator = Evaluator(load_field)
+
+        var_list = VarList([
+            Var('a', oldvar=['temp', 'pres'],
+                ncap_str='tot = temp + pres; a = tot*2'),
+            Var('b', oldvar=['temp', 'pres'],
+                ncap_str='tot = temp + pres; b = log(abs(tot) + 1)'),
+        ])
+        ds = derive(exp, var_list, evaluator=evaluator)
+        self.assertEqual(sorted(loaded), ['pres', 'temp'])
+        np.testing.assert_allclose(ds['a'], (self.temp + self.pres)*2)
+        np.testing.assert_allclose(
+            ds['b'], np.log(np.abs(self.temp + self.pres) + 1)
+        )
+        # The sum was only evaluated once
+        sums = [v for k, v in evaluator._memo.items() if k[0] == 'add'
+                and k[1] == ('field', 'temp')]
+        self.assertEqual(len(sums), 1)
@@ -7,12 +7,23 @@ try:
 except ImportError:
     import pickle
 
+import asyncio
 import os
+import shutil
+import time
+import tempfile
+import threading
 import unittest
 import yaml
 
+import numpy as np
+import pandas as pd
+
 from itertools import product
-from experiment import Experiment, Case
+from experiment import Experiment, Case, Var, VarList
+from experiment.chunking import ChunkPolicy
+
+import xarray as xr
 
 
 case_emis = \
@@ -36,6 +47,30 @@ def make_exp(**kwargs):
     kws.update(**kwargs)
     return Experiment(**kws)
 
+#: Experiment matching the on-disk sample archive (see data/make_sample.py)
+PATH_TO_SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'sample')
+sample_cases = [
+    Case("param1", "Parameter 1", ["a", "b", "c"]),
+    Case("param2", "Parameter 2", [1, 2, 3]),
+    Case("param3", "Parameter 3", ["alpha", "beta"]),
+]
+def make_sample_exp(**kwargs):
+    kws = dict(
+        name="sample", cases=sample_cases, timeseries=True,
+        data_dir=PATH_TO_SAMPLE, case_path="{param1}_{param2}",
+        output_prefix="{param1}.{param2}.{param3}.",
+        output_suffix=".tape.nc", validate_data=False
+    )
+    kws.update(**kwargs)
+    return Experiment(**kws)
+
+
+def _add_case_id(ds, **case_kws):
+    """ Simple, picklable preprocessing function for testing. """
+    ds.attrs['case_id'] = "-".join(str(case_kws[c]) for c in
+                                   ['param1', 'param2', 'param3'])
+    return ds
+
 class TestExperiment(unittest.TestCase):
 
     def test_repr(self):
@@ -201,3 +236,837 @@ class TestExperiment(unittest.TestCase):
 
         self.assertEqual(["/path/to/my/data/policy/no_clouds/experiment_policy_no_clouds.data.test.tape.nc"],
                          exp_all_str.get_file_fieldcases('test', **case_kws))
+
+    def test_render_paths(self):
+        """ Test that batch-rendered paths match formatting each case, for
+        both vectorized and fallback templates. """
+        def _prefix_func(emis, model_config):
+            return emis[:3] + "-" + model_config + "."
+
+        for kws in [dict(), dict(case_path="{model_config:>12s}"),
+                    dict(output_prefix=_prefix_func),
+                    dict(case_path=None, data_dir="")]:
+            exp = make_exp(**kws)
+            expected = [
+                os.path.join(exp.data_dir, exp.case_path(**case_kws),
+                             exp.case_prefix(**case_kws) + 'test' +
+                             exp.case_suffix(**case_kws))
+                for case_kws in map(lambda bits: exp.get_case_kws(*bits),
+                                    exp.all_cases())
+            ]
+            self.assertEqual(exp.render_paths('test'), expected)
+            self.assertEqual([fn for _, fn in exp.walk_files('test')],
+                             expected)
+            some_cases = [('weak_policy', 'no_sun'), ('policy', 'no_sun')]
+            self.assertEqual(exp.render_paths('test', some_cases),
+                             [expected[7], expected[1]])
+
+    def test_file_lookup(self):
+        """ Test that memoized file lookups match walking the experiment and
+        are invalidated when the naming configuration changes. """
+        exp = make_exp()
+        case_kws = dict(emis='policy', model_config='no_clouds')
+        for kws, fn in exp.walk_files('test'):
+            self.assertEqual([fn, ], exp.get_file_fieldcases('test', **kws))
+        self.assertEqual([], exp.get_file_fieldcases('test', emis='policy'))
+        self.assertEqual([], exp.get_file_fieldcases(
+            'test', emis='policy', model_config='not_a_config'
+        ))
+
+        pairs = [(('no_policy', 'no_sun'), 'a'), (case_kws, 'b'),
+                 (('bad', 'case'), 'a')]
+        self.assertEqual(exp.get_files(pairs), [
+            "/path/to/my/data/no_policy/no_sun/experiment_no_policy_no_sun.data.a.tape.nc",
+            "/path/to/my/data/policy/no_clouds/experiment_policy_no_clouds.data.b.tape.nc",
+            None
+        ])
+
+        exp.output_prefix = "{model_config}."
+        exp.output_suffix = ".nc"
+        exp._case_path = "{emis}"
+        self.assertEqual(["/path/to/my/data/policy/no_clouds.test.nc"],
+                         exp.get_file_fieldcases('test', **case_kws))
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.exp = make_sample_exp()
+
+    def test_load_timeseries(self):
+        data = self.exp.load("temp")
+        self.assertEqual(len(data), 18)
+        self.assertEqual(list(data.keys()),
+                         [self.exp.case_tuple(*bits)
+                          for bits in self.exp.all_cases()])
+        for ds in data.values():
+            self.assertEqual(ds['temp'].shape, (10, 5, 5))
+
+    def test_load_parallel(self):
+        """ Loading cases concurrently should give identical results, in the
+        same order, as loading them serially. """
+        serial = self.exp.load("temp", preprocess=_add_case_id)
+        for executor in ['threads', 'processes']:
+            parallel = self.exp.load("temp", preprocess=_add_case_id,
+                                     executor=executor, max_workers=2)
+            self.assertEqual(list(serial.keys()), list(parallel.keys()))
+            for key in serial:
+                self.assertEqual(serial[key].attrs['case_id'],
+                                 parallel[key].attrs['case_id'])
+                xr.testing.assert_identical(serial[key], parallel[key])
+
+    def test_load_subset(self):
+        data = self.exp.load("temp", param1='a', param3=['beta', 'alpha'])
+        self.assertEqual(list(data),
+                         [self.exp.case_tuple('a', i, p) for i in [1, 2, 3]
+                          for p in ['alpha', 'beta']])
+
+        master = self.exp.load("temp", master=True, param1='a', param2=[1, 3])
+        self.assertEqual(master['temp'].dims[:3],
+                         ('param1', 'param2', 'param3'))
+        self.assertEqual(master['temp'].shape[:3], (1, 2, 2))
+        full = self.exp.load("temp", master=True)
+        xr.testing.assert_identical(
+            master['temp'], full['temp'].sel(param1=['a'], param2=[1, 3])
+        )
+        # The original experiment is unchanged
+        self.assertEqual(self.exp.param1, ["a", "b", "c"])
+
+        master = self.exp.load("temp", master=True, param3='beta',
+                               where=lambda param2, **kws: param2 > 1)
+        self.assertEqual(master.sizes['member'], 6)
+        self.assertTrue((master['param2'] > 1).all())
+
+        ds = self.exp.load("temp", param1='a', param2=1, param3='beta')
+        self.assertIsInstance(ds, xr.Dataset)
+
+        with self.assertRaises(ValueError):
+            self.exp.subset(param1='d')
+
+    def test_subset_subclass(self):
+        class TaggedExperiment(Experiment):
+            def describe(self):
+                return "{} ({})".format(self.name, self.tag)
+
+        exp = make_sample_exp()
+        exp.__class__ = TaggedExperiment
+        exp.tag = 'v1'
+        sub = exp.subset(param1='b')
+        self.assertIsInstance(sub, TaggedExperiment)
+        self.assertEqual(sub.describe(), "sample (v1)")
+        self.assertEqual(sub.param1, ['b'])
+        self.assertEqual(len(sub.load("temp")), 6)
+
+    def test_inventory(self):
+        inv = self.exp.inventory()
+        self.assertEqual(inv.index.names,
+                         ['param1', 'param2', 'param3', 'field'])
+        self.assertEqual(len(inv), 18*3)
+        self.assertTrue(inv['present'].all())
+        row = inv.loc[('a', 1, 'alpha', 'temp')]
+        self.assertEqual(row['shape'], (10, 5, 5))
+        self.assertEqual(row['time_start'], pd.Timestamp('2000-01-01'))
+        self.assertEqual(row['time_end'], pd.Timestamp('2000-01-10'))
+        self.assertEqual(row['nbytes'], os.path.getsize(
+            self.exp.get_file_fieldcases('temp', param1='a', param2=1,
+                                         param3='alpha')[0]
+        ))
+
+        inv = self.exp.inventory('not_a_field')
+        self.assertFalse(inv['present'].any())
+        self.assertTrue((inv['n_files'] == 0).all())
+
+    def test_load_chunked(self):
+        policy = ChunkPolicy(target_bytes=5*5*8*2)
+        data = self.exp.load("temp", chunks=policy)
+        for ds in data.values():
+            self.assertEqual(ds['temp'].chunks, ((2, )*5, (5, ), (5, )))
+
+        master = self.exp.load("temp", master=True, chunks=policy)
+        self.assertEqual(master['temp'].data.chunksize, (1, 1, 1, 2, 5, 5))
+        expected = self.exp.load("temp", master=True)
+        xr.testing.assert_identical(master, expected)
+
+    def test_load_many(self):
+        temp, pres = Var('temp', 'temp'), Var('pres', 'pres')
+        data = self.exp.load_many(VarList([temp, pres]), max_workers=2)
+        self.assertEqual(list(data), ['temp', 'pres'])
+        self.assertTrue(temp._loaded)
+        self.assertIs(temp._data, data['temp'])
+        for field in ['temp', 'pres']:
+            expected = self.exp.load(field)
+            self.assertEqual(list(data[field]), list(expected))
+            for key, ds in data[field].items():
+                self.assertEqual(list(ds.data_vars), [field, ])
+                xr.testing.assert_identical(ds[field], expected[key][field])
+
+        master = self.exp.load_many(['temp', 'pres', 'precip'], master=True)
+        self.assertEqual(sorted(master.data_vars), ['precip', 'pres', 'temp'])
+        xr.testing.assert_identical(master['pres'],
+                                    self.exp.load('pres', master=True)['pres'])
+
+    def test_load_many_shared_coords(self):
+        # Float coordinates are written with a NaN _FillValue; together with
+        # array-valued attributes, these mustn't stop the coordinates being
+        # shared between the files of each case
+        root = tempfile.mkdtemp()
+        try:
+            exp = Experiment(
+                "shared", [case_emis, ], timeseries=True, data_dir=root,
+                case_path="{emis}", output_prefix="{emis}.",
+                output_suffix=".nc", validate_data=False
+            )
+            for path, case_kws in exp._walk_cases(with_kws=True):
+                os.makedirs(os.path.join(root, path))
+                for i, field in enumerate(['u', 'v']):
+                    ds = xr.Dataset()
+                    ds['x'] = ('x', np.arange(3.),
+                               {'actual_range': np.array([0., 2.])})
+                    ds[field] = ('x', np.full(3, float(i + 1)))
+                    ds.to_netcdf(os.path.join(
+                        root, path, exp.case_prefix(**case_kws) + field
+                        + exp.case_suffix(**case_kws)
+                    ))
+
+            data = exp.load_many(['u', 'v'])
+            for field in ['u', 'v']:
+                expected = exp.load(field)
+                for key, ds in data[field].items():
+                    self.assertFalse(ds[field].isnull().any())
+                    xr.testing.assert_identical(ds[field],
+                                                expected[key][field])
+            np.testing.assert_array_equal(
+                data['v'][('policy', )]['x'].attrs['actual_range'], [0., 2.]
+            )
+        finally:
+            shutil.rmtree(root)
+
+    def test_load_many_time_axes(self):
+        # Fields in the same case needn't share their time axis
+        root = tempfile.mkdtemp()
+        try:
+            exp = Experiment(
+                "times", [case_emis, ], timeseries=True, data_dir=root,
+                case_path="{emis}", output_prefix="{emis}.",
+                output_suffix=".nc", validate_data=False
+            )
+            times = {'u': np.arange(5.), 'v': np.arange(5.) + 100.,
+                     'w': np.arange(10.)/2.}
+            for path, case_kws in exp._walk_cases(with_kws=True):
+                os.makedirs(os.path.join(root, path))
+                for field, time in times.items():
+                    ds = xr.Dataset()
+                    ds['time'] = ('time', time)
+                    ds[field] = ('time', np.ones(len(time)))
+                    ds.to_netcdf(os.path.join(
+                        root, path, exp.case_prefix(**case_kws) + field
+                        + exp.case_suffix(**case_kws)
+                    ))
+
+            data = exp.load_many(['u', 'v', 'w'])
+            for field, time in times.items():
+                expected = exp.load(field)
+                for key, ds in data[field].items():
+                    np.testing.assert_array_equal(ds['time'], time)
+                    xr.testing.assert_identical(ds, expected[key])
+
+            master = exp.load_many(['u', 'v', 'w'], master=True)
+            np.testing.assert_array_equal(
+                master['time'], np.union1d(np.union1d(times['u'], times['v']),
+                                           times['w'])
+            )
+            self.assertEqual(int(master['v'].notnull().sum()), 3*5)
+        finally:
+            shutil.rmtree(root)
+
+    def test_reduce(self):
+        master = self.exp.load("temp", master=True)
+        ds = self.exp.reduce("temp", over=['param2', 'param3'],
+                             stats=['count', 'mean', 'std', 'max'])
+        self.assertEqual(ds['mean'].dims, ('param1', 'time', 'x', 'y'))
+        self.assertEqual(ds['param1'].attrs['long_name'], 'Parameter 1')
+        self.assertTrue((ds['count'] == 6).all())
+        expected = master['temp'].mean(['param2', 'param3'])
+        np.testing.assert_allclose(ds['mean'], expected)
+        np.testing.assert_allclose(ds['std'],
+                                   master['temp'].std(['param2', 'param3']))
+        np.testing.assert_array_equal(ds['max'],
+                                      master['temp'].max(['param2', 'param3']))
+
+        # Accumulating batches of cases concurrently gives the same results
+        parallel = self.exp.reduce("temp", over=['param2', 'param3'],
+                                   stats=['count', 'mean', 'std', 'max'],
+                                   executor='processes', max_workers=3)
+        xr.testing.assert_allclose(ds, parallel)
+
+        ds = self.exp.reduce("temp", stats='mean', param1='b')
+        self.assertEqual(ds['mean'].dims, ('time', 'x', 'y'))
+        np.testing.assert_allclose(
+            ds['mean'], master['temp'].sel(param1='b').mean(['param2',
+                                                               'param3'])
+        )
+
+        with self.assertRaises(ValueError):
+            self.exp.reduce("temp", over='param4')
+        with self.assertRaises(ValueError):
+            self.exp.reduce("temp", stats=['median'])
+
+    def test_quantiles(self):
+        master = self.exp.load("temp", master=True)
+        values = master['temp'].stack(case=['param1', 'param2', 'param3'])
+        values = np.sort(values.transpose('case', ...).values, axis=0)
+
+        ds = self.exp.quantiles("temp", q=[0, 0.5, 1], bins=2000,
+                                executor='processes', max_workers=2)
+        self.assertEqual(ds['temp'].dims, ('time', 'x', 'y', 'quantile'))
+        np.testing.assert_array_equal(ds['quantile'], [0, 0.5, 1])
+        self.assertTrue((ds['count'] == 18).all())
+        width = (values.max() - values.min())/2000
+        est = ds['temp'].values
+        np.testing.assert_allclose(est[..., 0], values[0], atol=width)
+        np.testing.assert_allclose(est[..., 2], values[-1], atol=width)
+        self.assertTrue((est[..., 1] >= values[8] - width).all())
+        self.assertTrue((est[..., 1] <= values[9] + width).all())
+
+        hist = self.exp.histogram("temp", over='param3', bins=5,
+                                  range=(-1, 1))
+        self.assertEqual(hist['counts'].dims,
+                         ('param1', 'param2', 'time', 'x', 'y', 'bin'))
+        self.assertEqual(hist.sizes['bin'], 5)
+        np.testing.assert_allclose(hist['bin'], [-0.8, -0.4, 0, 0.4, 0.8],
+                                   atol=1e-12)
+        total = hist['counts'].sum('bin') + hist['underflow'] \
+            + hist['overflow']
+        self.assertTrue((total == 2).all())
+
+    def test_load_missing_case(self):
+        """ Cases which can't be loaded are replaced with a placeholder. """
+        data = self.exp.load("not_a_field", max_workers=2)
+        self.assertEqual(len(data), 18)
+        for ds in data.values():
+            self.assertTrue(ds['not_a_field'].isnull().all())
+
+
+def _write_timeslices(root, exp, n_times=4):
+    """ Write a small timeslice-format archive for the given Experiment, with
+    one file per month holding two fields. """
+    times = pd.date_range('2000-01-01', periods=n_times, freq='MS')
+    for path, case_kws in exp._walk_cases(with_kws=True):
+        full_path = os.path.join(root, path)
+        os.makedirs(full_path)
+        for i, time in enumerate(times):
+            ds = xr.Dataset()
+            ds['time'] = ('time', [time, ])
+            ds['x'] = np.arange(3.)
+            ds['temp'] = (('time', 'x'), np.full((1, 3), float(i)))
+            ds['pres'] = (('time', 'x'), np.full((1, 3), -float(i)))
+            fn = (exp.case_prefix(**case_kws) + time.strftime("%Y-%m")
+                  + exp.case_suffix(**case_kws))
+            ds.to_netcdf(os.path.join(full_path, fn))
+
+
+class TestRaggedEnsemble(unittest.TestCase):
+
+    def setUp(self):
+        self.members = [('a', 1, 'alpha'), ('c', 2, 'alpha'), ('b', 3, 'beta')]
+        self.exp = make_sample_exp(members=self.members)
+
+    def test_members(self):
+        # Members are put in the same order as the full product of cases
+        self.assertEqual(list(self.exp.all_cases()),
+                         [self.members[i] for i in [0, 2, 1]])
+        self.assertTrue(self.exp.ragged)
+        self.assertEqual(len(list(self.exp.walk_files('temp'))), 3)
+
+        exp = make_sample_exp(exclude=[dict(param1='a'),
+                                       dict(param2=3, param3='beta')])
+        self.assertEqual(len(list(exp.all_cases())), 10)
+        exp = make_sample_exp(exclude=lambda param1, **kws: param1 != 'b')
+        self.assertEqual(list(exp.all_cases()),
+                         [('b', i, p) for i in [1, 2, 3]
+                          for p in ['alpha', 'beta']])
+
+        with self.assertRaises(ValueError):
+            make_sample_exp(members=[('d', 1, 'alpha')])
+
+    def test_master(self):
+        master = self.exp.load("temp", master=True)
+        self.assertEqual(master['temp'].dims, ('member', 'time', 'x', 'y'))
+        self.assertIsInstance(master.indexes['member'], pd.MultiIndex)
+        self.assertEqual(master['param1'].attrs['long_name'], 'Parameter 1')
+        for bits in self.members:
+            case_kws = self.exp.get_case_kws(*bits)
+            expected = self.exp.load("temp", **case_kws)['temp']
+            np.testing.assert_array_equal(
+                master['temp'].sel(member=bits), expected
+            )
+
+        xr.testing.assert_identical(self.exp.open_master("temp")['temp'],
+                                    master['temp'])
+
+    def test_serialize(self):
+        d = self.exp.to_dict()
+        self.assertEqual(d['members'], [list(m) for m in self.exp.members])
+
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'ragged.yaml')
+            self.exp.to_yaml(path)
+            exp = Experiment.from_yaml(path)
+            self.assertEqual(exp.members, self.exp.members)
+
+            store = self.exp.to_zarr("temp",
+                                     store=os.path.join(root, 'temp.zarr'))
+            ds = self.exp.open_zarr("temp", store=store)
+            self.assertIsInstance(ds.indexes['member'], pd.MultiIndex)
+            self.assertEqual(ds.sizes['member'], 3)
+        finally:
+            shutil.rmtree(root)
+
+
+class TestLoadTimeslice(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.exp = Experiment(
+            "timeslice", [case_emis, ], timeseries=False,
+            data_dir=self.root, case_path="{emis}",
+            output_prefix="{emis}.h0.", output_suffix=".nc",
+            validate_data=False
+        )
+        _write_timeslices(self.root, self.exp)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_timeslice_files(self):
+        fns = self.exp.get_timeslice_files(emis='policy')
+        self.assertEqual(
+            [os.path.basename(fn) for fn in fns],
+            ["policy.h0.2000-0{}.nc".format(i) for i in range(1, 5)]
+        )
+
+    def test_load_timeslice(self):
+        ds = self.exp.load("temp", emis='policy')
+        self.assertEqual(ds['temp'].dims, ('time', 'x'))
+        self.assertEqual(ds['temp'].shape, (4, 3))
+        self.assertNotIn('pres', ds)
+        # Data is lazily read from the files on demand
+        self.assertIsNotNone(ds['temp'].chunks)
+        np.testing.assert_array_equal(ds['temp'].values[:, 0], range(4))
+
+        data = self.exp.load("temp", max_workers=2)
+        self.assertEqual(len(data), 3)
+        for key, ds_case in data.items():
+            xr.testing.assert_identical(
+                ds_case.load(), self.exp.load("temp", emis=key.emis).load()
+            )
+
+    def test_load_many(self):
+        master = self.exp.load_many(['temp', 'pres'], master=True)
+        self.assertEqual(master['temp'].dims, ('emis', 'time', 'x'))
+        np.testing.assert_array_equal(master['pres'].values[0, :, 0],
+                                      -np.arange(4))
+        xr.testing.assert_identical(
+            master['temp'].load(),
+            self.exp.load('temp', master=True)['temp'].load()
+        )
+
+    def test_inventory(self):
+        bad_file = os.path.join(self.root, "no_policy",
+                                "no_policy.h0.2000-05.nc")
+        with open(bad_file, 'w') as f:
+            f.write("not a netCDF file")
+
+        inv = self.exp.inventory(max_workers=2)
+        self.assertEqual(sorted(set(inv.index.get_level_values('field'))),
+                         ['pres', 'temp'])
+        row = inv.loc[('policy', 'temp')]
+        self.assertTrue(row['present'])
+        self.assertEqual(row['shape'], (4, 3))
+        self.assertEqual(row['n_files'], 4)
+        self.assertEqual(row['time_end'], pd.Timestamp('2000-04-01'))
+
+        row = inv.loc[('no_policy', 'temp')]
+        self.assertFalse(row['present'])
+        self.assertEqual(row['n_files'], 5)
+        self.assertIsNotNone(row['error'])
+
+
+class TestFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.exp = make_exp(data_dir=self.root)
+        for case_kws, path in self.exp.walk_files('test'):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write("data")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_index_lookup(self):
+        index = self.exp.build_index()
+        self.assertEqual(len(index), 9)
+        for case_kws, path in self.exp.walk_files('test'):
+            size, mtime = self.exp.stat_file(path)
+            self.assertEqual(size, 4)
+            self.assertEqual(mtime, os.stat(path).st_mtime)
+        _, path = next(self.exp.walk_files('missing'))
+        self.assertIsNone(self.exp.stat_file(path))
+
+        # Validation uses the index, not the file system
+        shutil.rmtree(os.path.join(self.root, 'policy'))
+        self.exp._validate_data()
+        self.assertEqual(len(self.exp.refresh_index()), 3)
+        self.assertRaises(AssertionError, self.exp._validate_data)
+
+    def test_index_sidecar(self):
+        yaml_path = os.path.join(self.root, 'exp.yaml')
+        self.exp.to_yaml(yaml_path, index=True)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.root, 'exp.index.json')
+        ))
+
+        exp = Experiment.from_yaml(yaml_path)
+        self.assertIsNotNone(exp.file_index)
+        _, path = next(exp.walk_files('test'))
+        self.assertEqual(exp.stat_file(path)[0], 4)
+
+        # Only changed directories are re-scanned
+        self.assertEqual(exp.refresh_index(), [])
+        new_file = os.path.join(os.path.dirname(path), 'new.nc')
+        with open(new_file, 'w') as f:
+            f.write("more data")
+        self.assertEqual(exp.refresh_index(), ['policy/no_clouds'])
+        self.assertEqual(exp.stat_file(new_file)[0], 9)
+
+    def test_index_moved(self):
+        index_file = os.path.join(self.root, 'exp.index.json')
+        self.exp.build_index().save(index_file)
+        with open(index_file) as f:
+            self.assertNotIn(self.root, f.read())
+
+        # The index follows the archive to its new location
+        new_root = self.root + '_moved'
+        shutil.move(self.root, new_root)
+        self.root = new_root
+        exp = make_exp(data_dir=new_root,
+                       file_index=os.path.join(new_root, 'exp.index.json'))
+        for case_kws, path in exp.walk_files('test'):
+            self.assertEqual(exp.stat_file(path)[0], 4)
+        # Re-scanning also uses the new location
+        self.assertEqual(len(exp.refresh_index(full=True)), 9)
+        self.assertEqual(exp.stat_file(path)[0], 4)
+
+
+class TestOpenMaster(unittest.TestCase):
+
+    def setUp(self):
+        self.exp = make_sample_exp()
+
+    def test_open_master(self):
+        master = self.exp.open_master("temp", chunks={'x': 2})
+        self.assertEqual(master['temp'].dims,
+                         ('param1', 'param2', 'param3', 'time', 'x', 'y'))
+        self.assertEqual(master['temp'].data.chunksize, (1, 1, 1, 10, 2, 5))
+        self.assertEqual(master['param1'].attrs['long_name'], "Parameter 1")
+
+        expected = self.exp.load("temp", master=True)
+        xr.testing.assert_identical(master['temp'].load(),
+                                    expected['temp'].load())
+
+    def test_open_master_lazy(self):
+        """ Case files aren't read until their data is computed. """
+        root = tempfile.mkdtemp()
+        try:
+            exp = make_sample_exp(data_dir=root)
+            for case_kws, path in exp.walk_files("temp"):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copy(path.replace(root, PATH_TO_SAMPLE), path)
+            master = exp.open_master("temp")
+
+            _, last_path = list(exp.walk_files("temp"))[-1]
+            os.remove(last_path)
+            master['temp'].sel(param1='a').load()
+            self.assertRaises(Exception, master['temp'].load)
+        finally:
+            shutil.rmtree(root)
+
+
+class TestZarr(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import zarr
+        except ImportError:
+            self.skipTest("zarr is not installed")
+
+        self.root = tempfile.mkdtemp()
+        self.exp = make_sample_exp(data_dir=self.root)
+        for case_kws, path in self.exp.walk_files("temp"):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy(path.replace(self.root, PATH_TO_SAMPLE), path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_zarr_roundtrip(self):
+        store = self.exp.to_zarr("temp")
+        self.assertEqual(store, os.path.join(self.root, "sample.temp.zarr"))
+
+        ds = self.exp.open_zarr("temp")
+        expected = self.exp.open_master("temp")
+        np.testing.assert_array_equal(ds['temp'].values,
+                                      expected['temp'].values)
+        self.assertEqual(ds['temp'].data.chunksize[:3], (1, 1, 1))
+        self.assertFalse(ds['source_mtime'].isnull().any())
+
+    def test_zarr_refresh(self):
+        # Changes are detected even when the file index is out of date
+        self.exp.build_index()
+        self.exp.to_zarr("temp")
+        self.assertEqual(
+            self.exp._refresh_zarr("temp", self.exp.zarr_store("temp")), []
+        )
+
+        # Overwrite one of the cases
+        case_kws = dict(param1='b', param2=2, param3='beta')
+        path = self.exp.get_file_fieldcases("temp", **case_kws)[0]
+        ds = xr.load_dataset(path)
+        ds['temp'] = ds['temp'] + 100.
+        ds.to_netcdf(path)
+        os.utime(path, (0, 1e9))
+
+        refreshed = self.exp._refresh_zarr("temp",
+                                           self.exp.zarr_store("temp"))
+        self.assertEqual(refreshed, [self.exp.case_tuple(**case_kws)])
+
+        ds_store = self.exp.open_zarr("temp")
+        np.testing.assert_array_equal(
+            ds_store['temp'].sel(**case_kws).values, ds['temp'].values
+        )
+        self.assertEqual(ds_store['source_mtime'].sel(**case_kws), 1e9)
+
+
+class TestLoadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.exp = make_sample_exp(data_dir=self.root)
+        for case_kws, path in self.exp.walk_files("temp"):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy(path.replace(self.root, PATH_TO_SAMPLE), path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_cached_load(self):
+        cache = self.exp.enable_cache(max_bytes=10**7)
+        data = self.exp.load("temp")
+        cached = self.exp.load("temp")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(list(cached), list(data))
+        for key in data:
+            xr.testing.assert_identical(cached[key], data[key])
+
+        # Modifying the returned data doesn't modify the cached entry
+        key = next(iter(cached))
+        cached[key]['extra'] = cached[key]['temp']*2
+        del cached[key]
+        cached = self.exp.load("temp")
+        self.assertIn(key, cached)
+        self.assertNotIn('extra', cached[key])
+
+        # Different arguments are cached separately
+        master = self.exp.load("temp", master=True)
+        xr.testing.assert_identical(self.exp.load("temp", master=True),
+                                    master)
+        self.exp.load("temp", preprocess=_add_case_id)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+        # Modifying a file invalidates the entries which read it
+        _, path = next(self.exp.walk_files("temp"))
+        os.utime(path, (0, 1e9))
+        self.exp.load("temp")
+        self.assertEqual(cache.misses, 4)
+
+        self.assertEqual(cache.invalidate("temp"), 4)
+        self.exp.disable_cache()
+        self.assertIsNot(self.exp.load("temp"), self.exp.load("temp"))
+
+    def test_cached_missing_case(self):
+        cache = self.exp.enable_cache()
+        _, path = next(self.exp.walk_files("temp"))
+        os.remove(path)
+
+        data = self.exp.load("temp")
+        self.assertTrue(data[next(iter(data))]['temp'].isnull().all())
+        self.exp.load("temp")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(cache), 1)
+
+
+def _scale(x, factor=1):
+    return x*factor
+
+
+class TestApplyToAll(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {('a', i): i for i in range(10)}
+        self.data['nested'] = {'x': 100, 'y': {'z': 1000, 'w': {}}}
+
+    def test_apply_to_all(self):
+        expected = {('a', i): 2*i for i in range(10)}
+        expected['nested'] = {'x': 200, 'y': {'z': 2000, 'w': {}}}
+
+        for executor in [None, 'threads', 'processes', 'dask']:
+            result = Experiment.apply_to_all(
+                self.data, _scale, dict(factor=2), executor=executor,
+                max_workers=2, max_pending=3
+            )
+            self.assertEqual(result, expected)
+            self.assertEqual(list(result.keys()), list(self.data.keys()))
+
+    def test_apply_scheduler(self):
+        """ The number of workers is only passed to dask's local
+        schedulers. """
+        import dask
+
+        def _scheduler(dsk, keys, **kwargs):
+            self.assertNotIn('num_workers', kwargs)
+            return dask.get(dsk, keys)
+
+        result = Experiment.apply_to_all(self.data, _scale, executor='dask',
+                                         scheduler=_scheduler, max_workers=2)
+        self.assertEqual(result[('a', 3)], 3)
+
+    def test_iter_apply(self):
+        results = Experiment.iter_apply(self.data, _scale,
+                                        executor='threads', max_pending=2)
+        key_path, result = next(results)
+        self.assertEqual((key_path, result), ((('a', 0), ), 0))
+        results.close()
+
+        key_paths = [key_path for key_path, _ in
+                     Experiment.iter_apply(self.data, _scale)]
+        self.assertEqual(key_paths[-3:], [('nested', 'x'),
+                                          ('nested', 'y', 'z'),
+                                          ('nested', 'y', 'w')])
+
+
+class TestIterLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.exp = make_sample_exp()
+
+    def test_iter_load(self):
+        expected = self.exp.load("temp")
+        for prefetch in [0, 3]:
+            results = list(self.exp.iter_load("temp", prefetch=prefetch))
+            self.assertEqual([key for key, _ in results],
+                             list(expected.keys()))
+            for key, ds in results:
+                # Data has already been read into memory
+                self.assertIsNone(ds['temp'].chunks)
+                xr.testing.assert_identical(ds, expected[key].load())
+
+    def test_iter_load_early_exit(self):
+        loads = []
+        def _record(ds, **case_kws):
+            loads.append(case_kws)
+            return ds
+
+        results = self.exp.iter_load("temp", prefetch=2, preprocess=_record)
+        for i, (key, ds) in enumerate(results):
+            if i == 1:
+                break
+        results.close()
+        # Only a bounded number of cases are loaded ahead
+        self.assertLessEqual(len(loads), 2 + 2)
+
+
+def _slow_case(ds, **case_kws):
+    if case_kws['param1'] == 'c':
+        time.sleep(0.5)
+    return ds
+
+
+_in_flight = dict(now=0, peak=0)
+_in_flight_lock = threading.Lock()
+
+
+def _slow_counted_case(ds, **case_kws):
+    with _in_flight_lock:
+        _in_flight['now'] += 1
+        _in_flight['peak'] = max(_in_flight['peak'], _in_flight['now'])
+    time.sleep(0.1)
+    with _in_flight_lock:
+        _in_flight['now'] -= 1
+    return ds
+
+
+class TestAsyncLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.exp = make_sample_exp()
+
+    def test_aload(self):
+        expected = self.exp.load("temp")
+        data = asyncio.run(self.exp.aload("temp", max_concurrency=4))
+        self.assertEqual(list(data.keys()), list(expected.keys()))
+        for key in data:
+            xr.testing.assert_identical(data[key], expected[key])
+
+        master = asyncio.run(self.exp.aload("temp", master=True))
+        xr.testing.assert_identical(
+            master, self.exp.load("temp", master=True)
+        )
+
+        case_kws = dict(param1='a', param2=1, param3='alpha')
+        ds = asyncio.run(self.exp.aload("temp", **case_kws))
+        xr.testing.assert_identical(ds, self.exp.load("temp", **case_kws))
+
+        # Partial selections can be assembled into a master, too
+        master = asyncio.run(self.exp.aload("temp", master=True, param1='b'))
+        self.assertIsInstance(master, xr.Dataset)
+        xr.testing.assert_identical(
+            master, self.exp.load("temp", master=True, param1='b')
+        )
+
+    def test_aload_processes(self):
+        temp = Var('temp', 'temp')
+        master = asyncio.run(self.exp.aload(temp, master=True,
+                                            executor='processes'))
+        self.assertTrue(temp._loaded)
+        self.assertEqual(len(temp._data), 18)
+        xr.testing.assert_identical(temp.master, master)
+
+    def test_aload_timeout(self):
+        data = asyncio.run(self.exp.aload(
+            "temp", preprocess=_slow_case, timeout=0.25, executor='threads'
+        ))
+        for key, ds in data.items():
+            if key.param1 == 'c':
+                self.assertTrue(ds['temp'].isnull().all())
+            else:
+                self.assertEqual(ds['temp'].shape, (10, 5, 5))
+
+    def test_aload_timeout_concurrency(self):
+        """ Timed-out loads still count towards the concurrency limit. """
+        _in_flight.update(now=0, peak=0)
+        data = asyncio.run(self.exp.aload(
+            "temp", preprocess=_slow_counted_case, timeout=0.01,
+            max_concurrency=2
+        ))
+        self.assertEqual(len(data), 18)
+        self.assertLessEqual(_in_flight['peak'], 2)
+
+    def test_awalk_files(self):
+        async def _walk():
+            return [item async for item in self.exp.awalk_files("temp")]
+        self.assertEqual(asyncio.run(_walk()),
+                         list(self.exp.walk_files("temp")))
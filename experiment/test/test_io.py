@@ -0,0 +1,277 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from experiment.io import (LazyFileArray, fix_cf_times, is_netcdf3,
+                           load_timeslice, load_variable, open_lazy,
+                           scan_header)
+from experiment.metadata import MetadataCache, get_metadata
+
+
+def _make_wide_dataset(n_vars=20):
+    """ Create a dataset resembling a CESM history file, with many fields
+    sharing the same coordinates. """
+    ds = xr.Dataset()
+    ds['time'] = ('time', np.arange(4.) + 0.5,
+                  {'units': 'days since 2000-01-01', 'bounds': 'time_bnds'})
+    ds['time_bnds'] = (('time', 'nbnd'),
+                       np.stack([np.arange(4.), np.arange(4.) + 1], axis=1))
+    ds['lat'] = ('lat', np.linspace(-90, 90, 3),
+                 {'actual_range': np.array([-90., 90.])})
+    ds['area'] = ('lat', np.ones(3))
+    ds['hyam'] = ('lev', np.arange(2.))
+    for i in range(n_vars):
+        ds['field_{}'.format(i)] = (('time', 'lat'), np.full((4, 3), float(i)))
+    ds['field_0'].attrs['coordinates'] = 'area'
+    return ds
+
+
+class TestLoadVariable(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'wide.nc')
+        _make_wide_dataset().to_netcdf(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_scan_header(self):
+        header = scan_header(self.path)
+        self.assertEqual(header['time_bnds'][0], ('time', 'nbnd'))
+        self.assertEqual(header['time'][1], {'bounds': 'time_bnds'})
+        self.assertEqual(len(header), 25)
+        self.assertEqual(scan_header(self.path), header)
+
+    def test_squeeze(self):
+        ds = load_variable('field_0', self.path, squeeze=True)
+        self.assertEqual(sorted(ds.variables),
+                         ['area', 'field_0', 'lat', 'time', 'time_bnds'])
+        np.testing.assert_array_equal(ds['field_0'], 0.)
+
+        ds = load_variable('field_3', self.path, squeeze=True,
+                           drop_variables=['time_bnds'])
+        self.assertEqual(sorted(ds.variables), ['field_3', 'lat', 'time'])
+
+        ds = load_variable('field_3', self.path)
+        self.assertEqual(len(ds.variables), 25)
+
+    def test_coords_from(self):
+        other = os.path.join(self.root, 'other.nc')
+        _make_wide_dataset(n_vars=2).to_netcdf(other)
+
+        # Float coordinates are written with a NaN _FillValue, and "lat" has
+        # an array-valued attribute; neither should prevent sharing
+        with mock.patch('experiment.io.xr.open_dataset',
+                        wraps=xr.open_dataset) as spy:
+            ds = load_variable('field_1', other, squeeze=True,
+                               coords_from=self.path)
+        dropped = spy.call_args[1]['drop_variables']
+        self.assertIn('lat', dropped)
+        self.assertNotIn('time', dropped)
+        expected = load_variable('field_1', other, squeeze=True)
+        xr.testing.assert_identical(ds, expected)
+        np.testing.assert_array_equal(ds['lat'].attrs['actual_range'],
+                                      [-90., 90.])
+
+        # Coordinates of the same size but with different values are never
+        # taken from the prototype
+        shifted = _make_wide_dataset(n_vars=2)
+        shifted['time'] = shifted['time'] + 31.
+        shifted['lat'] = shifted['lat']/2.
+        shifted.to_netcdf(other)
+        with mock.patch('experiment.io.xr.open_dataset',
+                        wraps=xr.open_dataset) as spy:
+            ds = load_variable('field_1', other, squeeze=True,
+                               fix_times=False, coords_from=self.path)
+        self.assertNotIn('lat', spy.call_args[1]['drop_variables'])
+        np.testing.assert_array_equal(ds['time'], np.arange(4.) + 31.5)
+        np.testing.assert_array_equal(ds['lat'], [-45., 0., 45.])
+        expected = load_variable('field_1', other, squeeze=True,
+                                 fix_times=False)
+        xr.testing.assert_identical(ds, expected)
+
+    def test_mmap(self):
+        path3 = os.path.join(self.root, 'wide3.nc')
+        _make_wide_dataset().to_netcdf(path3, format='NETCDF3_64BIT')
+        self.assertTrue(is_netcdf3(path3))
+        self.assertFalse(is_netcdf3(self.path))
+
+        ds = load_variable('field_2', path3, squeeze=True, mmap=True,
+                           fix_times=False)
+        data = ds['field_2'].values
+        self.assertIsNotNone(data.base)
+        self.assertFalse(data.flags.writeable)
+        expected = load_variable('field_2', path3, squeeze=True,
+                                 fix_times=False)
+        xr.testing.assert_identical(ds, expected)
+
+        # Decoding still works on top of the mapped variables
+        ds = load_variable('field_2', path3, squeeze=True, mmap=True,
+                           fix_times=True)
+        expected = load_variable('field_2', path3, squeeze=True,
+                                 fix_times=True)
+        xr.testing.assert_identical(ds, expected)
+
+        # Other formats fall back to the usual backend
+        ds = load_variable('field_2', self.path, squeeze=True, mmap=True)
+        np.testing.assert_array_equal(ds['field_2'], 2.)
+
+        # Options for decoding the file can't be applied to the mapping
+        with self.assertRaises(ValueError):
+            load_variable('field_2', path3, mmap=True, mask_and_scale=True)
+        ds = load_variable('field_2', path3, squeeze=True, mmap=True,
+                           chunks={'time': 2})
+        self.assertEqual(ds['field_2'].chunks, ((2, 2), (3, )))
+
+
+    def test_open_lazy(self):
+        arr = open_lazy(self.path, 'field_1', (4, 3), 'f8', engine='netcdf4',
+                        squeeze=True, chunks=(2, 3))
+        self.assertEqual(arr.chunks, ((2, 2), (3, )))
+        np.testing.assert_array_equal(arr.compute(), 1.)
+        # Only the keywords for opening the file are forwarded to xarray
+        lazy = next(v for v in arr.dask.values()
+                    if isinstance(v, LazyFileArray))
+        self.assertEqual(lazy.open_kws, dict(engine='netcdf4'))
+
+        # Files with different headers are read just the same
+        other = os.path.join(self.root, 'other.nc')
+        _make_wide_dataset(n_vars=2).drop_vars('area').to_netcdf(other)
+        ds = load_timeslice(['field_0', 'field_1'], [self.path, other],
+                            fix_times=False)
+        self.assertEqual(ds['field_1'].shape, (8, 3))
+        np.testing.assert_array_equal(ds['field_0'], 0.)
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'wide.nc')
+        _make_wide_dataset().to_netcdf(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_metadata(self):
+        cache = MetadataCache()
+        meta = cache.get(self.path)
+        self.assertEqual(meta.dims, dict(time=4, nbnd=2, lat=3, lev=2))
+        self.assertEqual(meta.variables['field_2']['shape'], (4, 3))
+        self.assertEqual(meta.variables['field_2']['dtype'], '<f8')
+        self.assertEqual(meta.variables['time']['attrs']['units'],
+                         'days since 2000-01-01')
+        np.testing.assert_array_equal(meta.coords['time'],
+                                      np.arange(4.) + 0.5)
+        self.assertNotIn('area', meta.coords)
+        self.assertEqual(list(meta.to_dataset().coords), ['time', 'lat'])
+        self.assertIs(cache.get(self.path), meta)
+
+        # Modified files are re-scanned
+        _make_wide_dataset(n_vars=2).to_netcdf(self.path)
+        os.utime(self.path, (0, 1e9))
+        self.assertEqual(len(cache.get(self.path).variables), 7)
+        cache.prune()
+        self.assertEqual(len(cache), 1)
+
+    def test_persist(self):
+        cache = MetadataCache()
+        meta = cache.get(self.path)
+        cache_path = os.path.join(self.root, 'metadata.json')
+        cache.save(cache_path)
+
+        new_cache = MetadataCache().load(cache_path)
+        self.assertEqual(len(new_cache), 1)
+        new_meta = new_cache.get(self.path)
+        self.assertEqual(new_meta.dims, meta.dims)
+        self.assertEqual(new_meta.variables['time']['attrs']['bounds'],
+                         'time_bnds')
+        np.testing.assert_array_equal(new_meta.coords['lat'],
+                                      meta.coords['lat'])
+        self.assertIsNot(new_meta, meta)
+        self.assertIs(new_cache.get(self.path), new_meta)
+
+        self.assertIs(get_metadata(self.path),
+                      get_metadata(self.path, coords=False))
+
+    def test_max_entries(self):
+        cache = MetadataCache(max_entries=2)
+        paths = [self.path]
+        for i in range(2):
+            paths.append(os.path.join(self.root, 'other{}.nc'.format(i)))
+            _make_wide_dataset(n_vars=1).to_netcdf(paths[-1])
+        meta = cache.get(paths[0])
+        cache.get(paths[1])
+        # Looking up the first file makes the second the least recently used
+        self.assertIs(cache.get(paths[0]), meta)
+        cache.get(paths[2])
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(paths[0]), meta)
+
+        cache.reserve(3)
+        cache.get(paths[1])
+        self.assertEqual(len(cache), 3)
+
+    def test_threads(self):
+        # Lookups and evictions from many threads at once never fail
+        cache = MetadataCache(max_entries=2)
+        paths = [self.path]
+        for i in range(4):
+            paths.append(os.path.join(self.root, 'other{}.nc'.format(i)))
+            _make_wide_dataset(n_vars=1).to_netcdf(paths[-1])
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            metas = list(pool.map(cache.get, paths*25))
+        self.assertEqual(len(metas), 125)
+        self.assertLessEqual(len(cache), 2)
+
+
+class TestFixTimes(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'cesm.nc')
+
+        # CESM-style output, with timestamps at the end of each interval and
+        # a reference year which can't be represented by a datetime64
+        ds = _make_wide_dataset(n_vars=2)
+        ds['time'] = ('time', np.arange(4.) + 1.,
+                      {'units': 'days since 0001-01-01 00:00:00',
+                       'calendar': 'noleap', 'bounds': 'time_bnds'})
+        ds['field_1'].attrs['scale_factor'] = 2.
+        ds.to_netcdf(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_fix_times(self):
+        ds = load_variable('field_1', self.path, squeeze=True,
+                           fix_times=True)
+        self.assertEqual(list(ds.indexes['time'].strftime('%Y-%m-%d %H:%M')),
+                         ['2001-01-0{} 12:00'.format(i) for i in range(1, 5)])
+        self.assertEqual(ds['time'].encoding['units'],
+                         'days since 2001-01-01 00:00:00')
+
+        # Decoding is lazy
+        self.assertFalse(ds['field_1'].variable._in_memory)
+        np.testing.assert_array_equal(ds['field_1'], 2.)
+
+        ds = load_variable('field_1', self.path)
+        np.testing.assert_array_equal(ds['time'], np.arange(4.) + 1.)
+        np.testing.assert_array_equal(ds['field_1'], 1.)
+
+    def test_dask(self):
+        ds = load_variable('field_1', self.path, fix_times=True,
+                           chunks={'time': 1})
+        self.assertEqual(ds['field_1'].chunks, ((1, 1, 1, 1), (3, )))
+        ds = fix_cf_times(xr.open_dataset(self.path, decode_cf=False,
+                                          chunks={'time': 2}),
+                          midpoints=False)
+        self.assertEqual(ds.indexes['time'][0].strftime('%Y-%m-%d'),
+                         '2001-01-02')
+        self.assertIsNotNone(ds['field_1'].chunks)
@@ -0,0 +1,124 @@
+import unittest
+
+import numpy as np
+
+from experiment.reduce import Histogram, Moments, merge_groups
+
+
+class TestMoments(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        # Large offset relative to the spread, to check the stability of the
+        # variance
+        self.data = 1e6 + rs.randn(20, 4, 3)
+        self.data[3, 0, 0] = np.nan
+
+    def test_update(self):
+        acc = Moments()
+        for values in self.data:
+            acc.update(values)
+        np.testing.assert_array_equal(acc.result('count'),
+                                      np.isfinite(self.data).sum(axis=0))
+        np.testing.assert_allclose(acc.result('mean'),
+                                   np.nanmean(self.data, axis=0))
+        np.testing.assert_allclose(acc.result('var', ddof=1),
+                                   np.nanvar(self.data, axis=0, ddof=1))
+        np.testing.assert_allclose(acc.result('std'),
+                                   np.nanstd(self.data, axis=0))
+        np.testing.assert_array_equal(acc.result('min'),
+                                      np.nanmin(self.data, axis=0))
+        np.testing.assert_array_equal(acc.result('max'),
+                                      np.nanmax(self.data, axis=0))
+
+        with self.assertRaises(ValueError):
+            acc.update(np.zeros(3))
+        with self.assertRaises(ValueError):
+            acc.result('median')
+
+    def test_merge(self):
+        full = Moments()
+        for values in self.data:
+            full.update(values)
+
+        parts = [dict(a=Moments()), dict(a=Moments(), b=Moments())]
+        for values in self.data[:7]:
+            parts[0]['a'].update(values)
+        for values in self.data[7:]:
+            parts[1]['a'].update(values)
+        merged = merge_groups(parts)
+        self.assertEqual(list(merged), ['a', 'b'])
+        for stat in ['count', 'mean', 'var', 'min', 'max']:
+            np.testing.assert_allclose(merged['a'].result(stat),
+                                       full.result(stat))
+
+    def test_empty(self):
+        acc = Moments().update(np.full(2, np.nan))
+        acc.update(np.array([1., np.nan]))
+        self.assertTrue(np.isnan(acc.result('mean')[1]))
+        self.assertTrue(np.isnan(acc.result('var', ddof=1)[0]))
+        self.assertEqual(acc.result('max')[0], 1.)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.data = rs.randn(2000, 3)
+        self.data[::2, 1] *= 2.
+        self.data[5, 2] = np.nan
+
+    def test_counts(self):
+        hist = Histogram(bins=10, range=(-2, 2))
+        for values in self.data:
+            hist.update(values)
+        for i in range(3):
+            col = self.data[:, i]
+            col = col[~np.isnan(col)]
+            expected, _ = np.histogram(col, bins=10, range=(-2, 2))
+            np.testing.assert_array_equal(hist.result('counts')[i], expected)
+            self.assertEqual(hist.result('underflow')[i], (col < -2).sum())
+            self.assertEqual(hist.result('overflow')[i], (col > 2).sum())
+            self.assertEqual(hist.result('count')[i], len(col))
+
+        with self.assertRaises(ValueError):
+            Histogram(bins=10)
+
+    def test_quantile(self):
+        hist = Histogram(bins=1000, range=(-8, 8))
+        for values in self.data:
+            hist.update(values)
+        q = [0., 0.05, 0.5, 0.95, 1.]
+        estimated = hist.quantile(q)
+        self.assertEqual(estimated.shape, (3, 5))
+        expected = np.nanquantile(self.data, q, axis=0).T
+        np.testing.assert_allclose(estimated, expected, atol=0.05)
+
+        with self.assertRaises(ValueError):
+            hist.quantile(1.5)
+
+    def test_count_dtype(self):
+        # Counts are stored compactly, and widened as values are added
+        hist = Histogram(bins=10, range=(-2, 2))
+        for values in self.data[:255]:
+            hist.update(values)
+        self.assertEqual(hist.counts.dtype, np.uint8)
+        hist.update(np.zeros(3))
+        self.assertEqual(hist.counts.dtype, np.uint16)
+        self.assertEqual(hist.result('counts')[0, 5], 1 + np.sum(
+            (self.data[:255, 0] >= 0) & (self.data[:255, 0] < 0.4)
+        ))
+        self.assertEqual(hist.result('count').dtype, np.int64)
+
+    def test_merge(self):
+        full = Histogram(bins=20, range=(-3, 3))
+        parts = [Histogram(bins=20, range=(-3, 3)) for _ in range(2)]
+        for i, values in enumerate(self.data):
+            full.update(values)
+            parts[i % 2].update(values)
+        merged = parts[0].merge(parts[1])
+        np.testing.assert_array_equal(merged.counts, full.counts)
+        self.assertEqual(merged.n, len(self.data))
+
+        with self.assertRaises(ValueError):
+            full.merge(Histogram(bins=10, range=(-3, 3)))